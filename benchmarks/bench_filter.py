@@ -0,0 +1,41 @@
+"""
+Compares the interpreted expression tree, on rows as dicts, against the predicate compiled for the rows of a row store
+table.
+
+Usage: PYTHONPATH=. python benchmarks/bench_filter.py [DATAPATH] [TABLE]
+"""
+import os
+import sys
+import timeit
+
+from query_parser.expression_parser import build_expression_from_tokens, compile_expression
+from query_parser.table import load_csv
+
+FILTERS = (
+    'sex = f',
+    'ageOFocc > 30 AND yearacc < 2000',
+    'airbag = none OR seatbelt = none OR dead = dead',
+    'NOT dvcat = "10-24" AND weight > 100 AND frontal = 1',
+)
+
+
+def main():
+    data_path = sys.argv[1] if len(sys.argv) > 1 else 'data'
+    name = sys.argv[2] if len(sys.argv) > 2 else 'airbag_data'
+    table = load_csv(name, os.path.join(data_path, f'{name}.csv'), columnar=False)
+    rows = table.rows
+    dict_rows = [table.schema.as_dict(row) for row in rows]
+
+    for text in FILTERS:
+        expression = build_expression_from_tokens(text.split())
+        predicate = compile_expression(expression, table.schema)
+
+        interpreted = min(timeit.repeat(lambda: [row for row in dict_rows if expression.apply(row)], number=1,
+                                        repeat=5))
+        compiled = min(timeit.repeat(lambda: [row for row in rows if predicate(row)], number=1, repeat=5))
+        print(f'{text:<60} interpreted {interpreted * 1000:8.2f}ms  compiled {compiled * 1000:8.2f}ms  '
+              f'speedup {interpreted / compiled:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
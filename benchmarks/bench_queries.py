@@ -0,0 +1,103 @@
+"""
+Times every class of query through QueryParser and Query.execute on generated airbag_data tables of several scales,
+along with the time each table takes to load, and reports the results as JSON. Tables missing from the data path are
+generated first.
+
+Usage: PYTHONPATH=. python benchmarks/bench_queries.py [DATAPATH] [--scales 1 10 100] [--repeat 5] [--row-store]
+                                                       [--query CLASS ...] [--output FILE]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from benchmarks.common import QUERIES, environment, write_report
+from benchmarks.generate import ensure_tables, DEFAULT_SCALES
+from query_parser.operators import configuration
+from query_parser.parser import QueryParser
+from query_parser.table_cache import table_cache
+
+
+def run(query_string: str) -> int:
+    """
+    Parses and runs every query of the request, returning the number of rows they produced
+    """
+    rows = 0
+    for query in QueryParser().parse(query_string):
+        for _ in query.execute():
+            rows += 1
+    return rows
+
+
+def time_query(query_string: str, repeat: int) -> dict:
+    runs = []
+    rows = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = run(query_string)
+        runs.append(time.perf_counter() - start)
+    return {
+        'query': query_string,
+        'rows': rows,
+        'min_seconds': min(runs),
+        'median_seconds': statistics.median(runs),
+        'runs': runs,
+    }
+
+
+def bench_table(data_path: str, name: str, classes, repeat: int) -> dict:
+    table_cache.invalidate(name)
+    start = time.perf_counter()
+    table = table_cache.get(data_path, name).table
+    load_seconds = time.perf_counter() - start
+
+    results = {}
+    for query_class in classes:
+        print(f'{name} {query_class}', file=sys.stderr)
+        results[query_class] = time_query(QUERIES[query_class].format(table=name), repeat)
+
+    return {
+        'table': name,
+        'rows': table.num_rows,
+        'table_bytes': table.nbytes,
+        'file_bytes': os.path.getsize(os.path.join(data_path, f'{name}.csv')),
+        'load_seconds': load_seconds,
+        'queries': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('data_path', nargs='?', default=os.path.join('benchmarks', 'data'))
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--row-store', action='store_true')
+    parser.add_argument('--query', action='append', choices=sorted(QUERIES),
+                        help='query classes to run, all by default')
+    parser.add_argument('--output', help='file to write the JSON report to, stdout by default')
+    args = parser.parse_args()
+
+    configuration['data_path'] = args.data_path
+    table_cache.columnar = not args.row_store
+    classes = args.query or list(QUERIES)
+
+    tables = []
+    for scale, name in zip(args.scales, ensure_tables(args.data_path, args.scales)):
+        result = bench_table(args.data_path, name, classes, args.repeat)
+        result['scale'] = scale
+        tables.append(result)
+        # Only one table is kept in memory at a time
+        table_cache.invalidate(name)
+
+    write_report({
+        'benchmark': 'queries',
+        'environment': environment(),
+        'layout': 'row store' if args.row_store else 'columnar',
+        'repeat': args.repeat,
+        'tables': tables,
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Pieces shared by the benchmarks: the query classes they run and their JSON reports.
+"""
+import json
+import platform
+import sys
+import time
+from typing import List
+
+# Representative queries, by class, over a table shaped like airbag_data
+QUERIES = {
+    'full_scan': 'SELECT * FROM {table};',
+    'selective_where': 'SELECT caseid, weight FROM {table} WHERE ageOFocc > 95 AND airbag = none;',
+    'multi_aggregate': 'SELECT AVG(weight), MIN(ageOFocc), MAX(weight), SUM(injSeverity), COUNT(caseid) FROM {table};',
+    'group_by': 'SELECT dvcat, COUNT(caseid), AVG(weight) FROM {table} GROUP BY dvcat;',
+    'distinct': 'SELECT DISTINCT dvcat FROM {table};',
+    'limit': 'SELECT * FROM {table} LIMIT 10;',
+}
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """
+    The nearest rank percentile of values sorted in ascending order
+    """
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-len(ordered) * fraction // 1))
+    return ordered[min(len(ordered), int(rank)) - 1]
+
+
+def latency_summary(latencies: List[float]) -> dict:
+    ordered = sorted(latencies)
+    return {
+        'count': len(ordered),
+        'mean_seconds': sum(ordered) / len(ordered) if ordered else 0.0,
+        'p50_seconds': percentile(ordered, 0.5),
+        'p90_seconds': percentile(ordered, 0.9),
+        'p99_seconds': percentile(ordered, 0.99),
+        'max_seconds': ordered[-1] if ordered else 0.0,
+    }
+
+
+def environment() -> dict:
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def write_report(report: dict, output: str = None):
+    """
+    Writes the report as JSON to the file, or to stdout
+    """
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if output is None:
+        print(text)
+        return
+    with open(output, 'w') as f:
+        f.write(text + '\n')
+    print(f'wrote {output}', file=sys.stderr)
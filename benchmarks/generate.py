@@ -0,0 +1,81 @@
+"""
+Generates tables shaped like airbag_data at several scales for the benchmarks, as airbag_data_<SCALE>x.csv.
+
+Every column draws its values at random from the same column of the source table, so the generated columns keep the
+types, value distributions, missing values and cardinalities of the source while rows are independent of each other.
+The unnamed first column keeps numbering the rows. Generation is seeded, the same scale always gives the same table.
+
+Usage: PYTHONPATH=. python benchmarks/generate.py [OUTPUT_PATH] [--source data/airbag_data.csv] [--scales 1 10 100]
+"""
+import argparse
+import csv
+import os
+import random
+from typing import List, Tuple
+
+DEFAULT_SOURCE = os.path.join('data', 'airbag_data.csv')
+DEFAULT_SCALES = (1, 10, 100)
+
+# Rows are generated and written this many at a time
+CHUNK_ROWS = 10000
+
+
+def table_name(scale: int) -> str:
+    return f'airbag_data_{scale}x'
+
+
+def read_columns(source: str) -> Tuple[List[str], List[List[str]]]:
+    with open(source, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        return header, [list(column) for column in zip(*reader)]
+
+
+def generate(source: str, output_path: str, scale: int, seed: int = 0) -> str:
+    """
+    Writes the table of the given scale, returning its file name
+    """
+    header, columns = read_columns(source)
+    num_rows = len(columns[0]) * scale
+    rng = random.Random(seed * 1000 + scale)
+
+    filename = os.path.join(output_path, f'{table_name(scale)}.csv')
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for start in range(0, num_rows, CHUNK_ROWS):
+            count = min(CHUNK_ROWS, num_rows - start)
+            values = [range(start + 1, start + count + 1) if not name else rng.choices(column, k=count)
+                      for name, column in zip(header, columns)]
+            writer.writerows(zip(*values))
+    return filename
+
+
+def ensure_tables(output_path: str, scales, source: str = DEFAULT_SOURCE) -> List[str]:
+    """
+    The names of the tables of every scale, generating the ones missing from the output path
+    """
+    os.makedirs(output_path, exist_ok=True)
+    names = []
+    for scale in scales:
+        if not os.path.exists(os.path.join(output_path, f'{table_name(scale)}.csv')):
+            generate(source, output_path, scale)
+        names.append(table_name(scale))
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('output_path', nargs='?', default=os.path.join('benchmarks', 'data'))
+    parser.add_argument('--source', default=DEFAULT_SOURCE)
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_path, exist_ok=True)
+    for scale in args.scales:
+        print(generate(args.source, args.output_path, scale, args.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Drives a running server with concurrent clients and reports throughput and latency percentiles as JSON.
+
+Every client is a thread sending requests one after the other, either over a single framed connection or over a new
+connection per request, cycling through the queries. Clients run for a fixed duration or a fixed number of requests.
+
+Usage: PYTHONPATH=. python benchmarks/load_generator.py PORT [--host localhost] [--clients 8] [--duration 10]
+                                                        [--requests N] [--table airbag_data] [--query CLASS ...]
+                                                        [--binary] [--connection-per-request] [--output FILE]
+"""
+import argparse
+import socket
+import threading
+import time
+from typing import List
+
+from benchmarks.common import QUERIES, environment, write_report, latency_summary
+from socket_server.protocol import FramedClient
+
+# Queries sent when none are given, full scans would measure the network more than the server
+DEFAULT_CLASSES = ('selective_where', 'multi_aggregate', 'group_by', 'distinct', 'limit')
+
+
+def send_request(host: str, port: int, request: str):
+    """
+    Sends a single request over its own connection and reads the whole result
+    """
+    with socket.create_connection((host, port)) as sock:
+        sock.sendall(request.encode('ascii'))
+        while sock.recv(65536):
+            pass
+
+
+class LoadClient(threading.Thread):
+    """
+    Sends requests until its deadline or request count is reached, recording the latency of each of them
+    """
+
+    def __init__(self, args, requests: List[str], offset: int) -> None:
+        super().__init__(daemon=True)
+        self.args = args
+        self.requests = requests
+        self.offset = offset
+        # (request index, seconds) of every completed request
+        self.latencies = []
+        self.errors = 0
+
+    def run(self):
+        args = self.args
+        client = None
+        if not args.connection_per_request:
+            client = FramedClient(args.host, args.port, binary=args.binary)
+
+        deadline = time.perf_counter() + args.duration
+        sent = 0
+        try:
+            while (sent < args.requests) if args.requests else (time.perf_counter() < deadline):
+                index = (self.offset + sent) % len(self.requests)
+                start = time.perf_counter()
+                try:
+                    if client is None:
+                        send_request(args.host, args.port, self.requests[index])
+                    else:
+                        client.query(self.requests[index])
+                except ValueError:
+                    self.errors += 1
+                self.latencies.append((index, time.perf_counter() - start))
+                sent += 1
+        finally:
+            if client is not None:
+                client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('port', type=int)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds to run for')
+    parser.add_argument('--requests', type=int, default=0, help='requests per client, instead of a duration')
+    parser.add_argument('--table', default='airbag_data')
+    parser.add_argument('--query', action='append', choices=sorted(QUERIES), help='query classes to send')
+    parser.add_argument('--binary', action='store_true', help='use the binary framed protocol')
+    parser.add_argument('--connection-per-request', action='store_true',
+                        help='open a new connection for every request instead of keeping one per client')
+    parser.add_argument('--output', help='file to write the JSON report to, stdout by default')
+    args = parser.parse_args()
+
+    classes = args.query or list(DEFAULT_CLASSES)
+    requests = [QUERIES[query_class].format(table=args.table) for query_class in classes]
+    clients = [LoadClient(args, requests, offset) for offset in range(args.clients)]
+
+    start = time.perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for client in clients for latency in client.latencies]
+    completed = len(latencies)
+    write_report({
+        'benchmark': 'load',
+        'environment': environment(),
+        'clients': args.clients,
+        'protocol': 'single' if args.connection_per_request else 'binary' if args.binary else 'framed',
+        'table': args.table,
+        'elapsed_seconds': elapsed,
+        'requests': completed,
+        'errors': sum(client.errors for client in clients),
+        'requests_per_second': completed / elapsed if elapsed else 0.0,
+        'latency': latency_summary([seconds for _, seconds in latencies]),
+        'queries': {query_class: latency_summary([seconds for index, seconds in latencies if index == i])
+                    for i, query_class in enumerate(classes)},
+    }, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,26 +1,251 @@
 import re
-from typing import List
+from itertools import islice
+from operator import itemgetter
 
+from query_parser.sketches import HyperLogLog, KllSketch
+from query_parser.table import TableScan, BATCH_SIZE, RowTable
 
-class Aggregator(object):
-    def __init__(self, column: str) -> None:
+
+class Chunk(object):
+    """
+    A slice of the rows of a dataset which is fed to the output fields at once during an aggregation pass
+    """
+    # The table the rows belong to, when they are rows of a table
+    table = None
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def column_values(self, column: str) -> list:
+        raise NotImplementedError
+
+    def is_numeric(self, column: str) -> bool:
+        return False
+
+    def rows(self):
+        raise NotImplementedError
+
+    def numbers(self, column: str, values: list) -> list:
+        """
+        The numeric values of a column, skipping the missing values and the ones that are not numbers
+        """
+        # Typed numeric columns need no conversion, only their missing values are skipped
+        if self.is_numeric(column):
+            return [value for value in values if value is not None] if None in values else values
+        return list(_to_floats(values))
+
+
+class ScanChunk(Chunk):
+    def __init__(self, table, row_ids) -> None:
+        super().__init__()
+        self.table = table
+        self.row_ids = row_ids
+
+    def __len__(self) -> int:
+        return len(self.row_ids)
+
+    def column_values(self, column: str) -> list:
+        return list(self.table.values(column, self.row_ids))
+
+    def is_numeric(self, column: str) -> bool:
+        return self.table.column_type(column) in (int, float)
+
+    def rows(self):
+        return map(self.table.row, self.row_ids)
+
+
+class RowChunk(Chunk):
+    def __init__(self, rows: list) -> None:
+        super().__init__()
+        self._rows = rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def column_values(self, column: str) -> list:
+        return [row[column] for row in self._rows]
+
+    def rows(self):
+        return self._rows
+
+
+def chunks(dataset, chunk_size: int = BATCH_SIZE):
+    if isinstance(dataset, TableScan):
+        return (ScanChunk(dataset.table, row_ids) for row_ids in dataset.row_id_batches(chunk_size))
+    rows = iter(dataset)
+    return map(RowChunk, iter(lambda: list(islice(rows, chunk_size)), []))
+
+
+def _as_float(value):
+    # Aggregates are computed over the values as numbers, whatever the type of their column
+    return None if value is None else float(value)
+
+
+def _to_floats(values):
+    for value in values:
+        try:
+            yield float(value)
+        except (ValueError, TypeError):
+            continue
+
+
+def aggregate(fields: list, dataset) -> list:
+    """
+    Computes every output field in a single streaming pass over the dataset. Each field keeps its own state, which is
+    created by init, advanced a chunk of rows at a time by update and turned into the output value by finalize.
+    Column values are read, and converted to numbers, once per chunk no matter how many fields use them.
+    """
+    return [field.finalize(state) for field, state in zip(fields, aggregate_states(fields, dataset))]
+
+
+def aggregate_states(fields: list, dataset, states: list = None) -> list:
+    """
+    The states of the fields after a pass over the dataset, before they are finalized. States of different parts of a
+    dataset are combined with merge, or the pass continues from the given states of the earlier parts.
+    """
+    # Counting rows needs no column values at all when the size of the dataset is already known
+    if isinstance(dataset, TableScan) and all(field.counts_rows for field in fields):
+        count = dataset.known_count()
+        if count is not None:
+            for field in fields:
+                dataset.column_type(field.column)
+            if states is None:
+                return [count for _ in fields]
+            return [field.merge(state, count) for field, state in zip(fields, states)]
+
+    if states is None:
+        states = [field.init() for field in fields]
+
+    for chunk in chunks(dataset):
+        values_by_column = {}
+        numbers_by_column = {}
+
+        for index, field in enumerate(fields):
+            column = field.column
+            values = values_by_column.get(column)
+            if values is None:
+                values = values_by_column[column] = field.chunk_values(chunk)
+
+            numbers = None
+            if field.is_numeric:
+                numbers = numbers_by_column.get(column)
+                if numbers is None:
+                    numbers = numbers_by_column[column] = chunk.numbers(column, values)
+
+            states[index] = field.update(states[index], values, numbers)
+
+    return states
+
+
+def group_aggregate(key_columns: list, fields: list, dataset, max_groups: int = None) -> list:
+    """
+    Single pass hash aggregation. Rows are grouped by the values of the key columns and every group keeps its own state
+    for each of the fields. Streaming fields are not accumulated, since they are the key columns themselves.
+    Returns (key, finalized values) pairs in the order the groups were first seen.
+    """
+    return finalize_groups(fields, group_states(key_columns, fields, dataset, max_groups))
+
+
+def finalize_groups(fields: list, groups: dict) -> list:
+    return [(key, [None if field.is_streaming else field.finalize(state) for field, state in zip(fields, states)])
+            for key, states in groups.items()]
+
+
+def merge_groups(fields: list, groups: dict, other: dict, max_groups: int = None) -> dict:
+    """
+    Adds the group states of another part of the dataset to the groups, keeping the order groups were first seen in
+    """
+    for key, other_states in other.items():
+        states = groups.get(key)
+        if states is None:
+            if max_groups is not None and len(groups) >= max_groups:
+                raise ValueError(f'GROUP BY exceeded the limit of {max_groups} groups')
+            groups[key] = other_states
+        else:
+            groups[key] = [None if field.is_streaming else field.merge(state, other_state)
+                           for field, state, other_state in zip(fields, states, other_states)]
+    return groups
+
+
+def group_states(key_columns: list, fields: list, dataset, max_groups: int = None, groups: dict = None) -> dict:
+    """
+    The states of every group, keyed by the values of the key columns, before they are finalized. The pass continues
+    from the given groups of the earlier parts of the dataset.
+    """
+    if groups is None:
+        groups = {}
+
+    for chunk in chunks(dataset):
+        keys = zip(*[chunk.column_values(column) for column in key_columns])
+        positions_by_key = {}
+        for position, key in enumerate(keys):
+            positions = positions_by_key.get(key)
+            if positions is None:
+                positions = positions_by_key[key] = []
+            positions.append(position)
+
+        values_by_column = {}
+        for key, positions in positions_by_key.items():
+            states = groups.get(key)
+            if states is None:
+                if max_groups is not None and len(groups) >= max_groups:
+                    raise ValueError(f'GROUP BY exceeded the limit of {max_groups} groups')
+                states = groups[key] = [None if field.is_streaming else field.init() for field in fields]
+
+            for index, field in enumerate(fields):
+                if field.is_streaming:
+                    continue
+
+                column_values = values_by_column.get(field.column)
+                if column_values is None:
+                    column_values = values_by_column[field.column] = field.chunk_values(chunk)
+
+                values = [column_values[position] for position in positions]
+                numbers = chunk.numbers(field.column, values) if field.is_numeric else None
+                states[index] = field.update(states[index], values, numbers)
+
+    return groups
+
+
+class OutputField(object):
+    """
+    Anything listed after SELECT. Streaming fields produce one output value per row with extract, the rest consume the
+    whole dataset through init, update and finalize.
+    """
+    is_streaming = False
+    # Whether update needs the numeric values of the column
+    is_numeric = False
+    # Whether the field only depends on the number of rows
+    counts_rows = False
+
+    def __init__(self, column: str = None) -> None:
         super().__init__()
         self.column = column
 
-    def apply(self, dataset):
+    def chunk_values(self, chunk: Chunk) -> list:
+        return chunk.column_values(self.column)
+
+    def init(self):
         raise NotImplementedError
 
-    def _apply_function_on_data(self, dataset, func):
-        if not dataset:
-            return None
+    def update(self, state, values: list, numbers: list):
+        raise NotImplementedError
+
+    def merge(self, state, other):
+        """
+        Combines the states of two parts of a dataset, the state of the earlier part comes first
+        """
+        raise NotImplementedError
 
-        value = float(dataset[0][self.column])
-        for obj in dataset[1:]:
-            try:
-                value = func(value, float(obj[self.column]))
-            except ValueError:
-                continue
-        return value
+    def finalize(self, state):
+        return state
+
+    def apply(self, dataset):
+        return aggregate([self], dataset)[0]
+
+
+class Aggregator(OutputField):
+    is_numeric = True
 
     @staticmethod
     def from_string(entity: str) -> 'Aggregator':
@@ -44,65 +269,224 @@ class Aggregator(object):
         if match:
             return Sum(match.group('x'))
 
+        match = re.match(r'APPROX_COUNT_DISTINCT\((?P<x>.*)\)', entity)
+        if match:
+            return ApproxCountDistinct(match.group('x'))
+
+        match = re.match(r'APPROX_PERCENTILE\((?P<x>[^,]*),\s*(?P<p>.*)\)', entity)
+        if match:
+            return ApproxPercentile(match.group('x').strip(), match.group('p'))
+
 
 class Average(Aggregator):
-    def apply(self, dataset: List[dict]):
-        summation = Sum(self.column)
-        _sum = summation.apply(dataset)
-        return _sum // len(dataset)
+    """
+    The floored mean of the numeric values, over the number of rows
+    """
+
+    def init(self):
+        return None, 0
+
+    def update(self, state, values: list, numbers: list):
+        total, rows = state
+        if numbers:
+            total = sum(numbers, total) if total is not None else sum(numbers)
+        return total, rows + len(values)
+
+    def merge(self, state, other):
+        total, rows = state
+        other_total, other_rows = other
+        if total is None or other_total is None:
+            total = other_total if total is None else total
+        else:
+            total += other_total
+        return total, rows + other_rows
+
+    def finalize(self, state):
+        total, rows = state
+        if total is None:
+            return None
+        return float(total) // rows
 
 
 class Count(Aggregator):
-    def apply(self, dataset):
-        return len(dataset)
+    is_numeric = False
+    counts_rows = True
+
+    def init(self):
+        return 0
+
+    def update(self, state, values: list, numbers: list):
+        return state + len(values)
+
+    def merge(self, state, other):
+        return state + other
 
 
 class Sum(Aggregator):
-    def apply(self, dataset):
-        return self._apply_function_on_data(dataset, lambda x, y: x + y)
+    def init(self):
+        return None
 
+    def update(self, state, values: list, numbers: list):
+        if not numbers:
+            return state
+        return sum(numbers, state) if state is not None else sum(numbers)
 
-class Min(Aggregator):
-    def apply(self, dataset):
-        return self._apply_function_on_data(dataset, min)
+    def merge(self, state, other):
+        if state is None or other is None:
+            return other if state is None else state
+        return state + other
 
+    def finalize(self, state):
+        return _as_float(state)
 
-class Max(Aggregator):
-    def apply(self, dataset):
-        return self._apply_function_on_data(dataset, max)
 
+class _Extremum(Aggregator):
+    func = None
 
-class Distinct(object):
-    def __init__(self, column: str) -> None:
-        super().__init__()
-        self.column = column
+    def init(self):
+        return None
 
-    def apply(self, dataset):
-        return set([obj[self.column] for obj in dataset])
+    def update(self, state, values: list, numbers: list):
+        if not numbers:
+            return state
+        value = self.func(numbers)
+        return value if state is None else self.func(state, value)
 
+    def merge(self, state, other):
+        if state is None or other is None:
+            return other if state is None else state
+        return self.func(state, other)
 
-class Extractor(object):
-    def __init__(self, column: str) -> None:
-        super().__init__()
-        self.column = column
+    def finalize(self, state):
+        return _as_float(state)
 
-    def apply(self, dataset):
-        return [obj[self.column] for obj in dataset]
 
+class Min(_Extremum):
+    func = min
 
-class MultiExtractor(object):
-    def apply(self, dataset):
-        return [', '.join(obj.values()) for obj in dataset]
+
+class Max(_Extremum):
+    func = max
+
+
+class ApproxCountDistinct(Aggregator):
+    """
+    The estimated number of distinct values, counted in a HyperLogLog of fixed size
+    """
+    is_numeric = False
+
+    def init(self):
+        return HyperLogLog()
+
+    def update(self, state, values: list, numbers: list):
+        state.update(values)
+        return state
+
+    def merge(self, state, other):
+        return state.merge(other)
+
+    def finalize(self, state):
+        return state.estimate()
+
+
+class ApproxPercentile(Aggregator):
+    """
+    The estimated value below which the given fraction of the numeric values fall, from a KLL sketch
+    """
+
+    def __init__(self, column: str, fraction: str) -> None:
+        super().__init__(column)
+        try:
+            self.fraction = float(fraction)
+        except ValueError:
+            raise ValueError(f'non numeric percentile {fraction}')
+        if not 0 <= self.fraction <= 1:
+            raise ValueError(f'percentile {fraction} is not between 0 and 1')
+
+    def init(self):
+        return KllSketch()
+
+    def update(self, state, values: list, numbers: list):
+        state.update(numbers)
+        return state
+
+    def merge(self, state, other):
+        return state.merge(other)
+
+    def finalize(self, state):
+        return _as_float(state.quantile(self.fraction))
+
+
+class Distinct(OutputField):
+    """
+    The distinct values of a column, in the order they were first seen
+    """
+
+    def init(self):
+        return {}
+
+    def update(self, state, values: list, numbers: list):
+        state.update(dict.fromkeys(values))
+        return state
+
+    def merge(self, state, other):
+        state.update(other)
+        return state
+
+
+class Extractor(OutputField):
+    is_streaming = True
+
+    def extract(self, obj):
+        return obj[self.column]
+
+    def getter(self, table=None):
+        """
+        The function extracting the field from the rows of the table, by position for the tuples of the row store
+        """
+        if isinstance(table, RowTable):
+            return itemgetter(table.position(self.column))
+        return self.extract
+
+    def init(self):
+        return []
+
+    def update(self, state, values: list, numbers: list):
+        state.extend(values)
+        return state
+
+    def merge(self, state, other):
+        state.extend(other)
+        return state
+
+
+class MultiExtractor(Extractor):
+    def __init__(self) -> None:
+        super().__init__(None)
+
+    def extract(self, obj):
+        return tuple(obj.values())
+
+    def getter(self, table=None):
+        # Rows of the row store already hold every column in order
+        return tuple if isinstance(table, RowTable) else self.extract
+
+    def chunk_values(self, chunk: Chunk) -> list:
+        return list(map(self.getter(chunk.table), chunk.rows()))
+
+
+AGGREGATES = ('AVG', 'MIN', 'MAX', 'SUM', 'COUNT', 'APPROX_COUNT_DISTINCT', 'APPROX_PERCENTILE')
+
+# Function calls, whose arguments may hold commas and spaces, or else anything up to a comma or space
+ENTITY_PATTERN = re.compile(r'\w+\([^)]*\)|[^\s,]+')
 
 
 def is_aggregate(entity: str):
-    return any(entity.startswith(f'{k}(') for k in ('AVG', 'MIN', 'MAX', 'SUM', 'COUNT')) and entity.endswith(')')
+    return any(entity.startswith(f'{k}(') for k in AGGREGATES) and entity.endswith(')')
 
 
 def parse_select_statement(tokens):
-    entities = []
-    for token in tokens:
-        entities.extend(token.split(','))
+    entities = ENTITY_PATTERN.findall(' '.join(tokens))
 
     output_fields = []
     entities_iter = iter(entities)
@@ -0,0 +1,169 @@
+"""
+A binary columnar copy of a csv file, kept next to it as <table>.col so that a table is parsed from text only once.
+
+The file starts with a magic line and the length of a json header describing the source file it was converted from and
+where the data of every column lies. Numeric columns are stored as their fixed width arrays and string columns as
+their dictionary codes followed by the json encoded dictionary, null masks and the integers masks of float columns
+are stored as one byte per row. Every section starts on an 8 byte boundary.
+
+Loading maps the file in memory and hands out memoryviews over it, columns are not copied and their pages are only
+read from disk when a query touches them. A file converted from another version of the csv is stale and is rewritten.
+"""
+import array
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from typing import Optional
+
+from query_parser.table import ColumnTable, NumericColumn, StringColumn, Column, load_csv, typecode
+
+MAGIC = b'SQLCOL2\n'
+EXTENSION = '.col'
+
+_LENGTH = struct.Struct('<Q')
+_ALIGNMENT = 8
+
+
+def columnar_filename(filename: str) -> str:
+    return os.path.splitext(filename)[0] + EXTENSION
+
+
+def _padding(offset: int, fill: bytes = b'\x00') -> bytes:
+    return fill * (-offset % _ALIGNMENT)
+
+
+def _column_sections(column: Column):
+    """
+    The description of a column in the header, along with the bytes of each of its sections in file order
+    """
+    description = {'name': column.name}
+    sections = [('data', column.raw)]
+    if column.nulls:
+        sections.append(('nulls', column.nulls))
+    if isinstance(column, NumericColumn) and column.integers:
+        sections.append(('integers', column.integers))
+    if isinstance(column, StringColumn):
+        description['type'] = 'str'
+        sections.append(('dictionary', json.dumps(column.dictionary).encode('utf-8')))
+    else:
+        description['type'] = column.value_type.__name__
+    description['typecode'] = typecode(column.raw)
+    description['itemsize'] = column.raw.itemsize
+    return description, [(key, bytes(section)) for key, section in sections]
+
+
+def write_columnar_file(table: ColumnTable, filename: str, stat: os.stat_result):
+    """
+    Writes the table converted from the csv file with the given stat. The file is written under a temporary name and
+    renamed into place, so readers, including ones which still map a previous version, never see a partial file.
+    """
+    columns = []
+    sections = []
+    offset = 0
+    for column in table.columns:
+        description, column_sections = _column_sections(column)
+        for key, section in column_sections:
+            description[key] = [offset, len(section)]
+            section += _padding(len(section))
+            sections.append(section)
+            offset += len(section)
+        columns.append(description)
+
+    header = json.dumps({
+        'source_mtime_ns': stat.st_mtime_ns,
+        'source_size': stat.st_size,
+        'byteorder': sys.byteorder,
+        'rows': table.num_rows,
+        'columns': columns,
+    }).encode('utf-8')
+    # Padded with whitespace, which json ignores
+    header += _padding(len(MAGIC) + _LENGTH.size + len(header), b' ')
+
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(filename) or '.', suffix=EXTENSION)
+    try:
+        os.chmod(temporary, stat.st_mode & 0o666)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(_LENGTH.pack(len(header)))
+            f.write(header)
+            for section in sections:
+                f.write(section)
+        os.replace(temporary, filename)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def _is_current(header: dict, stat: os.stat_result) -> bool:
+    if (header.get('source_mtime_ns'), header.get('source_size')) != (stat.st_mtime_ns, stat.st_size):
+        return False
+    if header.get('byteorder') != sys.byteorder:
+        return False
+    return all(array.array(column['typecode']).itemsize == column['itemsize'] for column in header['columns'])
+
+
+def _read_column(view: memoryview, start: int, description: dict) -> Column:
+    def section(key: str):
+        offset, length = description[key]
+        return view[start + offset:start + offset + length]
+
+    data = section('data').cast(description['typecode'])
+    nulls = section('nulls') if 'nulls' in description else None
+    if description['type'] == 'str':
+        return StringColumn(description['name'], data, json.loads(section('dictionary').tobytes()), nulls)
+    integers = section('integers') if 'integers' in description else None
+    return NumericColumn(description['name'], data, nulls, integers)
+
+
+def read_columnar_file(name: str, filename: str, stat: os.stat_result) -> Optional[ColumnTable]:
+    """
+    Maps the columnar file of a table, None if there is no file or if it was converted from another version of the
+    csv file with the given stat
+    """
+    try:
+        with open(filename, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    view = memoryview(mapped)
+    try:
+        if view[:len(MAGIC)] != MAGIC:
+            return None
+        header_start = len(MAGIC) + _LENGTH.size
+        header_length, = _LENGTH.unpack(view[len(MAGIC):header_start])
+        header = json.loads(view[header_start:header_start + header_length].tobytes())
+        if not _is_current(header, stat):
+            return None
+        columns = [_read_column(view, header_start + header_length, description)
+                   for description in header['columns']]
+    except (ValueError, KeyError, TypeError, struct.error):
+        logging.warning(f'ignoring corrupt columnar file {filename}')
+        return None
+    return ColumnTable(name, columns)
+
+
+def load_columnar(name: str, filename: str, stat: os.stat_result) -> ColumnTable:
+    """
+    Loads a columnar table from the columnar copy of its csv file, converting the csv file first when the copy is
+    missing or stale. The table is still loaded when the copy cannot be written, from the csv file.
+    """
+    sidecar = columnar_filename(filename)
+    table = read_columnar_file(name, sidecar, stat)
+    if table is not None:
+        return table
+
+    logging.info(f'converting {filename} to {sidecar}')
+    table = load_csv(name, filename, size=stat.st_size)
+    try:
+        write_columnar_file(table, sidecar, stat)
+    except OSError as e:
+        logging.warning(f'could not write columnar file {sidecar}: {e}')
+        return table
+
+    # The table is served from the mapped file, freeing the arrays parsed from the csv
+    return read_columnar_file(name, sidecar, stat) or table
@@ -0,0 +1,207 @@
+"""
+EXPLAIN and EXPLAIN ANALYZE, to see how the queries of a request run.
+
+`EXPLAIN SELECT ...;` returns a row for every operator of every query, in the order they run, with how each of them
+runs against its table: the indexes or filter used by WHERE, the sort used by ORDER BY, and the ranges of rows a query
+is split into when it runs in scan processes. `EXPLAIN ANALYZE SELECT ...;` runs the queries, discarding their output,
+and adds what every operator did:
+
+- time: wall time spent in the operator itself
+- rows_in, rows_out: the rows the operator was given and the rows it produced, scans report the rows they select
+- bytes_read: the bytes of table columns read for the rows going in, estimated from the width of the columns
+- peak_memory: the most memory allocated while the operator and the ones feeding it ran
+
+Tracing memory slows queries down many times over, so every analyzed query runs twice: once to measure time and rows,
+and once more with tracemalloc tracing memory, which slows down every query running meanwhile. Analyzed queries always
+run serially.
+"""
+import re
+import time
+import tracemalloc
+from typing import List
+
+from query_parser.operators import Operator, configuration
+from query_parser.parallel import parallel_scan
+from query_parser.plan_cache import plan_cache, normalize
+from query_parser.query import Query
+from query_parser.table import Table, ColumnTable, TableScan
+from query_parser.table_cache import table_cache
+
+EXPLAIN_PATTERN = re.compile(r'^\s*EXPLAIN\s+(ANALYZE\s+)?(.+)$', re.DOTALL)
+
+# The memory in use is read every time an operator has produced this many rows
+MEMORY_SAMPLE_ROWS = 1024
+
+
+def match_explain(request: str):
+    """
+    Whether an EXPLAIN request analyzes its queries, along with the queries, or None for any other request
+    """
+    match = EXPLAIN_PATTERN.match(request)
+    return (bool(match.group(1)), normalize(match.group(2))) if match else None
+
+
+def row_width(table: Table, columns: List[str]) -> float:
+    """
+    The estimated number of bytes a row of the table holds in the columns
+    """
+    if not table.num_rows or not columns:
+        return 0.0
+    if isinstance(table, ColumnTable):
+        # Dictionary encoded columns are read through their codes
+        return sum(table.column(column).raw.itemsize + (1 if table.column(column).nulls else 0)
+                   for column in columns if column in table.column_names)
+    return table.nbytes * len(columns) / (len(table.column_names) * table.num_rows)
+
+
+def _read_peak_memory() -> int:
+    _, peak = tracemalloc.get_traced_memory()
+    # Before Python 3.9 the peak can not be reset, and is the peak since tracing started
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    return peak
+
+
+class OperatorProfile(object):
+    """
+    What a single operator did while its query was analyzed. Operators start out by applying themselves to the output
+    of the previous one, and then produce rows when they are pulled, pulling rows from the previous operator in turn.
+    Pulling times and memory include the operators feeding this one.
+    """
+
+    def __init__(self, operator: Operator, baseline: int = None) -> None:
+        super().__init__()
+        self.operator = operator
+        self.apply_seconds = 0.0
+        self.pull_seconds = 0.0
+        self.rows = 0
+        self.peak_memory = 0
+        # The memory in use when the query started, None when memory is not traced
+        self._baseline = baseline
+
+    def run(self, stage, data):
+        start = time.perf_counter()
+        output = stage(data)
+        self.apply_seconds += time.perf_counter() - start
+        self._read_memory()
+
+        if isinstance(output, TableScan):
+            # Scans which know their rows up front are left alone, so that later operators still take their fast paths
+            count = output.known_count()
+            if count is not None:
+                self.rows = count
+                return output
+            return TableScan(output.table, lambda: self._observe(output.row_ids()))
+        return self._observe(iter(output))
+
+    def _observe(self, iterator):
+        clock = time.perf_counter
+        while True:
+            start = clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.pull_seconds += clock() - start
+                self._read_memory()
+                return
+            self.pull_seconds += clock() - start
+
+            self.rows += 1
+            if not self.rows % MEMORY_SAMPLE_ROWS:
+                self._read_memory()
+            yield item
+
+    def _read_memory(self):
+        if self._baseline is None:
+            return
+        self.peak_memory = max(self.peak_memory, _read_peak_memory() - self._baseline)
+
+    def own_seconds(self, previous: 'OperatorProfile') -> float:
+        """
+        The time spent in this operator, leaving out the time spent producing the rows of the previous operator
+        """
+        seconds = self.apply_seconds + self.pull_seconds
+        return max(0.0, seconds - previous.pull_seconds) if previous else seconds
+
+
+def _parallel_plan(query: Query, table: Table):
+    partitions = parallel_scan.partitions(query, table)
+    if partitions is None:
+        return None
+    return 'PARALLEL', f'{len(partitions)} scan processes, ranges of {len(partitions[0])} rows'
+
+
+def explain_query(query: Query) -> List[tuple]:
+    table = table_cache.get(configuration['data_path'], query.tables[0]).table
+    rows = [('QUERY', query.text)]
+    parallel = _parallel_plan(query, table)
+    if parallel:
+        rows.append(parallel)
+    return rows + query.describe(table)
+
+
+def _profile_query(query: Query, baseline: int = None):
+    """
+    Runs the query, returning the profile of every operator, the number of output rows and the time it took
+    """
+    profiles = []
+
+    def run_stage(operator, stage, data):
+        profile = OperatorProfile(operator, baseline)
+        profiles.append(profile)
+        return profile.run(stage, data)
+
+    start = time.perf_counter()
+    output_rows = sum(1 for _ in query.execute_rows(run_stage))
+    return profiles, output_rows, time.perf_counter() - start
+
+
+def _trace_memory(query: Query) -> List[int]:
+    """
+    The peak memory of every operator of the query, from a run tracing every allocation
+    """
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        _read_peak_memory()
+        profiles, _, _ = _profile_query(query, baseline)
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    return [profile.peak_memory for profile in profiles]
+
+
+def analyze_query(query: Query) -> List[tuple]:
+    # Loading the table is never part of the analysis, tracing memory while loading would take many times longer
+    table = table_cache.get(configuration['data_path'], query.tables[0]).table
+    profiles, output_rows, seconds = _profile_query(query)
+    peaks = _trace_memory(query)
+
+    rows = [('QUERY', query.text)]
+    parallel = _parallel_plan(query, table)
+    if parallel:
+        rows.append((parallel[0], f'{parallel[1]}, analyzed serially'))
+
+    previous = None
+    peak_memory = 0
+    for (keyword, detail), profile, peak in zip(query.describe(table), profiles, peaks):
+        rows_in = previous.rows if previous else 0
+        own_seconds = profile.own_seconds(previous)
+        peak_memory = max(peak_memory, peak)
+        bytes_read = int(rows_in * row_width(table, profile.operator.input_columns(table)))
+        rows.append((keyword, detail, f'time={own_seconds * 1000:.3f}ms', f'rows_in={rows_in}',
+                     f'rows_out={profile.rows}', f'bytes_read={bytes_read}', f'peak_memory={peak_memory}'))
+        previous = profile
+
+    rows.append(('RESULT', f'rows={output_rows}', f'time={seconds * 1000:.3f}ms', f'peak_memory={peak_memory}'))
+    return rows
+
+
+def explain(query_string: str, analyze: bool = False):
+    """
+    The plan of every query of the request, one row per operator, run and measured when analyzing
+    """
+    for query in plan_cache.parse(query_string):
+        yield from analyze_query(query) if analyze else explain_query(query)
@@ -1,27 +1,200 @@
+from functools import lru_cache
+from itertools import compress
+from typing import Callable, List, Optional, Tuple, Iterator
+
+from query_parser.indexes import find_index, HASH, SORTED, BITMAP, Index
+from query_parser.masks import and_masks, or_masks, invert_mask, lookup_mask, bitmap_to_row_ids, expand_mask
+from query_parser.statistics import DEFAULT_SELECTIVITY
+from query_parser.table import ColumnBatch, StringColumn, Table, Schema, ColumnTable, NULL_TOKENS, format_value
+
 EXPRESSION_KEYWORDS = (
     'AND',
     'OR',
     'NOT'
 )
 
+# Stands for a value given when a prepared statement is executed
+PLACEHOLDER = '?'
+
+# The right operand of an AND only evaluates the rows selected by the left one when fewer than this fraction of them are
+SPARSE_FRACTION = 1 / 8
+
 
 class Expression(object):
     """
-    An expression takes a dict and does _something_ with it. The actual action depends on the type of expression
+    An expression takes a dict and does _something_ with it. The actual action depends on the type of expression.
+    Expressions can also be evaluated over a whole batch of columnar rows, returning the selection mask of the batch.
     """
 
     def apply(self, obj: dict) -> bool:
         raise NotImplementedError
 
+    def evaluate(self, batch: ColumnBatch) -> bytes:
+        raise NotImplementedError
+
+    def source(self, constants: List, schema: Schema = None) -> str:
+        """
+        Python source code of the expression for the compiled predicate of `compile_expression`. Constants used by the
+        expression are appended to the list and referred to by name. Fields are read by their position in the schema
+        when one is given, or else by name.
+        """
+        raise NotImplementedError
+
+    def candidates(self, table: Table) -> Optional[Tuple[list, bool]]:
+        """
+        The ascending ids of the rows which may satisfy the expression, found through the indexes of the table, and
+        whether every one of them is known to satisfy it. None when the indexes can not narrow down the rows.
+        """
+        return None
+
+    def bitmap(self, table: Table) -> Optional[int]:
+        """
+        The bitmap of the rows satisfying the expression, when it can be answered from bitmap indexes alone
+        """
+        return None
+
+    def selectivity(self, table: Table) -> float:
+        """
+        The estimated fraction of the rows of the table satisfying the expression, from the statistics of its columns
+        """
+        return DEFAULT_SELECTIVITY
+
+    @property
+    def cost(self) -> int:
+        """
+        The relative cost of evaluating the expression for a row, the number of comparisons it makes
+        """
+        return 1
+
+    @property
+    def columns(self) -> List[str]:
+        return []
+
+    def plan(self, table: Table) -> 'Expression':
+        """
+        An equivalent expression with the operands of every AND and OR ordered so that the cheapest and most decisive
+        ones are evaluated first. The expression itself is returned when its order is already the best one.
+        """
+        return self
+
+    @property
+    def parameters(self) -> int:
+        return 0
+
+    def bind_parameters(self, values: Iterator[str]) -> 'Expression':
+        """
+        A copy of the expression with its placeholders, in the order they were written, replaced by the given values
+        """
+        return self
+
 
 class BinaryExpression(Expression):
     """
     A binary expression is created from three pieces of data, the LHS, the RHS and the comparator
     """
+    # The method of the constant value which performs the comparison with the operands swapped, `x < v` is `v > x`
+    reflected = None
+    symbol = None
+    keyword = None
 
     def apply(self, obj: dict) -> bool:
+        return self.matches(obj[self.fieldname])
+
+    def matches(self, value) -> bool:
+        # Missing values are compared as the text they are output as, like the row store does, so they only ever
+        # satisfy comparisons with text. Booleans are also taken from the text of the value, which is true unless empty.
+        if value is None or self.value_type is bool:
+            value = format_value(value)
+
+        try:
+            return self.compare(self.value_type(value))
+        except ValueError:
+            return False
+
+    def compare(self, value) -> bool:
+        raise NotImplementedError
+
+    def evaluate(self, batch: ColumnBatch) -> bytes:
+        column = batch.column(self.fieldname)
+        if isinstance(column, StringColumn):
+            # Every distinct value is compared once, rows just look up the result for their code. The dictionary also
+            # holds the text of the missing values.
+            lookup = bytes(map(self.matches, column.dictionary))
+            return lookup_mask(batch.raw(column), lookup)
+        if self.value_type not in (int, float):
+            return bytes(map(self.matches, batch.values(column)))
+
+        mask = bytes(map(getattr(self.value, self.reflected), batch.raw(column)))
+        valid = batch.valid(column)
+        return and_masks(mask, valid) if valid else mask
+
+    def _misses_rows(self, table: Table) -> bool:
+        """
+        Whether indexes of the column may miss rows satisfying the comparison. Indexes of typed columns never hold the
+        missing values, and hold numbers which are not compared with text as they were written.
+        """
+        if self.value_type in (int, float) or not isinstance(table, ColumnTable):
+            return False
+        column = table.column(self.fieldname)
+        return column.is_numeric or bool(column.nulls) and any(map(self.matches, NULL_TOKENS))
+
+    def bitmap(self, table: Table) -> Optional[int]:
+        index = find_index(table, self.fieldname, BITMAP)
+        if index is None or self._misses_rows(table):
+            return None
+        # Low cardinality columns have few enough values to check each of them with the usual comparison
+        return index.matching(self.matches)
+
+    def candidates(self, table: Table) -> Optional[Tuple[list, bool]]:
+        bitmap = self.bitmap(table)
+        if bitmap is not None:
+            return list(bitmap_to_row_ids(bitmap)), True
+
+        if self._misses_rows(table):
+            return None
+
+        column_type = table.column_type(self.fieldname)
+        numeric = self.value_type in (int, float)
+        # Indexes hold typed values, so they only answer comparisons which need no conversion
+        if (numeric and column_type not in (int, float)) or (not numeric and column_type is not self.value_type):
+            return None
+
+        for kind in (HASH, SORTED):
+            index = find_index(table, self.fieldname, kind)
+            row_ids = self.lookup(index) if index else None
+            if row_ids is not None:
+                return row_ids, True
+        return None
+
+    def lookup(self, index: Index):
         raise NotImplementedError
 
+    @property
+    def columns(self) -> List[str]:
+        return [self.fieldname]
+
+    def selectivity(self, table: Table) -> float:
+        statistics = table.statistics.get(self.fieldname)
+        return self.estimate(statistics) if statistics else DEFAULT_SELECTIVITY
+
+    def estimate(self, statistics) -> float:
+        raise NotImplementedError
+
+    def source(self, constants: List, schema: Schema = None) -> str:
+        constant = f'c{len(constants)}'
+        constants.append(self.value)
+
+        field = f'row[{self.fieldname!r}]' if schema is None else f'row[{schema.position(self.fieldname)}]'
+        if self.value_type is bool:
+            # The text of a typed value is never empty, whether it is missing or not
+            field = f'bool(str({field}))'
+        elif self.value_type is not str:
+            field = f'{self.value_type.__name__}({field})'
+        return f'({field} {self.symbol} {constant})'
+
+    def __repr__(self) -> str:
+        return f'{self.fieldname} {self.keyword} {self.value!r}'
+
     @staticmethod
     def from_buffer(fieldname, key, value) -> 'BinaryExpression':
         # TODO we should probably check here if the value supports > or <
@@ -32,9 +205,19 @@ class BinaryExpression(Expression):
         elif key == '<':
             return LessThanExpression(fieldname, value)
 
+    @property
+    def parameters(self) -> int:
+        return 1 if self.is_placeholder else 0
+
+    def bind_parameters(self, values: Iterator[str]) -> 'Expression':
+        if not self.is_placeholder:
+            return self
+        return type(self)(self.fieldname, next(values))
+
     def __init__(self, fieldname: str, value: str) -> None:
         super().__init__()
         self.fieldname = fieldname
+        self.is_placeholder = value == PLACEHOLDER
 
         if value.isnumeric():
             value = float(value)
@@ -49,27 +232,48 @@ class BinaryExpression(Expression):
 
 
 class EqualsExpression(BinaryExpression):
-    def apply(self, obj: dict) -> bool:
-        try:
-            return self.value_type(obj[self.fieldname]) == self.value
-        except ValueError:
-            return False
+    symbol = '=='
+    keyword = '='
+    reflected = '__eq__'
+
+    def compare(self, value) -> bool:
+        return value == self.value
+
+    def lookup(self, index: Index):
+        return index.equal(self.value)
+
+    def estimate(self, statistics) -> float:
+        return statistics.equal(self.value)
 
 
 class LessThanExpression(BinaryExpression):
-    def apply(self, obj: dict) -> bool:
-        try:
-            return self.value_type(obj[self.fieldname]) < self.value
-        except ValueError:
-            return False
+    symbol = '<'
+    keyword = '<'
+    reflected = '__gt__'
+
+    def compare(self, value) -> bool:
+        return value < self.value
+
+    def lookup(self, index: Index):
+        return index.less_than(self.value)
+
+    def estimate(self, statistics) -> float:
+        return statistics.less_than(self.value)
 
 
 class GreaterThanExpression(BinaryExpression):
-    def apply(self, obj: dict) -> bool:
-        try:
-            return self.value_type(obj[self.fieldname]) > self.value
-        except ValueError:
-            return False
+    symbol = '>'
+    keyword = '>'
+    reflected = '__lt__'
+
+    def compare(self, value) -> bool:
+        return value > self.value
+
+    def lookup(self, index: Index):
+        return index.greater_than(self.value)
+
+    def estimate(self, statistics) -> float:
+        return statistics.greater_than(self.value)
 
 
 class AndExpression(Expression):
@@ -85,6 +289,63 @@ class AndExpression(Expression):
     def apply(self, obj: dict) -> bool:
         return self.left.apply(obj) and self.right.apply(obj)
 
+    def evaluate(self, batch: ColumnBatch) -> bytes:
+        left = self.left.evaluate(batch)
+        selected = left.count(1)
+        if not selected:
+            return left
+        if selected >= len(left) * SPARSE_FRACTION:
+            return and_masks(left, self.right.evaluate(batch))
+
+        # Few rows are left, so the right operand only looks at those
+        positions = list(compress(range(len(left)), left))
+        row_ids = batch.row_ids
+        right = self.right.evaluate(ColumnBatch(batch.table, [row_ids[position] for position in positions]))
+        return expand_mask(right, positions, len(left))
+
+    def source(self, constants: List, schema: Schema = None) -> str:
+        return f'({self.left.source(constants, schema)} and {self.right.source(constants, schema)})'
+
+    def candidates(self, table: Table) -> Optional[Tuple[list, bool]]:
+        left, right = self.left.candidates(table), self.right.candidates(table)
+        if left and right:
+            return sorted(set(left[0]).intersection(right[0])), left[1] and right[1]
+
+        # Rows matching one side are a superset of the rows matching both
+        narrowest = left or right
+        return (narrowest[0], False) if narrowest else None
+
+    def bitmap(self, table: Table) -> Optional[int]:
+        left = self.left.bitmap(table)
+        right = self.right.bitmap(table) if left is not None else None
+        return left & right if right is not None else None
+
+    def selectivity(self, table: Table) -> float:
+        return self.left.selectivity(table) * self.right.selectivity(table)
+
+    @property
+    def cost(self) -> int:
+        return self.left.cost + self.right.cost
+
+    @property
+    def columns(self) -> List[str]:
+        return self.left.columns + self.right.columns
+
+    def plan(self, table: Table) -> 'Expression':
+        # Operands rejecting the most rows for the least work go first, as they spare the others the most rows
+        return _plan_operands(self, table, lambda operand: (1 - operand.selectivity(table)) / operand.cost)
+
+    @property
+    def parameters(self) -> int:
+        return self.left.parameters + self.right.parameters
+
+    def bind_parameters(self, values: Iterator[str]) -> 'Expression':
+        left = self.left.bind_parameters(values)
+        return AndExpression(left=left, right=self.right.bind_parameters(values))
+
+    def __repr__(self) -> str:
+        return f'({self.left!r} AND {self.right!r})'
+
 
 class OrExpression(Expression):
     """
@@ -99,6 +360,55 @@ class OrExpression(Expression):
     def apply(self, obj: dict) -> bool:
         return self.left.apply(obj) or self.right.apply(obj)
 
+    def evaluate(self, batch: ColumnBatch) -> bytes:
+        left = self.left.evaluate(batch)
+        # Every row is already selected
+        if 0 not in left:
+            return left
+        return or_masks(left, self.right.evaluate(batch))
+
+    def source(self, constants: List, schema: Schema = None) -> str:
+        return f'({self.left.source(constants, schema)} or {self.right.source(constants, schema)})'
+
+    def candidates(self, table: Table) -> Optional[Tuple[list, bool]]:
+        left = self.left.candidates(table)
+        right = self.right.candidates(table) if left else None
+        if left and right:
+            return sorted(set(left[0]).union(right[0])), left[1] and right[1]
+        return None
+
+    def bitmap(self, table: Table) -> Optional[int]:
+        left = self.left.bitmap(table)
+        right = self.right.bitmap(table) if left is not None else None
+        return left | right if right is not None else None
+
+    def selectivity(self, table: Table) -> float:
+        left, right = self.left.selectivity(table), self.right.selectivity(table)
+        return left + right - left * right
+
+    @property
+    def cost(self) -> int:
+        return self.left.cost + self.right.cost
+
+    @property
+    def columns(self) -> List[str]:
+        return self.left.columns + self.right.columns
+
+    def plan(self, table: Table) -> 'Expression':
+        # Operands accepting the most rows for the least work go first
+        return _plan_operands(self, table, lambda operand: operand.selectivity(table) / operand.cost)
+
+    @property
+    def parameters(self) -> int:
+        return self.left.parameters + self.right.parameters
+
+    def bind_parameters(self, values: Iterator[str]) -> 'Expression':
+        left = self.left.bind_parameters(values)
+        return OrExpression(left=left, right=self.right.bind_parameters(values))
+
+    def __repr__(self) -> str:
+        return f'({self.left!r} OR {self.right!r})'
+
 
 class NotExpression(Expression):
     """
@@ -112,6 +422,70 @@ class NotExpression(Expression):
     def apply(self, obj: dict) -> bool:
         return not self.expression.apply(obj)
 
+    def evaluate(self, batch: ColumnBatch) -> bytes:
+        return invert_mask(self.expression.evaluate(batch))
+
+    def source(self, constants: List, schema: Schema = None) -> str:
+        return f'(not {self.expression.source(constants, schema)})'
+
+    def bitmap(self, table: Table) -> Optional[int]:
+        bitmap = self.expression.bitmap(table)
+        if bitmap is None:
+            return None
+        # Every row not matched, including the ones with missing values
+        return bitmap ^ ((1 << table.num_rows) - 1)
+
+    def selectivity(self, table: Table) -> float:
+        return 1 - self.expression.selectivity(table)
+
+    @property
+    def cost(self) -> int:
+        return self.expression.cost
+
+    @property
+    def columns(self) -> List[str]:
+        return self.expression.columns
+
+    def plan(self, table: Table) -> 'Expression':
+        expression = self.expression.plan(table)
+        return self if expression is self.expression else NotExpression(expression=expression)
+
+    @property
+    def parameters(self) -> int:
+        return self.expression.parameters
+
+    def bind_parameters(self, values: Iterator[str]) -> 'Expression':
+        return NotExpression(expression=self.expression.bind_parameters(values))
+
+    def __repr__(self) -> str:
+        return f'NOT {self.expression!r}'
+
+
+def _operands(expression: Expression, junction) -> List[Expression]:
+    """
+    The operands of a chain of ANDs, or of ORs, as written
+    """
+    if type(expression) is not junction:
+        return [expression]
+    return _operands(expression.left, junction) + _operands(expression.right, junction)
+
+
+def _plan_operands(expression: Expression, table: Table, benefit) -> Expression:
+    """
+    Plans a chain of ANDs or ORs, ordering its operands by decreasing benefit. Operands with the same benefit keep the
+    order they were written in.
+    """
+    junction = type(expression)
+    operands = _operands(expression, junction)
+    planned = sorted((operand.plan(table) for operand in operands), key=benefit, reverse=True)
+    if all(operand is original for operand, original in zip(planned, operands)):
+        return expression
+
+    result = planned[0]
+    for operand in planned[1:]:
+        result = junction(left=result, right=operand)
+    return result
+
 
 def build_expression_from_tokens(tokens) -> Expression:
     # For the lack of time we will use a multi-pass strategy here
@@ -148,3 +522,42 @@ def build_expression_from_tokens(tokens) -> Expression:
             joint_clause = NotExpression(expression=next(iterator))
 
     return joint_clause
+
+
+def compile_expression(expression: Expression, schema: Schema = None) -> Callable[[dict], bool]:
+    """
+    Compiles an expression tree into a single function of a row of strings, a dict or else a tuple of the row store
+    when its schema is given. Fields and constants are bound once, comparisons are inlined and AND / OR short circuit
+    without any per node calls.
+
+    Rows holding a value which cannot be converted to the type of a constant, which are rare, are handed to the
+    interpreted expression instead so that the result is always the same.
+    """
+    constants = []
+    body = expression.source(constants, schema)
+
+    fallback = expression.apply
+    if schema is not None:
+        def fallback(row):
+            return expression.apply(schema.as_dict(row))
+
+    predicate = _compile_predicate(body, len(constants))(fallback, *constants)
+    predicate.source = body
+    return predicate
+
+
+@lru_cache(maxsize=256)
+def _compile_predicate(body: str, constants: int):
+    # Constants are arguments, so expressions differing only in their values share the compiled code
+    names = ', '.join(['fallback'] + [f'c{i}' for i in range(constants)])
+
+    source = f'def make({names}):\n' \
+             f'    def predicate(row):\n' \
+             f'        try:\n' \
+             f'            return {body}\n' \
+             f'        except (ValueError, TypeError):\n' \
+             f'            return fallback(row)\n' \
+             f'    return predicate\n'
+    namespace = {}
+    exec(compile(source, '<where clause>', 'exec'), namespace)
+    return namespace['make']
@@ -0,0 +1,368 @@
+import array
+import copy
+import heapq
+import logging
+from bisect import bisect_left, bisect_right
+
+from query_parser.masks import and_masks, mask_to_bitmap, lookup_mask, bitmap_to_row_ids
+from query_parser.table import Table, ColumnTable, StringColumn, Column, ColumnBatch
+
+HASH = 'hash'
+SORTED = 'sorted'
+BITMAP = 'bitmap'
+
+# Columns with at most this many distinct values get a bitmap index the first time a query filters on them
+BITMAP_CARDINALITY_THRESHOLD = 32
+
+# The bytes taken by a row id held by an index
+ROW_ID_BYTES = array.array('q').itemsize
+
+# The declared indexes, table name -> column name -> kinds of index
+index_definitions = {}
+
+
+class Index(object):
+    """
+    A secondary index over a single column of a table, mapping values to the ids of the rows holding them. Missing
+    values are never indexed. Row ids are always returned in ascending order.
+
+    Rows appended to the table are indexed in runs kept apart from the rows the index was built from, so appending costs
+    as much as the appended rows. The runs are merged into one the first time the index is looked up.
+    """
+    kind = None
+
+    def __init__(self, table: Table, column: str) -> None:
+        super().__init__()
+        self.table_name = table.name
+        self.column = column
+        self.value_type = table.column_type(column)
+        # The indexed appended rows, one run per append
+        self.runs = ()
+
+    @property
+    def nbytes(self) -> int:
+        raise NotImplementedError
+
+    def equal(self, value):
+        raise NotImplementedError
+
+    def less_than(self, value):
+        return None
+
+    def greater_than(self, value):
+        return None
+
+    def append(self, table: Table, start: int) -> 'Index':
+        """
+        The index of a table holding the rows of the indexed table followed by appended rows, from row start on. Only
+        the appended rows are read, and this index is left unchanged for the queries still using it.
+        """
+        index = copy.copy(self)
+        index.runs = self.runs + (self._run(table, start),)
+        return index
+
+    def _run(self, table: Table, start: int):
+        """
+        The run indexing the appended rows of a table, from row start on
+        """
+        raise NotImplementedError
+
+    def _merge(self, runs: tuple):
+        """
+        A single run indexing the rows of the given runs
+        """
+        raise NotImplementedError
+
+    def _merged_run(self):
+        """
+        The appended rows indexed in a single run, None when no rows were appended
+        """
+        runs = self.runs
+        if len(runs) > 1:
+            # Queries looking the index up at the same time merge the same runs, either of the results is kept
+            runs = self.runs = (self._merge(runs),)
+        return runs[0] if runs else None
+
+    def _appended_values(self, table: Table, start: int):
+        """
+        The present values of the appended rows with their row ids
+        """
+        values = table.values(self.column, range(start, table.num_rows))
+        return [(value, row_id) for row_id, value in enumerate(values, start) if value is not None]
+
+    def __repr__(self) -> str:
+        return f'<{self.kind.upper()} INDEX {self.table_name}.{self.column}>'
+
+
+class HashIndex(Index):
+    """
+    Answers equality lookups with a dict from every distinct value to its row ids
+    """
+    kind = HASH
+
+    def __init__(self, table: Table, column: str) -> None:
+        super().__init__(table, column)
+        self.row_ids = self._group(enumerate(table.values(column)))
+        self.entries = sum(map(len, self.row_ids.values()))
+
+    @staticmethod
+    def _group(rows) -> dict:
+        grouped = {}
+        for row_id, value in rows:
+            if value is None:
+                continue
+            row_ids = grouped.get(value)
+            if row_ids is None:
+                row_ids = grouped[value] = array.array('q')
+            row_ids.append(row_id)
+        return grouped
+
+    @property
+    def nbytes(self) -> int:
+        return self.entries * ROW_ID_BYTES
+
+    def equal(self, value):
+        row_ids = self.row_ids.get(value, ())
+        run = self._merged_run()
+        if run is None or value not in run:
+            return row_ids
+        # Appended rows come after every row the index was built from
+        return array.array('q', row_ids) + run[value]
+
+    def append(self, table: Table, start: int) -> 'HashIndex':
+        index = super().append(table, start)
+        index.entries += sum(map(len, index.runs[-1].values()))
+        return index
+
+    def _run(self, table: Table, start: int) -> dict:
+        return self._group((row_id, value) for value, row_id in self._appended_values(table, start))
+
+    def _merge(self, runs: tuple) -> dict:
+        merged = {}
+        for run in runs:
+            for value, row_ids in run.items():
+                merged.setdefault(value, array.array('q')).extend(row_ids)
+        return merged
+
+
+class SortedIndex(Index):
+    """
+    Keeps the values of the column sorted, along with their row ids, and answers range lookups by bisecting them
+    """
+    kind = SORTED
+
+    def __init__(self, table: Table, column: str) -> None:
+        super().__init__(table, column)
+        self.values, self.row_ids = self._sorted(
+            (value, row_id) for row_id, value in enumerate(table.values(column)) if value is not None)
+        self.entries = len(self.row_ids)
+
+    @staticmethod
+    def _sorted(entries) -> tuple:
+        entries = sorted(entries)
+        return [value for value, _ in entries], array.array('q', (row_id for _, row_id in entries))
+
+    @property
+    def nbytes(self) -> int:
+        # Every entry holds a value besides its row id
+        return self.entries * ROW_ID_BYTES * 2
+
+    def _row_ids(self, start, stop):
+        """
+        The sorted row ids of the entries from start to stop, functions giving positions in the values of a run
+        """
+        row_ids = list(self.row_ids[start(self.values):stop(self.values)])
+        run = self._merged_run()
+        if run is not None:
+            values, run_row_ids = run
+            row_ids.extend(run_row_ids[start(values):stop(values)])
+        return sorted(row_ids)
+
+    def equal(self, value):
+        return self._row_ids(lambda values: bisect_left(values, value), lambda values: bisect_right(values, value))
+
+    def less_than(self, value):
+        return self._row_ids(lambda values: 0, lambda values: bisect_left(values, value))
+
+    def greater_than(self, value):
+        return self._row_ids(lambda values: bisect_right(values, value), len)
+
+    def append(self, table: Table, start: int) -> 'SortedIndex':
+        index = super().append(table, start)
+        index.entries += len(index.runs[-1][1])
+        return index
+
+    def _run(self, table: Table, start: int) -> tuple:
+        return self._sorted(self._appended_values(table, start))
+
+    def _merge(self, runs: tuple) -> tuple:
+        # Row ids of every run are larger than the ones of the runs before it, which keeps equal values in row order
+        return self._sorted(heapq.merge(*(zip(values, row_ids) for values, row_ids in runs)))
+
+
+class BitmapIndex(Index):
+    """
+    One bitmap per distinct value of a low cardinality column, where bit i is set when row i holds the value. Any
+    comparison against the column is answered by combining the bitmaps of the values that satisfy it.
+    """
+    kind = BITMAP
+
+    def __init__(self, table: ColumnTable, column: str) -> None:
+        super().__init__(table, column)
+        self.num_rows = table.num_rows
+        self.bitmaps = {}
+
+        column = table.column(column)
+        batch = ColumnBatch(table, range(self.num_rows))
+        valid = batch.valid(column)
+        for value, mask in self._value_masks(column, batch):
+            self.bitmaps[value] = mask_to_bitmap(and_masks(mask, valid) if valid else mask)
+        self.distinct = frozenset(self.bitmaps)
+
+    @staticmethod
+    def _value_masks(column: Column, batch: ColumnBatch):
+        raw = batch.raw(column)
+        if isinstance(column, StringColumn):
+            for code, value in enumerate(column.dictionary):
+                lookup = bytearray(len(column.dictionary))
+                lookup[code] = 1
+                yield value, lookup_mask(raw, bytes(lookup))
+        else:
+            for value in set(raw):
+                yield value, bytes(map(value.__eq__, raw))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.distinct) * (self.num_rows // 8 + 1)
+
+    @property
+    def all_rows(self) -> int:
+        return (1 << self.num_rows) - 1
+
+    def bitmap(self, value) -> int:
+        bitmap = self.bitmaps.get(value, 0)
+        run = self._merged_run()
+        if run is not None:
+            start, bitmaps = run
+            bitmap |= bitmaps.get(value, 0) << start
+        return bitmap
+
+    def matching(self, predicate) -> int:
+        bitmap = 0
+        for value in self.distinct:
+            if predicate(value):
+                bitmap |= self.bitmap(value)
+        return bitmap
+
+    def equal(self, value):
+        return list(bitmap_to_row_ids(self.bitmap(value)))
+
+    def append(self, table: ColumnTable, start: int) -> 'BitmapIndex':
+        index = super().append(table, start)
+        index.num_rows = table.num_rows
+        index.distinct = self.distinct.union(index.runs[-1][1])
+        return index
+
+    def _run(self, table: ColumnTable, start: int) -> tuple:
+        column = table.column(self.column)
+        batch = ColumnBatch(table, range(start, table.num_rows))
+        valid = batch.valid(column)
+        bitmaps = {value: mask_to_bitmap(and_masks(mask, valid) if valid else mask)
+                   for value, mask in self._value_masks(column, batch)}
+        # Bitmaps of a run start at its first row
+        return start, bitmaps
+
+    def _merge(self, runs: tuple) -> tuple:
+        first = runs[0][0]
+        merged = {}
+        for start, bitmaps in runs:
+            for value, bitmap in bitmaps.items():
+                merged[value] = merged.get(value, 0) | bitmap << (start - first)
+        return first, merged
+
+
+def cardinality(column: Column, threshold: int) -> int:
+    """
+    The number of distinct values of the column, counting stops once it goes over the threshold
+    """
+    if isinstance(column, StringColumn):
+        return len(column.dictionary)
+
+    distinct = set()
+    for value in column.data:
+        distinct.add(value)
+        if len(distinct) > threshold:
+            break
+    return len(distinct)
+
+
+INDEX_TYPES = {
+    HASH: HashIndex,
+    SORTED: SortedIndex,
+}
+
+
+def declare_index(table_name: str, column: str, kind: str = HASH):
+    if kind not in INDEX_TYPES:
+        raise ValueError(f'Unknown index type {kind}, expected one of {", ".join(INDEX_TYPES)}')
+    index_definitions.setdefault(table_name, {}).setdefault(column, set()).add(kind)
+
+
+def prepare_indexes(table: Table, bitmap_threshold: int = BITMAP_CARDINALITY_THRESHOLD):
+    """
+    Sets up a freshly loaded table for its indexes: the indexes declared for the table, and bitmap indexes for the
+    columns of a columnar table with at most bitmap_threshold distinct values. None of them is built here, each one is
+    built the first time a query needs it, so loading a table reads none of its columns. Indexes live on the table they
+    were built from, so a table reloaded from a changed file always starts out with fresh indexes. Indexes declared on
+    columns the table does not have are dropped.
+    """
+    definitions = index_definitions.get(table.name, {})
+    for column in list(definitions):
+        if column not in table.column_names:
+            logging.warning(f'ignoring the indexes declared on {table.name}.{column}, {table.name} has no such column')
+            del definitions[column]
+
+    table.bitmap_threshold = bitmap_threshold
+
+
+def append_indexes(table: Table, appended: Table, start: int, bitmap_threshold: int = BITMAP_CARDINALITY_THRESHOLD):
+    """
+    Extends the indexes of a table to the table holding its rows followed by appended rows, from row start on. A bitmap
+    index is dropped once its column holds more distinct values than the threshold, as a load of the whole table
+    would not build it.
+    """
+    appended.bitmap_threshold = bitmap_threshold
+    # Columns counted already either had too many distinct values, which they still have, or have their index appended
+    appended.bitmap_columns = set(table.bitmap_columns)
+    for key, index in list(table.indexes.items()):
+        index = index.append(appended, start)
+        if index.kind != BITMAP or len(index.distinct) <= bitmap_threshold:
+            appended.indexes[key] = index
+
+
+def find_index(table: Table, column: str, kind: str):
+    """
+    The index of the given kind on a column, if one is declared or, for a bitmap index, if the column has few enough
+    distinct values. It is built the first time it is needed.
+    """
+    if kind == BITMAP:
+        return _bitmap_index(table, column)
+
+    if kind not in index_definitions.get(table.name, {}).get(column, ()):
+        return None
+
+    index = table.indexes.get((column, kind))
+    if index is None:
+        index = table.indexes[(column, kind)] = INDEX_TYPES[kind](table, column)
+    return index
+
+
+def _bitmap_index(table: Table, column: str):
+    index = table.indexes.get((column, BITMAP))
+    if index is not None or column in table.bitmap_columns or not isinstance(table, ColumnTable):
+        return index
+
+    if table.bitmap_threshold and cardinality(table.column(column), table.bitmap_threshold) <= table.bitmap_threshold:
+        index = table.indexes[(column, BITMAP)] = BitmapIndex(table, column)
+    table.bitmap_columns.add(column)
+    return index
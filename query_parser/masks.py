@@ -0,0 +1,58 @@
+"""
+Selection masks used by batch evaluation. A mask is a bytes object holding a 1 for every selected row of a batch and
+a 0 for every other row. Masks are combined a whole machine word at a time by treating them as big integers.
+
+Bitmaps are the packed form used by bitmap indexes: a single int where bit i is set when row i is selected.
+"""
+from itertools import compress
+
+_INVERT = bytes.maketrans(b'\x00\x01', b'\x01\x00')
+_MASK_TO_DIGITS = bytes.maketrans(b'\x00\x01', b'01')
+_DIGITS_TO_MASK = bytes.maketrans(b'01', b'\x00\x01')
+
+
+def and_masks(left: bytes, right: bytes) -> bytes:
+    return (int.from_bytes(left, 'little') & int.from_bytes(right, 'little')).to_bytes(len(left), 'little')
+
+
+def or_masks(left: bytes, right: bytes) -> bytes:
+    return (int.from_bytes(left, 'little') | int.from_bytes(right, 'little')).to_bytes(len(left), 'little')
+
+
+def invert_mask(mask: bytes) -> bytes:
+    return mask.translate(_INVERT)
+
+
+def lookup_mask(codes, lookup: bytes) -> bytes:
+    """
+    Builds a mask from dictionary codes, given the mask bit of every entry in the dictionary
+    """
+    if getattr(codes, 'itemsize', None) == 1:
+        return codes.tobytes().translate(lookup.ljust(256, b'\x00'))
+    return bytes(map(lookup.__getitem__, codes))
+
+
+def mask_to_bitmap(mask: bytes) -> int:
+    return int(mask.translate(_MASK_TO_DIGITS)[::-1] or b'0', 2)
+
+
+def bitmap_to_row_ids(bitmap: int):
+    """
+    The positions of the set bits of a bitmap, in ascending order
+    """
+    digits = format(bitmap, 'b').encode('ascii')[::-1]
+    return compress(range(len(digits)), digits.translate(_DIGITS_TO_MASK))
+
+
+def popcount(bitmap: int) -> int:
+    return bin(bitmap).count('1')
+
+
+def expand_mask(mask: bytes, positions, length: int) -> bytes:
+    """
+    Spreads the mask of some of the rows of a batch, given their positions in it, back over the whole batch
+    """
+    expanded = bytearray(length)
+    for position in compress(positions, mask):
+        expanded[position] = 1
+    return bytes(expanded)
@@ -0,0 +1,192 @@
+"""
+Server metrics, cheap enough to record all the time.
+
+Requests are counted and timed by shape: `select` for plain projections, `where` for filtered ones and `aggregate` for
+anything aggregating or grouping, along with `prepare`, `explain` and `stats` requests. A request holding several
+queries takes the heaviest of their shapes, and an EXECUTE takes the shape of its statement.
+
+Metrics are rendered one per line in the Prometheus text format, `name{label="value"} number`, and can be read with a
+`SHOW STATS;` request or scraped over HTTP from the metrics port.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left
+from typing import List
+
+from query_parser.aggregators import AGGREGATES
+
+SELECT = 'select'
+WHERE = 'where'
+AGGREGATE = 'aggregate'
+PREPARE = 'prepare'
+EXPLAIN = 'explain'
+STATS = 'stats'
+# Requests which could not even be decoded
+INVALID = 'invalid'
+
+SHOW_STATS_PATTERN = re.compile(r'^\s*SHOW\s+STATS\s*;?\s*$')
+
+AGGREGATE_PATTERN = re.compile(r'\b(?:{})\(|\bGROUP\s+BY\b'.format('|'.join(AGGREGATES)))
+WHERE_PATTERN = re.compile(r'\bWHERE\b')
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Queries per second are averaged over this many of the latest seconds
+RATE_WINDOW = 60
+
+
+def match_show_stats(request: str) -> bool:
+    return SHOW_STATS_PATTERN.match(request) is not None
+
+
+def query_shape(query_string: str) -> str:
+    """
+    The shape of a request, from its text alone
+    """
+    if AGGREGATE_PATTERN.search(query_string):
+        return AGGREGATE
+    if WHERE_PATTERN.search(query_string):
+        return WHERE
+    return SELECT
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels.items()) + '}'
+
+
+class Histogram(object):
+    """
+    Counts observations into fixed buckets, keeping their sum
+    """
+
+    def __init__(self, bounds=LATENCY_BUCKETS) -> None:
+        super().__init__()
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def lines(self, name: str, labels: dict) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{_format_labels(dict(labels, le=bound))} {cumulative}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {self.sum:.6f}')
+        lines.append(f'{name}_count{_format_labels(labels)} {self.count}')
+        return lines
+
+
+class RateCounter(object):
+    """
+    Counts events in one slot per second over a sliding window
+    """
+
+    def __init__(self, window: int = RATE_WINDOW) -> None:
+        super().__init__()
+        self.window = window
+        self.seconds = [0] * window
+        self.counts = [0] * window
+
+    def add(self, now: float):
+        second = int(now)
+        slot = second % self.window
+        if self.seconds[slot] != second:
+            self.seconds[slot] = second
+            self.counts[slot] = 0
+        self.counts[slot] += 1
+
+    def rate(self, now: float, elapsed: float) -> float:
+        """
+        Events per second over the window, or over the elapsed time when it is shorter
+        """
+        oldest = int(now) - self.window
+        events = sum(count for second, count in zip(self.seconds, self.counts) if second > oldest)
+        return events / max(1.0, min(float(self.window), elapsed))
+
+
+class Metrics(object):
+    """
+    Everything the server did since it started, recorded by every connection thread
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.started = time.time()
+        self.requests = {}
+        self.errors = {}
+        self.rate = RateCounter()
+        self.rows_sent = 0
+        self.bytes_sent = 0
+        self.active_connections = 0
+        self.connections = 0
+        self.table_loads = Histogram()
+        # Table name -> (seconds, rows) of its latest load
+        self.latest_loads = {}
+        self._lock = threading.Lock()
+
+    def connection_opened(self):
+        with self._lock:
+            self.active_connections += 1
+            self.connections += 1
+
+    def connection_closed(self):
+        with self._lock:
+            self.active_connections -= 1
+
+    def record_request(self, shape: str, seconds: float, rows: int, nbytes: int, failed: bool = False):
+        with self._lock:
+            histogram = self.requests.get(shape)
+            if histogram is None:
+                histogram = self.requests[shape] = Histogram()
+            histogram.observe(seconds)
+            if failed:
+                self.errors[shape] = self.errors.get(shape, 0) + 1
+            self.rate.add(time.time())
+            self.rows_sent += rows
+            self.bytes_sent += nbytes
+
+    def record_table_load(self, name: str, seconds: float, rows: int):
+        with self._lock:
+            self.table_loads.observe(seconds)
+            self.latest_loads[name] = (seconds, rows)
+
+    def render(self, gauges: dict = None) -> List[str]:
+        """
+        Every metric as a line of the Prometheus text format, followed by the given gauges, name -> value
+        """
+        now = time.time()
+        with self._lock:
+            lines = [
+                f'sql_uptime_seconds {now - self.started:.3f}',
+                f'sql_queries_per_second {self.rate.rate(now, now - self.started):.3f}',
+                f'sql_active_connections {self.active_connections}',
+                f'sql_connections_total {self.connections}',
+                f'sql_rows_sent_total {self.rows_sent}',
+                f'sql_bytes_sent_total {self.bytes_sent}',
+            ]
+            for shape, histogram in sorted(self.requests.items()):
+                lines.extend(histogram.lines('sql_request_seconds', {'shape': shape}))
+            for shape, errors in sorted(self.errors.items()):
+                lines.append(f'sql_request_errors_total{_format_labels({"shape": shape})} {errors}')
+
+            lines.extend(self.table_loads.lines('sql_table_load_seconds', {}))
+            for name, (seconds, rows) in sorted(self.latest_loads.items()):
+                lines.append(f'sql_table_last_load_seconds{_format_labels({"table": name})} {seconds:.6f}')
+                lines.append(f'sql_table_rows{_format_labels({"table": name})} {rows}')
+
+        for name, value in (gauges or {}).items():
+            lines.append(f'{name} {value}')
+        return lines
+
+
+metrics = Metrics()
@@ -1,20 +1,40 @@
-import csv
-import os
-from collections import Iterable
+import array
+import heapq
+import re
+from collections.abc import Iterable
 from enum import Enum
-from itertools import repeat
+from itertools import repeat, islice
+from typing import List
 
-from query_parser.aggregators import parse_select_statement
-from query_parser.expression_parser import build_expression_from_tokens
+from query_parser.aggregators import parse_select_statement, aggregate, group_aggregate, Aggregator, Extractor, \
+    MultiExtractor, Distinct, is_aggregate
+from query_parser.expression_parser import build_expression_from_tokens, compile_expression, PLACEHOLDER
+from query_parser.sorting import DEFAULT_SORT_BUDGET, sort_components, external_sort
+from query_parser.table import Table, TableScan, ColumnTable, BATCH_SIZE
+from query_parser.table_cache import table_cache
 
 OPERATOR_KEYWORDS = (
     'SELECT',
     'FROM',
     'WHERE',
     'LIMIT',
+    'GROUP BY',
+    'ORDER BY',
     ';'
 )
 
+# Keywords made up of two tokens, which are joined into a single token before parsing
+COMPOUND_KEYWORDS = {
+    'GROUP': 'BY',
+    'ORDER': 'BY',
+}
+
+# Commas between sort keys, but not the ones between the arguments of an aggregate
+SORT_KEY_SEPARATOR = re.compile(r',(?![^(]*\))')
+
+# The default cap on the number of groups a single GROUP BY may hold in memory
+DEFAULT_MAX_GROUPS = 100000
+
 configuration = {}
 
 
@@ -23,11 +43,14 @@ class ParserState(Enum):
     POST_SELECT = 2
     POST_FROM = 3
     POST_WHERE = 4
-    POST_LIMIT = 5
-    END = 6
+    POST_GROUP_BY = 5
+    POST_ORDER_BY = 6
+    POST_LIMIT = 7
+    END = 8
 
 
 class Operator(object):
+    keyword = None
 
     def __init__(self) -> None:
         super().__init__()
@@ -42,6 +65,29 @@ class Operator(object):
     def apply(self, data=None):
         raise NotImplementedError
 
+    @property
+    def parameters(self) -> int:
+        return 0
+
+    def bind_parameters(self, values):
+        """
+        The operator with its placeholders replaced by values taken from the iterator, operators without any are
+        shared between every execution of a prepared statement
+        """
+        return self
+
+    def input_columns(self, table: Table) -> List[str]:
+        """
+        The columns of the table the operator reads for every row it is given
+        """
+        return []
+
+    def describe(self, table: Table) -> str:
+        """
+        How the operator runs against the table, for EXPLAIN
+        """
+        return ' '.join(self.expression_buffer)
+
     @staticmethod
     def from_keyword(keyword: str):
         if keyword == 'SELECT':
@@ -52,11 +98,17 @@ class Operator(object):
             return WhereOperator()
         elif keyword == 'LIMIT':
             return LimitOperator()
+        elif keyword == 'GROUP BY':
+            return GroupByOperator()
+        elif keyword == 'ORDER BY':
+            return OrderByOperator()
         elif keyword == ';':
             return EndOperator()
 
 
 class SelectOperator(Operator):
+    keyword = 'SELECT'
+
     def __init__(self):
         super().__init__()
         self.output_fields = None
@@ -72,11 +124,29 @@ class SelectOperator(Operator):
             raise ValueError('At least one column name or "*" is required')
         self.output_fields = parse_select_statement(self.expression_buffer)
 
+    @property
+    def is_streaming(self):
+        return all(field.is_streaming for field in self.output_fields)
+
+    def input_columns(self, table: Table) -> List[str]:
+        return _field_columns(self.output_fields, table)
+
     def apply(self, data=None):
-        output_list = []
-        for field in self.output_fields:
-            output_list.append(field.apply(data))
+        # Row wise projections are produced lazily, one output row per input row
+        if self.is_streaming:
+            if not isinstance(data, TableScan):
+                return (tuple(field.extract(row) for field in self.output_fields) for row in data)
+            getters = [field.getter(data.table) for field in self.output_fields]
+            return (tuple(getter(row) for getter in getters) for row in data)
+
+        # Everything else is computed together in a single pass over the data
+        return self.output_rows(aggregate(self.output_fields, data))
 
+    @staticmethod
+    def output_rows(output_list: list):
+        """
+        The output rows of the finalized values of the fields, scalar values are repeated alongside the lists
+        """
         iterators = []
         has_list = False
         for output in output_list:
@@ -88,7 +158,7 @@ class SelectOperator(Operator):
 
         # There are only scalar values. So just return the initial values of gathered iterators
         if not has_list:
-            return [(next(i) for i in iterators)]
+            return [tuple(next(i) for i in iterators)]
         else:
             return zip(*iterators)
 
@@ -97,6 +167,8 @@ class SelectOperator(Operator):
 
 
 class FromOperator(Operator):
+    keyword = 'FROM'
+
     def validate(self):
         if not self.expression_buffer:
             raise ValueError('Data source missing')
@@ -107,37 +179,93 @@ class FromOperator(Operator):
     def state(self):
         return ParserState.POST_FROM
 
-    def apply(self, data=None):
-        # TODO this should really come from command line args and not hardcoded like this!
-        filename = f'{configuration["data_path"]}/{self.expression_buffer[0]}.csv'
-        if not os.path.exists(filename):
-            raise ValueError(f'Data source {self.expression_buffer[0]} is invalid')
+    @property
+    def table_name(self) -> str:
+        return self.expression_buffer[0]
+
+    def describe(self, table: Table) -> str:
+        layout = 'columnar' if isinstance(table, ColumnTable) else 'row store'
+        return f'{table.name} ({layout}, {table.num_rows} rows, {len(table.column_names)} columns)'
 
-        with open(filename, 'r') as csvfile:
-            reader = csv.DictReader(csvfile)
-            return list(reader)
+    def apply(self, data=None):
+        cached = table_cache.get(configuration['data_path'], self.table_name)
+        return TableScan(cached.table)
 
     def __repr__(self) -> str:
         return f'<FROM {" ".join(self.expression_buffer)}>'
 
 
 class WhereOperator(Operator):
+    keyword = 'WHERE'
 
     def apply(self, data=None):
-        rows = []
-        for row in data:
-            if self.filter_criteria.apply(row):
-                rows.append(row)
-        return rows
+        if isinstance(data, TableScan) and data.is_full_scan:
+            bitmap = self.filter_criteria.bitmap(data.table)
+            if bitmap is not None:
+                return TableScan.from_bitmap(data.table, bitmap)
+
+            candidates = self.filter_criteria.candidates(data.table)
+            if candidates is not None:
+                row_ids, exact = candidates
+                data = TableScan(data.table, row_ids)
+                if exact:
+                    return data
+
+        if isinstance(data, TableScan):
+            # The operator is shared by every execution of the query, so a plan for this table never replaces it
+            criteria = self.filter_criteria.plan(data.table)
+            # Columnar tables are filtered a batch at a time with selection masks
+            if isinstance(data.table, ColumnTable):
+                return data.filter_batches(criteria.evaluate)
+            # Rows of the row store are tuples, read by the positions of the columns in the schema of the table
+            return data.filter(compile_expression(criteria, data.table.schema))
+
+        predicate = self.predicate
+        return (row for row in data if predicate(row))
 
     def __init__(self) -> None:
         super().__init__()
         self.filter_criteria = None
+        self.predicate = None
 
     def validate(self):
         self.filter_criteria = build_expression_from_tokens(self.expression_buffer)
         if not self.filter_criteria:
             raise ValueError('No filter criteria given for where clause')
+        self.predicate = compile_expression(self.filter_criteria)
+
+    @property
+    def parameters(self) -> int:
+        return self.filter_criteria.parameters
+
+    def input_columns(self, table: Table) -> List[str]:
+        return list(dict.fromkeys(self.filter_criteria.columns))
+
+    def describe(self, table: Table) -> str:
+        # The same choices as apply, which always starts from a full scan of the table
+        criteria = self.filter_criteria
+        if criteria.bitmap(table) is not None:
+            return f'{criteria!r} using bitmap indexes'
+
+        candidates = criteria.candidates(table)
+        if candidates is not None and candidates[1]:
+            return f'{criteria!r} using indexes'
+
+        method = 'batch filter' if isinstance(table, ColumnTable) else 'compiled filter'
+        planned = criteria.plan(table)
+        if candidates is not None:
+            method = f'indexes then {method}'
+        return f'{criteria!r} using {method}' + (f', planned as {planned!r}' if planned is not criteria else '')
+
+    def bind_parameters(self, values):
+        if not self.parameters:
+            return self
+
+        bound = WhereOperator()
+        bound.expression_buffer = self.expression_buffer
+        bound.filter_criteria = self.filter_criteria.bind_parameters(values)
+        bound.predicate = compile_expression(bound.filter_criteria)
+        return bound
 
     def state(self):
         return ParserState.POST_WHERE
@@ -146,24 +274,96 @@ class WhereOperator(Operator):
         return f'<WHERE {" ".join(self.expression_buffer)}>'
 
 
+class GroupByOperator(Operator):
+    """
+    Hash aggregation over one or more key columns. Every field of the SELECT has to be either one of the key columns or
+    an aggregate, and a single output row is produced per group.
+    """
+
+    keyword = 'GROUP BY'
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.columns = None
+        self.output_fields = None
+
+    def validate(self):
+        self.columns = [column for token in self.expression_buffer for column in token.split(',') if column]
+        if not self.columns:
+            raise ValueError('At least one column is required to group by')
+
+    def bind(self, select: SelectOperator):
+        for field in select.output_fields:
+            if isinstance(field, Aggregator):
+                continue
+            if type(field) is not Extractor or field.column not in self.columns:
+                raise ValueError(f'{field.column or "*"} must be aggregated or appear in GROUP BY')
+        self.output_fields = select.output_fields
+
+    @property
+    def max_groups(self) -> int:
+        return configuration.get('max_groups', DEFAULT_MAX_GROUPS)
+
+    def input_columns(self, table: Table) -> List[str]:
+        return list(dict.fromkeys(self.columns + _field_columns(self.output_fields, table)))
+
+    def describe(self, table: Table) -> str:
+        return f'{", ".join(self.columns)} by hash aggregation, at most {self.max_groups} groups'
+
+    def apply(self, data=None):
+        return self.output_rows(group_aggregate(self.columns, self.output_fields, data, self.max_groups))
+
+    def output_rows(self, groups: list):
+        key_positions = {column: position for position, column in enumerate(self.columns)}
+        for key, values in groups:
+            yield tuple(key[key_positions[field.column]] if field.is_streaming else value
+                        for field, value in zip(self.output_fields, values))
+
+    def state(self):
+        return ParserState.POST_GROUP_BY
+
+    def __repr__(self) -> str:
+        return f'<GROUP BY {" ".join(self.expression_buffer)}>'
+
+
 class LimitOperator(Operator):
+    keyword = 'LIMIT'
 
     def __init__(self) -> None:
         super().__init__()
         self.limit = None
 
     def apply(self, data=None):
-        return data[:self.limit]
+        # Stops pulling rows from upstream operators once the limit is reached
+        if isinstance(data, TableScan):
+            return data.limit(self.limit)
+        return islice(data, self.limit)
 
     def validate(self):
         if len(self.expression_buffer) != 1:
             raise ValueError(f'invalid limit {self.expression_buffer}')
+        if self.expression_buffer[0] != PLACEHOLDER:
+            self.limit = self._parse_limit(self.expression_buffer[0])
 
-        # TODO this might throw: raise a better error here
+    @staticmethod
+    def _parse_limit(value: str) -> int:
         try:
-            self.limit = int(self.expression_buffer[0])
+            return int(value)
         except ValueError:
-            raise ValueError(f'non numeric limit {self.expression_buffer[0]}')
+            raise ValueError(f'non numeric limit {value}')
+
+    @property
+    def parameters(self) -> int:
+        return 1 if self.limit is None else 0
+
+    def bind_parameters(self, values):
+        if not self.parameters:
+            return self
+
+        bound = LimitOperator()
+        bound.expression_buffer = self.expression_buffer
+        bound.limit = self._parse_limit(next(values))
+        return bound
 
     def state(self):
         return ParserState.POST_LIMIT
@@ -172,7 +372,112 @@ class LimitOperator(Operator):
         return f'<LIMIT {" ".join(self.expression_buffer)}>'
 
 
+class OrderByOperator(Operator):
+    """
+    Sorts rows by one or more keys, each ascending unless followed by DESC. Rows are sorted by table columns, or by the
+    output columns once they are grouped or aggregated. With a LIMIT only the first rows are kept, in a bounded heap,
+    and a full sort spills sorted runs to disk once the keys outgrow the sort budget.
+    """
+
+    keyword = 'ORDER BY'
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.keys = None
+        # The positions of the keys in grouped or aggregated output rows, otherwise rows are sorted by table columns
+        self.positions = None
+
+    def validate(self):
+        self.keys = []
+        for key in SORT_KEY_SEPARATOR.split(' '.join(self.expression_buffer)):
+            column, direction = key.strip(), 'ASC'
+            if column.endswith((' ASC', ' DESC')):
+                column, direction = column.rsplit(None, 1)
+            if not column:
+                continue
+            if not is_aggregate(column) and len(column.split()) > 1:
+                raise ValueError(f'invalid sort key {key.strip()}')
+            self.keys.append((column, direction == 'DESC'))
+
+        if not self.keys:
+            raise ValueError('At least one column is required to order by')
+
+    def bind(self, output_fields: list):
+        """
+        Sorts the output rows of a GROUP BY or of aggregates, by the columns or aggregates of the SELECT they hold
+        """
+        self.positions = [self._output_position(output_fields, column) for column, _ in self.keys]
+
+    @staticmethod
+    def _output_position(output_fields: list, column: str) -> int:
+        aggregator = Aggregator.from_string(column) if is_aggregate(column) else None
+        for position, field in enumerate(output_fields):
+            if aggregator is None and type(field) in (Extractor, Distinct) and field.column == column:
+                return position
+            if aggregator is not None and type(field) is type(aggregator) and vars(field) == vars(aggregator):
+                return position
+        raise ValueError(f'{column} must appear in the SELECT to order its output by it')
+
+    @property
+    def sort_budget(self) -> int:
+        return configuration.get('sort_budget', DEFAULT_SORT_BUDGET)
+
+    def input_columns(self, table: Table) -> List[str]:
+        # Grouped rows are sorted by values they already hold
+        return [column for column, _ in self.keys] if self.positions is None else []
+
+    def describe(self, table: Table, limit: int = None) -> str:
+        keys = ', '.join(f'{column} DESC' if descending else column for column, descending in self.keys)
+        if limit is not None:
+            return f'{keys} keeping the top {limit} rows in a heap'
+        return f'{keys} by external sort, spilling over {self.sort_budget // (1024 * 1024)} MB'
+
+    def _items(self, data):
+        """
+        (key, position, payload) for every row, payloads are row ids when sorting a table scan
+        """
+        position = 0
+        caches = [{} for _ in self.keys]
+        if isinstance(data, TableScan):
+            for row_ids in data.row_id_batches(BATCH_SIZE):
+                components = [sort_components(data.table.values(column, row_ids), descending, cache)
+                              for (column, descending), cache in zip(self.keys, caches)]
+                yield from zip(zip(*components), range(position, position + len(row_ids)), row_ids)
+                position += len(row_ids)
+            return
+
+        for batch in iter(lambda: list(islice(data, BATCH_SIZE)), []):
+            if self.positions is None:
+                columns = [[row[column] for row in batch] for column, _ in self.keys]
+            else:
+                columns = [[row[index] for row in batch] for index in self.positions]
+            components = [sort_components(values, descending, cache)
+                          for values, (_, descending), cache in zip(columns, self.keys, caches)]
+            yield from zip(zip(*components), range(position, position + len(batch)), batch)
+            position += len(batch)
+
+    def apply(self, data=None, limit: int = None):
+        items = self._items(data if isinstance(data, TableScan) else iter(data))
+        if limit is not None:
+            ordered = heapq.nsmallest(limit, items)
+        else:
+            ordered = external_sort(items, self.sort_budget)
+
+        payloads = (payload for _, _, payload in ordered)
+        if isinstance(data, TableScan):
+            return TableScan(data.table, array.array('q', payloads))
+        return payloads
+
+    def state(self):
+        return ParserState.POST_ORDER_BY
+
+    def __repr__(self) -> str:
+        return f'<ORDER BY {" ".join(self.expression_buffer)}>'
+
+
 class EndOperator(Operator):
+    keyword = ';'
+
     def apply(self, data=None):
         pass
 
@@ -190,13 +495,23 @@ class EndOperator(Operator):
 VALID_NEXT_OPERATOR_STATES = {
     ParserState.INIT: (SelectOperator,),
     ParserState.POST_SELECT: (FromOperator, LimitOperator,),
-    ParserState.POST_FROM: (WhereOperator, LimitOperator, EndOperator,),
-    ParserState.POST_WHERE: (LimitOperator, EndOperator,),
+    ParserState.POST_FROM: (WhereOperator, GroupByOperator, OrderByOperator, LimitOperator, EndOperator,),
+    ParserState.POST_WHERE: (GroupByOperator, OrderByOperator, LimitOperator, EndOperator,),
+    ParserState.POST_GROUP_BY: (OrderByOperator, LimitOperator, EndOperator,),
+    ParserState.POST_ORDER_BY: (LimitOperator, EndOperator,),
     ParserState.POST_LIMIT: (EndOperator,),
     ParserState.END: (),
 }
 
 
+def _field_columns(output_fields, table: Table) -> List[str]:
+    columns = []
+    for field in output_fields:
+        # A `*` reads every column
+        columns.extend(table.column_names if isinstance(field, MultiExtractor) else [field.column])
+    return columns
+
+
 class InvalidStateException(ValueError):
 
     def __init__(self, message, current_state, operator) -> None:
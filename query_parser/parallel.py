@@ -0,0 +1,81 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from query_parser.operators import configuration
+from query_parser.plan_cache import plan_cache
+from query_parser.query import Query
+from query_parser.table import Table
+from query_parser.table_cache import table_cache
+
+# Tables with fewer rows than this are always scanned serially, the pool round trips would cost more than the scan
+DEFAULT_PARALLEL_THRESHOLD = 100000
+
+
+def aggregate_partition(query_string: str, mtime: float, size: int, start: int, stop: int):
+    """
+    Runs the WHERE and the partial aggregation of a query over a range of rows of its table, in a worker process
+    """
+    query, = plan_cache.parse(query_string)
+    cached = table_cache.get(configuration['data_path'], query.tables[0])
+    if (cached.mtime, cached.size) != (mtime, size):
+        raise ValueError(f'Data source {cached.name} changed while it was being queried')
+    return query.aggregate_partition(cached.table, range(start, stop))
+
+
+class ParallelScan(object):
+    """
+    Scans large tables in a pool of worker processes. The rows of the table are split into one range per process,
+    every worker filters and aggregates its range of its own copy of the table, and the partial aggregates are merged
+    in order by the process running the query. Only aggregating queries are run in parallel, the rows of other queries
+    would cost more to send back than to produce.
+    """
+
+    def __init__(self, threshold: int = DEFAULT_PARALLEL_THRESHOLD) -> None:
+        super().__init__()
+        self.threshold = threshold
+        self.processes = 0
+        self._pool = None
+
+    def start(self, processes: int, initializer=None, initargs=()):
+        logging.info(f'starting {processes} scan worker processes')
+        self.processes = processes
+        self._pool = ProcessPoolExecutor(processes, initializer=initializer, initargs=initargs)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def partitions(self, query: Query, table: Table) -> Optional[List[range]]:
+        """
+        The ranges of rows of the table the query is split into, or None when it runs serially
+        """
+        num_rows = table.num_rows
+        if self._pool is None or query.text is None:
+            return None
+        if not num_rows or num_rows < self.threshold or not query.partitionable(table):
+            return None
+
+        size = -(-num_rows // self.processes)
+        return [range(start, min(start + size, num_rows)) for start in range(0, num_rows, size)]
+
+    def execute(self, query: Query):
+        """
+        The output rows of the query, which runs serially unless it is worth splitting up
+        """
+        if self._pool is None or query.text is None:
+            return query.execute_rows()
+
+        cached = table_cache.get(configuration['data_path'], query.tables[0])
+        partitions = self.partitions(query, cached.table)
+        if partitions is None:
+            return query.execute_rows()
+
+        futures = [self._pool.submit(aggregate_partition, query.text, cached.mtime, cached.size,
+                                     partition.start, partition.stop)
+                   for partition in partitions]
+        return query.merge_partitions(future.result() for future in futures)
+
+
+parallel_scan = ParallelScan()
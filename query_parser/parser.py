@@ -1,7 +1,7 @@
 import logging
 from typing import List
 
-from query_parser.operators import OPERATOR_KEYWORDS, ParserState, is_operator_state_valid, \
+from query_parser.operators import OPERATOR_KEYWORDS, COMPOUND_KEYWORDS, ParserState, is_operator_state_valid, \
     InvalidStateException, Operator
 from query_parser.query import Query
 
@@ -22,9 +22,20 @@ class QueryParser(object):
     def _cleanup_final_token(self, token, index):
         if token != ';' and token.endswith(';'):
             token = token[:-1]
+            self.tokens[index] = token
             self.tokens.insert(index + 1, ';')
         return token
 
+    @staticmethod
+    def _join_compound_keywords(tokens):
+        joined = []
+        for token in tokens:
+            if joined and COMPOUND_KEYWORDS.get(joined[-1]) == token:
+                joined[-1] = f'{joined[-1]} {token}'
+            else:
+                joined.append(token)
+        return joined
+
     def _finalize_operator(self):
         # Push the collected expression buffer to operator
         self.operator.expression_buffer = self.expression_buffer
@@ -48,7 +59,8 @@ class QueryParser(object):
 
         # Handle end of query
         if self.state == ParserState.END:
-            queries.append(Query(self.operators))
+            queries.append(Query(self.operators, ' '.join(self.tokens[self.query_start:index + 1])))
+            self.query_start = index + 1
 
             # If we see an end of query before tokens run out, prepare to process the next query in string
             if index < len(self.tokens) - 1:
@@ -57,7 +69,8 @@ class QueryParser(object):
     def parse(self, query_string: str) -> List[Query]:
         queries = []
 
-        self.tokens = query_string.split()
+        self.tokens = self._join_compound_keywords(query_string.split())
+        self.query_start = 0
         for index, token in enumerate(self.tokens):
             token = self._cleanup_final_token(token, index)
 
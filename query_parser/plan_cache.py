@@ -0,0 +1,63 @@
+import threading
+from collections import OrderedDict
+from typing import List
+
+from query_parser.parser import QueryParser
+from query_parser.query import Query
+
+# The number of distinct requests whose parsed queries are kept
+DEFAULT_PLAN_CACHE_SIZE = 1024
+
+
+def normalize(query_string: str) -> str:
+    """
+    The parser only sees whitespace separated tokens, so requests differing in whitespace alone are the same request
+    """
+    return ' '.join(query_string.split())
+
+
+class PlanCache(object):
+    """
+    Keeps the validated queries of recently parsed requests, keyed by their normalized text, so a repeated request
+    skips tokenizing, parsing the select fields and building the filter expression. Parsed queries hold no state of
+    their own between executions and are shared by every thread running them.
+    """
+
+    def __init__(self, size: int = DEFAULT_PLAN_CACHE_SIZE) -> None:
+        super().__init__()
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+
+    def parse(self, query_string: str) -> List[Query]:
+        key = normalize(query_string)
+        with self._lock:
+            queries = self._plans.get(key)
+            if queries is not None:
+                self._plans.move_to_end(key)
+                self.hits += 1
+                return queries
+            self.misses += 1
+
+        # Requests which fail to parse raise here and are never cached
+        queries = QueryParser().parse(query_string)
+        with self._lock:
+            self._plans[key] = queries
+            while len(self._plans) > self.size:
+                self._plans.popitem(last=False)
+        return queries
+
+    def clear(self):
+        with self._lock:
+            self._plans.clear()
+
+    def __contains__(self, query_string: str) -> bool:
+        return normalize(query_string) in self._plans
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+
+plan_cache = PlanCache()
@@ -0,0 +1,72 @@
+"""
+Prepared statements, for requests which are sent over and over with different values.
+
+`PREPARE name AS SELECT ... WHERE a = ? AND b > ? LIMIT ?;` validates a query holding `?` placeholders in place of
+WHERE values or the LIMIT, and `EXECUTE name(x, 10, 5);` runs it with the placeholders replaced by the values in order.
+The parsed query is kept in the plan cache, so executing a statement never parses it again.
+"""
+import re
+from typing import List, Tuple
+
+from query_parser.parallel import parallel_scan
+from query_parser.plan_cache import plan_cache, normalize
+
+PREPARE_PATTERN = re.compile(r'^\s*PREPARE\s+(\w+)\s+AS\s+(.+)$', re.DOTALL)
+EXECUTE_PATTERN = re.compile(r'^\s*EXECUTE\s+(\w+)\s*\((.*)\)\s*;?\s*$', re.DOTALL)
+ARGUMENT_PATTERN = re.compile(r'\'[^\']*\'|"[^"]*"|[^,\s]+')
+
+
+def match_prepare(request: str):
+    """
+    The name and query of a PREPARE request, or None for any other request
+    """
+    match = PREPARE_PATTERN.match(request)
+    return (match.group(1), normalize(match.group(2))) if match else None
+
+
+def match_execute(request: str):
+    """
+    The name and parameter values of an EXECUTE request, or None for any other request
+    """
+    match = EXECUTE_PATTERN.match(request)
+    return (match.group(1), ARGUMENT_PATTERN.findall(match.group(2))) if match else None
+
+
+def execute_prepared(query_string: str, values: List[str]):
+    """
+    Runs a prepared query with its placeholders bound to the values
+    """
+    query, = plan_cache.parse(query_string)
+    return parallel_scan.execute(query.bind_parameters(values))
+
+
+class PreparedStatements(object):
+    """
+    The statements prepared on a single connection, by name
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._statements = {}
+
+    def prepare(self, name: str, query_string: str):
+        queries = plan_cache.parse(query_string)
+        if len(queries) != 1:
+            raise ValueError(f'A prepared statement holds a single query, got {len(queries)}')
+        self._statements[name] = query_string
+
+    def bind(self, name: str, values: List[str]) -> Tuple[str, List[str]]:
+        """
+        The query of the statement along with the values for its placeholders
+        """
+        query_string = self._statements.get(name)
+        if query_string is None:
+            raise ValueError(f'Prepared statement {name} does not exist')
+
+        query, = plan_cache.parse(query_string)
+        if len(values) != query.parameters:
+            raise ValueError(f'Expected {query.parameters} parameters, got {len(values)}')
+        return query_string, values
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._statements
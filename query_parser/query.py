@@ -1,14 +1,21 @@
 import logging
-from typing import List
+from functools import reduce
+from typing import Callable, List, Optional, Tuple
 
-from query_parser.operators import Operator, FromOperator, SelectOperator, LimitOperator, WhereOperator
+from query_parser.operators import Operator, FromOperator, SelectOperator, LimitOperator, WhereOperator, \
+    GroupByOperator, OrderByOperator
+from query_parser.aggregators import MultiExtractor, aggregate_states, group_states, merge_groups, finalize_groups
+from query_parser.expression_parser import PLACEHOLDER
+from query_parser.table import format_row, Table, TableScan
 
 
 class Query(object):
 
-    def __init__(self, operators: List[Operator]) -> None:
+    def __init__(self, operators: List[Operator], text: str = None) -> None:
         super().__init__()
         self.operators = operators
+        # The normalized text of the query, which parses back into the same query
+        self.text = text
 
         # These isinstance checks should probably be avoided!
         # We should probably also check there isnt more than one of these per query
@@ -16,6 +23,8 @@ class Query(object):
         self._from = None
         self._where = None
         self._limit = None
+        self._group_by = None
+        self._order_by = None
 
         for op in self.operators:
             if isinstance(op, FromOperator):
@@ -26,19 +35,246 @@ class Query(object):
                 self._limit = op
             if isinstance(op, WhereOperator):
                 self._where = op
+            if isinstance(op, GroupByOperator):
+                self._group_by = op
+            if isinstance(op, OrderByOperator):
+                self._order_by = op
+
+        if self._group_by:
+            self._group_by.bind(self._select)
+            if self._order_by:
+                self._order_by.bind(self._group_by.output_fields)
+        elif self._order_by and not self._select.is_streaming:
+            self._order_by.bind(self._select.output_fields)
+
+    @property
+    def tables(self) -> List[str]:
+        return [self._from.table_name]
+
+    @property
+    def parameters(self) -> int:
+        return sum(op.parameters for op in self.operators)
+
+    @property
+    def limit(self) -> Optional[int]:
+        return self._limit.limit if self._limit else None
+
+    def bind_parameters(self, values: List[str]) -> 'Query':
+        """
+        A query with every placeholder replaced by a value, in the order the placeholders appear in the query
+        """
+        if len(values) != self.parameters:
+            raise ValueError(f'Expected {self.parameters} parameters, got {len(values)}')
+
+        text = None
+        if self.text is not None:
+            tokens = iter(values)
+            text = ' '.join(next(tokens) if token == PLACEHOLDER else token for token in self.text.split())
+
+        values = iter(values)
+        return Query([op.bind_parameters(values) for op in self.operators], text)
 
     def __repr__(self) -> str:
         return f'operators: {" | ".join(repr(op) for op in self.operators)}'
 
     def execute(self):
-        data = self._from.apply()
+        for row in self.execute_rows():
+            yield format_row(row)
+
+    def stages(self) -> List[Tuple[Operator, Callable]]:
+        """
+        The operators running the query in the order they run, each with the function producing its output from the
+        output of the previous one
+        """
+        stages = [(self._from, self._from.apply)]
+        if self._where:
+            stages.append((self._where, self._where.apply))
+
+        if self._group_by:
+            # The limit applies to the groups, not to the rows going into them
+            stages.append((self._group_by, self._group_by.apply))
+            if self._order_by:
+                stages.append((self._order_by, self._order))
+            if self._limit:
+                stages.append((self._limit, self._limit.apply))
+        elif not self._select.is_streaming:
+            # Aggregates and DISTINCT values are sorted once computed, the limit applies to the rows going into them
+            if self._limit:
+                stages.append((self._limit, self._limit.apply))
+            stages.append((self._select, self._select.apply))
+            if self._order_by:
+                stages.append((self._order_by, self._order))
+        else:
+            if self._order_by:
+                stages.append((self._order_by, self._order))
+            if self._limit:
+                stages.append((self._limit, self._limit.apply))
+            stages.append((self._select, self._select.apply))
+        return stages
+
+    def describe(self, table: Table) -> List[Tuple[str, str]]:
+        """
+        The keyword of every operator running the query, in order, with how it runs against the table
+        """
+        return [(operator.keyword, operator.describe(table, self._order_limit) if operator is self._order_by
+                 else operator.describe(table)) for operator, _ in self.stages()]
+
+    def execute_rows(self, run_stage=None):
+        """
+        Runs the query, producing every output row as a tuple of values. The columns of a `*` are spread out into
+        separate values. Every stage is run through `run_stage(operator, stage, data)` when given, to observe it.
+        """
+        if self.parameters:
+            raise ValueError('Placeholders can only be used in prepared statements')
+
+        data = None
+        for operator, stage in self.stages():
+            data = stage(data) if run_stage is None else run_stage(operator, stage, data)
+
+        yield from self._output_rows(data)
+
+    def _order(self, data):
+        # With a LIMIT only the first rows are kept while sorting
+        return self._order_by.apply(data, self._order_limit)
+
+    @property
+    def _order_limit(self) -> Optional[int]:
+        # Without GROUP BY the limit of aggregates was already applied to the rows going into them
+        if self._group_by is None and not self._select.is_streaming:
+            return None
+        return self.limit
+
+    def partitionable(self, table: Table) -> bool:
+        """
+        Whether the query can run over separate ranges of the rows of the table whose partial aggregates are merged
+        afterwards. Queries answered from indexes or stopping early at a LIMIT are better off running serially.
+        """
+        if not self.merges_partitions:
+            return False
+
+        if self._where is None:
+            return not all(field.counts_rows for field in self._select.output_fields)
+        return self._filters_every_row(table)
+
+    @property
+    def merges_partitions(self) -> bool:
+        """
+        Whether the output of the query can be produced from the merged partial aggregates of separate ranges of rows
+        """
+        return not self.parameters and (
+            self._group_by is not None or not (self._select.is_streaming or self._limit or self._order_by))
+
+    def _filters_every_row(self, table: Table) -> bool:
+        criteria = self._where.filter_criteria
+        return criteria.bitmap(table) is None and criteria.candidates(table) is None
+
+    def filters_by_scan(self, table: Table) -> bool:
+        """
+        Whether the WHERE clause of the query is evaluated over every row of the table, rather than answered from its
+        indexes
+        """
+        return not self.parameters and self._where is not None and self._filters_every_row(table)
+
+    @property
+    def scan_limit(self) -> Optional[int]:
+        """
+        The number of rows satisfying the WHERE clause after which the query needs no more of them, None when it needs
+        every one of them
+        """
+        return self.limit if self._group_by is None and self._order_by is None else None
+
+    def aggregate_partition(self, table: Table, row_ids: range = None, states=None):
+        """
+        Filters a range of rows of the table, every row by default, and aggregates them, returning the states of the
+        output fields, or of every group, before they are finalized. The aggregation continues from the states of the
+        earlier ranges when they are given.
+        """
+        data = TableScan(table, row_ids)
         if self._where:
             data = self._where.apply(data)
+        return self.aggregate_filtered(data, states)
+
+    def aggregate_filtered(self, data: TableScan, states=None):
+        """
+        The partial aggregates of a scan of rows which already satisfy the WHERE clause, as by `aggregate_partition`
+        """
+        if self._group_by:
+            return group_states(self._group_by.columns, self._group_by.output_fields, data, self._group_by.max_groups,
+                                states)
+        return aggregate_states(self._select.output_fields, data, states)
+
+    @property
+    def output_fields(self) -> list:
+        return self._select.output_fields
+
+    @property
+    def is_grouped(self) -> bool:
+        return self._group_by is not None
+
+    @property
+    def filter_key(self) -> Optional[str]:
+        """
+        Identifies the WHERE clause of the query, queries with the same key select the same rows of a table
+        """
+        return repr(self._where.filter_criteria) if self._where else None
+
+    def input_columns(self, table: Table) -> List[str]:
+        """
+        Every column of the table read by the query
+        """
+        return list(dict.fromkeys(column for operator, _ in self.stages() for column in operator.input_columns(table)))
+
+    def filter_partition(self, table: Table, row_ids: range):
+        """
+        The ids of the rows in a range of rows of the table which satisfy the WHERE clause
+        """
+        if self._where is None:
+            return iter(row_ids)
+        return self._where.apply(TableScan(table, row_ids)).row_ids()
+
+    def execute_filtered(self, data: TableScan):
+        """
+        Runs the query over a scan of the rows of its table which already satisfy its WHERE clause
+        """
+        for operator, stage in self.stages():
+            if operator is not self._from and operator is not self._where:
+                data = stage(data)
+        yield from self._output_rows(data)
+
+    def merge_partitions(self, partitions):
+        """
+        The output rows of the query from the partial aggregates of consecutive row ranges, in order
+        """
+        if self._group_by:
+            fields = self._group_by.output_fields
+            groups = {}
+            for partition in partitions:
+                merge_groups(fields, groups, partition, self._group_by.max_groups)
+            data = self._group_by.output_rows(finalize_groups(fields, groups))
+            if self._order_by:
+                data = self._order(data)
+            if self._limit:
+                data = self._limit.apply(data)
+        else:
+            fields = self._select.output_fields
+            states = reduce(lambda states, other: [field.merge(state, other_state)
+                                                   for field, state, other_state in zip(fields, states, other)],
+                            partitions)
+            data = self._select.output_rows([field.finalize(state) for field, state in zip(fields, states)])
 
-        if self._limit:
-            data = self._limit.apply(data)
+        yield from self._output_rows(data)
 
-        data = self._select.apply(data)
+    def _output_rows(self, data):
+        if not any(isinstance(field, MultiExtractor) for field in self._select.output_fields):
+            for row in data:
+                yield tuple(row)
+            return
 
         for row in data:
-            yield ', '.join([str(item) for item in row])
+            values = []
+            for value in row:
+                if isinstance(value, tuple):
+                    values.extend(value)
+                else:
+                    values.append(value)
+            yield tuple(values)
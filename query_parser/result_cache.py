@@ -0,0 +1,179 @@
+import copy
+import logging
+import sys
+import threading
+from collections import OrderedDict
+from typing import List
+
+from query_parser.operators import configuration
+from query_parser.plan_cache import plan_cache, normalize
+from query_parser.shared_scan import shared_scan
+from query_parser.table_cache import table_cache
+
+
+def estimate_size(row: tuple) -> int:
+    return sys.getsizeof(row) + sum(map(sys.getsizeof, row))
+
+
+class PartialAggregates(object):
+    """
+    The states of the aggregates of a query before they are finalized, over the first rows of a table as of one of its
+    loads. They are brought up to date with the rows appended to the table since by aggregating those alone.
+    """
+
+    def __init__(self, load_id: int, num_rows: int, states) -> None:
+        super().__init__()
+        self.load_id = load_id
+        self.num_rows = num_rows
+        self.states = states
+
+
+class CachedResult(object):
+    """
+    The output rows of a request, along with the versions of the tables it read, and the partial aggregates of its
+    queries when the tables are refreshed with their appended rows
+    """
+
+    def __init__(self, rows: list, versions: dict, nbytes: int, partials: List[PartialAggregates] = None) -> None:
+        super().__init__()
+        self.rows = rows
+        self.versions = versions
+        self.nbytes = nbytes
+        self.partials = partials
+
+    def is_fresh(self, data_path: str) -> bool:
+        try:
+            return all(table_cache.version(data_path, name) == version for name, version in self.versions.items())
+        except ValueError:
+            return False
+
+
+class ResultCache(object):
+    """
+    Caches the output rows of whole requests keyed by their normalized text. A cached result is only used while every
+    table it read is at the version it was computed from, checked from file metadata alone, so a hit never parses the
+    request or touches table data. The least recently used results are evicted once the byte budget is exceeded, and
+    a budget of 0 disables the cache.
+
+    When the table cache refreshes tables with the rows appended to their files, requests made up of aggregating
+    queries also keep the partial aggregates of every query. A stale result is then refreshed by aggregating only the
+    rows appended since, as long as the table was not loaded again in the meantime.
+    """
+
+    def __init__(self, budget: int = 0) -> None:
+        super().__init__()
+        self.budget = budget
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def execute(self, query_string: str):
+        """
+        The output rows of every query of the request, from the cache when possible
+        """
+        if not self.budget:
+            return self._run(plan_cache.parse(query_string))
+
+        key = normalize(query_string)
+        data_path = configuration['data_path']
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None and cached.is_fresh(data_path):
+                self._results.move_to_end(key)
+                self.hits += 1
+                return iter(cached.rows)
+
+            previous = cached.partials if cached is not None else None
+            if previous is None:
+                self.misses += 1
+            else:
+                self.refreshes += 1
+
+        queries = plan_cache.parse(query_string)
+        # Versions are taken before running, a table changing meanwhile leaves a result that is already stale
+        versions = {name: table_cache.version(data_path, name) for query in queries for name in query.tables}
+        return self._run_and_store(key, queries, versions, previous)
+
+    @staticmethod
+    def _run(queries):
+        return shared_scan.execute(queries)
+
+    @staticmethod
+    def _keeps_partials(queries) -> bool:
+        return table_cache.incremental and all(query.merges_partitions for query in queries)
+
+    @staticmethod
+    def _aggregate(queries, partials: List[PartialAggregates], previous: List[PartialAggregates] = None):
+        """
+        The output rows of aggregating queries, continuing from their previous partial aggregates when their tables
+        only had rows appended since, and adding the new partial aggregates of every query to the given list
+        """
+        data_path = configuration['data_path']
+        for i, query in enumerate(queries):
+            cached = table_cache.get(data_path, query.tables[0])
+            table = cached.table
+            partial = previous[i] if previous is not None else None
+            if partial is None or partial.load_id != cached.load_id:
+                states = query.aggregate_partition(table)
+            else:
+                # The cached states may be read by other requests at the same time, a copy of them is updated
+                states = copy.deepcopy(partial.states)
+                if table.num_rows > partial.num_rows:
+                    states = query.aggregate_partition(table, range(partial.num_rows, table.num_rows), states)
+            partials.append(PartialAggregates(cached.load_id, table.num_rows, states))
+            yield from query.merge_partitions([states])
+
+    def _run_and_store(self, key: str, queries, versions: dict, previous: List[PartialAggregates] = None):
+        partials = None
+        # Partial aggregates take about as much memory as the rows they are finalized into
+        scale = 1
+        if self._keeps_partials(queries):
+            partials = []
+            output = self._aggregate(queries, partials, previous)
+            scale = 2
+        else:
+            output = self._run(queries)
+
+        rows = []
+        nbytes = 0
+        for row in output:
+            if rows is not None:
+                rows.append(row)
+                nbytes += estimate_size(row) * scale
+                if nbytes > self.budget:
+                    # Too large to ever be cached, stop collecting and keep streaming
+                    rows = None
+            yield row
+
+        if rows is not None:
+            self._store(key, CachedResult(rows, versions, nbytes, partials))
+
+    def _store(self, key: str, result: CachedResult):
+        with self._lock:
+            previous = self._results.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous.nbytes
+            self._results[key] = result
+            self.nbytes += result.nbytes
+
+            while self.nbytes > self.budget:
+                evicted_key, evicted = self._results.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                logging.debug(f'evicting cached result of {evicted_key} ({evicted.nbytes} bytes)')
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self.nbytes = 0
+
+    def __contains__(self, query_string: str) -> bool:
+        return normalize(query_string) in self._results
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+
+result_cache = ResultCache()
@@ -0,0 +1,221 @@
+import array
+import logging
+from collections import OrderedDict
+from itertools import islice
+from typing import Dict, List, Optional
+
+from query_parser.aggregators import aggregate_states
+from query_parser.operators import configuration
+from query_parser.parallel import parallel_scan
+from query_parser.query import Query
+from query_parser.table import Table, TableScan, BATCH_SIZE
+from query_parser.table_cache import table_cache
+
+# The number of rows of a shared scan handed to the queries at a time, a multiple of the batches they evaluate
+SHARED_BATCH_SIZE = 16 * BATCH_SIZE
+
+
+class SharedQuery(object):
+    """
+    A query fed the rows of a scan shared with other queries, one range of rows at a time, once they are filtered by
+    its WHERE clause. Aggregating queries update their partial aggregates with every range, other queries keep the ids
+    of the rows and run the rest of the query over them once the scan is over.
+    """
+
+    def __init__(self, query: Query, table: Table, aggregating: bool) -> None:
+        super().__init__()
+        self.query = query
+        self.table = table
+        self.aggregating = aggregating
+        self.limit = None if self.aggregating else query.scan_limit
+        self.states = None
+        self.row_ids = array.array('q')
+        self.done = self.limit == 0
+        # A query failing during the scan raises once its output is reached, after the output of the queries before it
+        self.error = None
+
+    def feed(self, selected):
+        try:
+            if self.aggregating:
+                self.states = self.query.aggregate_filtered(TableScan(self.table, selected), self.states)
+                return
+
+            if self.limit is not None:
+                selected = islice(selected, self.limit - len(self.row_ids))
+            self.row_ids.extend(selected)
+            self.done = self.limit is not None and len(self.row_ids) >= self.limit
+        except ValueError as e:
+            self.fail(e)
+
+    def fail(self, error: ValueError):
+        self.error = error
+        self.done = True
+
+    def output(self):
+        if self.error is not None:
+            raise self.error
+        if self.aggregating:
+            return self.query.merge_partitions([self.states])
+        return self.query.execute_filtered(TableScan(self.table, self.row_ids))
+
+
+class SharedFilter(object):
+    """
+    The queries of a shared scan with the same WHERE clause. The clause is evaluated once for every range of rows, and
+    the aggregates of the queries without a GROUP BY are updated together, so that each column they read is read once.
+    """
+
+    def __init__(self, shared_queries: List[SharedQuery]) -> None:
+        super().__init__()
+        self.shared_queries = shared_queries
+        self.table = shared_queries[0].table
+        # Any of the queries evaluates the clause for all of them
+        self.query = shared_queries[0].query
+        self.combined = [shared_query for shared_query in shared_queries
+                         if shared_query.aggregating and not shared_query.query.is_grouped]
+
+    @property
+    def done(self) -> bool:
+        return all(shared_query.done for shared_query in self.shared_queries)
+
+    def feed(self, row_ids: range):
+        active = [shared_query for shared_query in self.shared_queries if not shared_query.done]
+        try:
+            selected = row_ids
+            if self.query.filter_key is not None:
+                selected = array.array('q', self.query.filter_partition(self.table, row_ids))
+        except ValueError as e:
+            for shared_query in active:
+                shared_query.fail(e)
+            return
+
+        combined = [shared_query for shared_query in self.combined if not shared_query.done]
+        if combined:
+            self._aggregate(combined, selected)
+        for shared_query in active:
+            if shared_query not in combined:
+                shared_query.feed(selected)
+
+    def _aggregate(self, combined: List[SharedQuery], selected):
+        fields = [field for shared_query in combined for field in shared_query.query.output_fields]
+        states = None
+        if combined[0].states is not None:
+            states = [state for shared_query in combined for state in shared_query.states]
+
+        try:
+            states = aggregate_states(fields, TableScan(self.table, selected), states)
+        except ValueError as e:
+            for shared_query in combined:
+                shared_query.fail(e)
+            return
+
+        start = 0
+        for shared_query in combined:
+            stop = start + len(shared_query.query.output_fields)
+            shared_query.states = states[start:stop]
+            start = stop
+
+
+class SharedScan(object):
+    """
+    Runs the queries of a request which read the same table in a single pass over it, handing every range of rows to
+    all of them in turn. Queries with the same WHERE clause evaluate it once, and their aggregates read each column
+    once. Only queries evaluating every row of the table take part: aggregating queries and queries with a WHERE clause
+    which no index answers. Queries split across the scan processes run by themselves.
+
+    The output still comes in the order of the queries of the request, the shared pass runs when the output of the
+    first of its queries is needed.
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        super().__init__()
+        self.enabled = enabled
+
+    def execute(self, queries: List[Query]):
+        """
+        The output rows of every query, in order
+        """
+        shared = self._share(queries) if self.enabled and len(queries) > 1 else {}
+        scanned = set()
+        for query in queries:
+            shared_query = shared.get(id(query))
+            if shared_query is None:
+                yield from parallel_scan.execute(query)
+                continue
+
+            table = shared_query.table
+            if table.name not in scanned:
+                scanned.add(table.name)
+                self._scan(table, [other for other in shared.values() if other.table is table])
+            yield from shared_query.output()
+
+    @staticmethod
+    def _share(queries: List[Query]) -> Dict[int, SharedQuery]:
+        """
+        The queries which take part in a shared scan, keyed by their id. A table is only shared by two queries or more.
+        """
+        names = [query.tables[0] for query in queries]
+        shared = {}
+        for name in set(names):
+            if names.count(name) < 2:
+                continue
+
+            # Queries reading a table which fails to load raise by themselves, in their turn
+            try:
+                table = table_cache.get(configuration['data_path'], name).table
+            except ValueError:
+                continue
+
+            group = [shared_query for shared_query in (SharedScan._shared_query(query, table)
+                                                       for query in queries if query.tables[0] == name)
+                     if shared_query is not None]
+            if len(group) > 1:
+                shared.update((id(shared_query.query), shared_query) for shared_query in group)
+        return shared
+
+    @staticmethod
+    def _shared_query(query: Query, table: Table) -> Optional[SharedQuery]:
+        """
+        The query fed by a shared scan of the table, None when it reads no more than some rows picked by indexes or
+        when it is invalid, so that it fails by itself in its turn
+        """
+        try:
+            for column in query.input_columns(table):
+                table.column_type(column)
+
+            # Looking the WHERE clause up in the indexes is done once, it may build long lists of row ids
+            if query.filter_key is None:
+                aggregating = query.partitionable(table)
+                scans = aggregating
+            else:
+                scans = query.filters_by_scan(table)
+                aggregating = scans and query.merges_partitions
+
+            if not scans or (aggregating and parallel_scan.partitions(query, table) is not None):
+                return None
+        except ValueError:
+            return None
+        return SharedQuery(query, table, aggregating)
+
+    @staticmethod
+    def _scan(table: Table, shared_queries: List[SharedQuery]):
+        by_filter = OrderedDict()
+        for shared_query in shared_queries:
+            by_filter.setdefault(shared_query.query.filter_key, []).append(shared_query)
+        filters = [SharedFilter(group) for group in by_filter.values()]
+        logging.debug(f'sharing a scan of {table.name} between {len(shared_queries)} queries, '
+                      f'with {len(filters)} distinct filters')
+
+        num_rows = table.num_rows
+        # Empty tables get a single empty range, so that aggregates are still initialized
+        for start in range(0, max(num_rows, 1), SHARED_BATCH_SIZE):
+            active = [shared_filter for shared_filter in filters if not shared_filter.done]
+            if not active:
+                return
+
+            row_ids = range(start, min(start + SHARED_BATCH_SIZE, num_rows))
+            for shared_filter in active:
+                shared_filter.feed(row_ids)
+
+
+shared_scan = SharedScan()
@@ -0,0 +1,160 @@
+"""
+Fixed size summaries of a column, for aggregates which would otherwise keep every value. Sketches of different parts of
+a dataset merge into the sketch of the whole dataset.
+"""
+import hashlib
+import math
+from collections import Counter
+
+# Registers of a HyperLogLog are addressed by this many bits of the hash, for a standard error of about 0.8%
+HLL_PRECISION = 14
+
+# Values are counted exactly until a HyperLogLog has seen this many distinct hashes
+HLL_SPARSE_LIMIT = 1024
+
+# The size of the largest compactor of a KLL sketch, which keeps the rank error within about 1%
+KLL_CAPACITY = 400
+KLL_SHRINK = 2 / 3
+
+_INVERSE_POWERS = [2.0 ** -rank for rank in range(65)]
+
+
+def stable_hash(value) -> int:
+    """
+    A 64 bit hash of the text of a value, which is the same in every process, unlike hash() of a string
+    """
+    return int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog(object):
+    """
+    Estimates the number of distinct values. The hashes of the values are kept as they are while there are few of them,
+    which counts small cardinalities exactly, and folded into registers holding the longest run of leading zeros seen
+    by each of them afterwards.
+    """
+
+    def __init__(self, precision: int = HLL_PRECISION) -> None:
+        super().__init__()
+        self.precision = precision
+        self.hashes = set()
+        self.registers = None
+
+    def update(self, values):
+        hashes = {stable_hash(value) for value in set(values) if value is not None}
+        if self.registers is None:
+            self.hashes.update(hashes)
+            if len(self.hashes) > HLL_SPARSE_LIMIT:
+                self._to_registers()
+        else:
+            self._add_to_registers(hashes)
+
+    def _to_registers(self):
+        self.registers = bytearray(1 << self.precision)
+        self._add_to_registers(self.hashes)
+        self.hashes = None
+
+    def _add_to_registers(self, hashes):
+        registers = self.registers
+        bits = 64 - self.precision
+        mask = (1 << bits) - 1
+        for value in hashes:
+            index = value >> bits
+            rank = bits - (value & mask).bit_length() + 1
+            if rank > registers[index]:
+                registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        if self.registers is None and other.registers is None:
+            self.hashes.update(other.hashes)
+            if len(self.hashes) > HLL_SPARSE_LIMIT:
+                self._to_registers()
+            return self
+
+        if self.registers is None:
+            self._to_registers()
+        if other.registers is None:
+            self._add_to_registers(other.hashes)
+        else:
+            self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def estimate(self) -> int:
+        if self.registers is None:
+            return len(self.hashes)
+
+        size = len(self.registers)
+        ranks = Counter(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / size) * size * size / sum(
+            count * _INVERSE_POWERS[rank] for rank, count in ranks.items())
+
+        # Linear counting is more accurate while many registers are still empty
+        empty = ranks.get(0, 0)
+        if estimate <= 2.5 * size and empty:
+            estimate = size * math.log(size / empty)
+        return round(estimate)
+
+
+class KllSketch(object):
+    """
+    Estimates quantiles from a hierarchy of compactors. Items at level h stand for 2 ** h values, once a level fills up
+    it is sorted and every other item is promoted to the next level. Lower levels hold fewer items, so the sketch stays
+    within a few times its capacity no matter how many values it has seen.
+    """
+
+    def __init__(self, capacity: int = KLL_CAPACITY) -> None:
+        super().__init__()
+        self.capacity = capacity
+        self.levels = [[]]
+        # Compactions alternate between keeping the odd and the even items of each level
+        self.offsets = [0]
+        self.count = 0
+
+    def _level_capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(self.capacity * KLL_SHRINK ** depth))
+
+    def update(self, numbers):
+        self.levels[0].extend(numbers)
+        self.count += len(numbers)
+        self._compress()
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) >= self._level_capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                    self.offsets.append(0)
+                items.sort()
+                offset = self.offsets[level]
+                self.offsets[level] ^= 1
+                # An odd item out stays behind at its level
+                keep = items.pop() if len(items) % 2 else None
+                self.levels[level + 1].extend(items[offset::2])
+                self.levels[level] = [keep] if keep is not None else []
+            level += 1
+
+    def merge(self, other: 'KllSketch') -> 'KllSketch':
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+            self.offsets.append(0)
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.count += other.count
+        self._compress()
+        return self
+
+    def quantile(self, fraction: float):
+        weighted = sorted((item, 1 << level) for level, items in enumerate(self.levels) for item in items)
+        if not weighted:
+            return None
+
+        total = sum(weight for _, weight in weighted)
+        rank = fraction * total
+        seen = 0
+        for item, weight in weighted:
+            seen += weight
+            if seen >= rank:
+                return item
+        return weighted[-1][0]
@@ -0,0 +1,122 @@
+import heapq
+import logging
+import pickle
+import sys
+import tempfile
+from itertools import islice
+
+from query_parser.table import NULL_TOKENS
+
+# Rows sorted in memory at once before the sorted runs are written out to disk
+DEFAULT_SORT_BUDGET = 64 * 1024 * 1024
+
+# Spilled runs are written and read back this many items at a time
+SPILL_BLOCK_SIZE = 4096
+
+NUMBER = 0
+STRING = 1
+MISSING = 2
+
+
+class Descending(object):
+    """
+    Wraps a value so that it sorts in reverse, for descending keys which can not simply be negated
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value) -> None:
+        self.value = value
+
+    def __lt__(self, other: 'Descending') -> bool:
+        return other.value < self.value
+
+    def __eq__(self, other: 'Descending') -> bool:
+        return self.value == other.value
+
+    def __getstate__(self):
+        return self.value
+
+    def __setstate__(self, value):
+        self.value = value
+
+
+def sort_component(value, descending: bool = False) -> tuple:
+    """
+    The part of a sort key for a single value. Numbers, including strings holding numbers, compare as numbers and come
+    before every other string, and missing values always come last.
+    """
+    if value is None or value in NULL_TOKENS:
+        return MISSING, 0
+
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return (STRING, Descending(value)) if descending else (STRING, value)
+
+    return NUMBER, -value if descending else value
+
+
+def sort_components(values, descending: bool, components: dict) -> list:
+    """
+    The sort key parts of a batch of values. Columns tend to repeat their values, so the parts of distinct values are
+    kept in the components dict, which is shared by every batch of the column.
+    """
+    result = []
+    for value in values:
+        component = components.get(value)
+        if component is None:
+            component = components[value] = sort_component(value, descending)
+        result.append(component)
+    return result
+
+
+def _estimate_size(item) -> int:
+    if isinstance(item, tuple):
+        return sys.getsizeof(item) + sum(map(_estimate_size, item))
+    if isinstance(item, Descending):
+        return sys.getsizeof(item) + sys.getsizeof(item.value)
+    return sys.getsizeof(item)
+
+
+def _write_run(run: list):
+    run.sort()
+    spill = tempfile.TemporaryFile()
+    for start in range(0, len(run), SPILL_BLOCK_SIZE):
+        pickle.dump(run[start:start + SPILL_BLOCK_SIZE], spill, pickle.HIGHEST_PROTOCOL)
+    spill.seek(0)
+    return spill
+
+
+def _read_run(spill):
+    with spill:
+        while True:
+            try:
+                yield from pickle.load(spill)
+            except EOFError:
+                return
+
+
+def external_sort(items, budget: int = DEFAULT_SORT_BUDGET):
+    """
+    Sorts (key, position, payload) items, where positions are unique so that payloads are never compared. Items are
+    sorted in memory while they fit in the budget, larger inputs are sorted in runs which are written to temporary
+    files and merged.
+    """
+    items = iter(items)
+    first = list(islice(items, 1))
+    if not first:
+        return iter(())
+
+    run_size = max(1, budget // _estimate_size(first[0]))
+    run = first + list(islice(items, run_size - 1))
+    if len(run) < run_size:
+        run.sort()
+        return iter(run)
+
+    runs = [_write_run(run)]
+    for run in iter(lambda: list(islice(items, run_size)), []):
+        runs.append(_write_run(run))
+
+    logging.info(f'sorting in {len(runs)} runs of {run_size} rows spilled to disk')
+    return heapq.merge(*map(_read_run, runs))
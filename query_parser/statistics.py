@@ -0,0 +1,301 @@
+from bisect import bisect_left
+from collections import Counter
+from typing import Optional
+
+from query_parser.table import Table, ColumnTable, Column, NumericColumn, StringColumn, NULL_TOKENS, infer_column
+
+# Buckets of the equi-depth histogram kept for every numeric column
+HISTOGRAM_BUCKETS = 32
+# Numeric columns with more values than this build their histogram from an evenly spaced sample
+HISTOGRAM_SAMPLE = 8192
+# String columns with at most this many distinct values keep the frequency of each of them
+MAX_TRACKED_VALUES = 1024
+# Row store tables, which have to type their values first, collect statistics over an evenly spaced sample of rows
+ROW_SAMPLE = 65536
+
+# The fraction of rows assumed to satisfy a comparison nothing is known about
+DEFAULT_SELECTIVITY = 1 / 3
+
+
+class ColumnStatistics(object):
+    """
+    A summary of the values of a column, collected the first time a filter on it is planned, used to estimate how many
+    rows satisfy a comparison. Estimates are fractions of all the rows of the table, missing values never satisfy a
+    comparison.
+    """
+
+    def __init__(self, value_type, rows: int, nulls: int, distinct: int, minimum=None, maximum=None, bounds=None,
+                 frequencies=None) -> None:
+        super().__init__()
+        self.value_type = value_type
+        self.rows = rows
+        self.nulls = nulls
+        self.distinct = distinct
+        self.minimum = minimum
+        self.maximum = maximum
+        # Values splitting the sorted values of a numeric column into buckets holding the same number of rows
+        self.bounds = bounds
+        # Value -> fraction of the rows holding it, for string columns with few distinct values
+        self.frequencies = frequencies
+
+    @property
+    def present(self) -> float:
+        return (self.rows - self.nulls) / self.rows if self.rows else 0.0
+
+    @property
+    def is_numeric(self) -> bool:
+        return self.value_type in (int, float)
+
+    def _comparable(self, value) -> bool:
+        if isinstance(value, bool):
+            return False
+        if self.is_numeric:
+            return isinstance(value, (int, float))
+        return isinstance(value, str)
+
+    def _fraction_below(self, value) -> float:
+        """
+        The estimated fraction of the present values of a numeric column which are smaller than the value
+        """
+        bounds = self.bounds
+        if value <= bounds[0]:
+            return 0.0
+        if value > bounds[-1]:
+            return 1.0
+
+        bucket = bisect_left(bounds, value) - 1
+        low, high = bounds[bucket], bounds[bucket + 1]
+        within = (value - low) / (high - low) if high > low else 0.5
+        return (bucket + within) / (len(bounds) - 1)
+
+    def equal(self, value) -> float:
+        if not self.rows or not self._comparable(value):
+            return DEFAULT_SELECTIVITY
+        if self.frequencies is not None:
+            return self.frequencies.get(value, 0.0)
+        if self.is_numeric and not self.minimum <= value <= self.maximum:
+            return 0.0
+        return self.present / self.distinct if self.distinct else 0.0
+
+    def less_than(self, value) -> float:
+        if not self.rows or not self._comparable(value):
+            return DEFAULT_SELECTIVITY
+        if self.frequencies is not None:
+            return sum(fraction for item, fraction in self.frequencies.items() if item < value)
+        if self.bounds:
+            return self.present * self._fraction_below(value)
+        return DEFAULT_SELECTIVITY
+
+    def greater_than(self, value) -> float:
+        if not self.rows or not self._comparable(value):
+            return DEFAULT_SELECTIVITY
+        if self.frequencies is not None:
+            return sum(fraction for item, fraction in self.frequencies.items() if item > value)
+        if self.bounds:
+            return max(0.0, self.present - self.less_than(value) - self.equal(value))
+        return DEFAULT_SELECTIVITY
+
+    @property
+    def _unique(self) -> float:
+        """
+        The fraction of the present values of the column which are distinct
+        """
+        return self.distinct / (self.rows - self.nulls)
+
+    def merge(self, other: 'ColumnStatistics') -> Optional['ColumnStatistics']:
+        """
+        The statistics of a column made up of the rows of this one followed by the rows of another, None when they
+        hold values of different types. Histograms and distinct counts of numeric columns are estimated from both.
+        """
+        rows = self.rows + other.rows
+        nulls = self.nulls + other.nulls
+        if other.rows == other.nulls or self.rows == self.nulls:
+            present = self if other.rows == other.nulls else other
+            return ColumnStatistics(present.value_type, rows, nulls, present.distinct, present.minimum,
+                                    present.maximum, present.bounds, _scaled(present.frequencies, present.rows, rows))
+        if self.is_numeric != other.is_numeric:
+            return None
+
+        minimum = min(self.minimum, other.minimum)
+        maximum = max(self.maximum, other.maximum)
+        if not self.is_numeric:
+            frequencies = None
+            if self.frequencies is not None and other.frequencies is not None:
+                frequencies = _scaled(self.frequencies, self.rows, rows)
+                for value, fraction in _scaled(other.frequencies, other.rows, rows).items():
+                    frequencies[value] = frequencies.get(value, 0.0) + fraction
+                if len(frequencies) > MAX_TRACKED_VALUES:
+                    frequencies = None
+            distinct = len(frequencies) if frequencies is not None else self.distinct + round(
+                other.distinct * self._unique)
+            return ColumnStatistics(str, rows, nulls, min(distinct, rows - nulls), minimum, maximum,
+                                    frequencies=frequencies)
+
+        value_type = float if float in (self.value_type, other.value_type) else int
+        # Values of the other rows outside the range of this one are new, values within it are new as often as values
+        # of this one are unique
+        outside = other._fraction_below(self.minimum)
+        if other.maximum > self.maximum:
+            outside += 1 - other._fraction_below(self.maximum)
+        distinct = self.distinct + round(other.distinct * (outside + (1 - outside) * self._unique))
+        return ColumnStatistics(value_type, rows, nulls, min(distinct, rows - nulls), minimum, maximum,
+                                self._merge_bounds(other, minimum, maximum))
+
+    def _merge_bounds(self, other: 'ColumnStatistics', minimum, maximum) -> list:
+        """
+        The bounds of the histogram of both columns, splitting the fractions of rows below every bound of either
+        histogram, weighted by the rows present in each of them, into buckets holding the same number of rows
+        """
+        weight = self.rows - self.nulls
+        other_weight = other.rows - other.nulls
+        points = sorted(set(self.bounds) | set(other.bounds))
+        below = [(weight * self._fraction_below(point) + other_weight * other._fraction_below(point)) /
+                 (weight + other_weight) for point in points]
+
+        buckets = len(self.bounds) - 1
+        bounds = [minimum]
+        for bucket in range(1, buckets):
+            target = bucket / buckets
+            i = min(bisect_left(below, target), len(points) - 1)
+            low, high = below[i - 1] if i else 0.0, below[i]
+            within = (target - low) / (high - low) if high > low else 0.0
+            bounds.append(points[i - 1] + within * (points[i] - points[i - 1]) if i else points[0])
+        bounds.append(maximum)
+        return bounds
+
+    def __repr__(self) -> str:
+        return f'<STATISTICS rows={self.rows} nulls={self.nulls} distinct={self.distinct} ' \
+               f'min={self.minimum} max={self.maximum}>'
+
+
+def _numeric_statistics(column: Column, buckets: int) -> ColumnStatistics:
+    values = column.data
+    if column.nulls:
+        values = [value for value, null in zip(values, column.nulls) if not null]
+    if not values:
+        return ColumnStatistics(column.value_type, len(column), len(column), 0)
+
+    step = max(1, len(values) // HISTOGRAM_SAMPLE)
+    sample = sorted(values[::step])
+    last = len(sample) - 1
+    bounds = [sample[i * last // buckets] for i in range(buckets)] + [sample[-1]]
+    bounds[0] = min(values)
+    bounds[-1] = max(values)
+    return ColumnStatistics(column.value_type, len(column), len(column) - len(values), len(set(values)),
+                            bounds[0], bounds[-1], bounds)
+
+
+def _string_statistics(column: StringColumn) -> ColumnStatistics:
+    rows = len(column)
+    counts = Counter()
+    for code, count in Counter(column.codes).items():
+        value = column.dictionary[code]
+        # Missing values are kept in the dictionary as the token they were written with
+        if column.nulls is None or value not in NULL_TOKENS:
+            counts[value] += count
+    nulls = rows - sum(counts.values())
+
+    frequencies = None
+    if len(counts) <= MAX_TRACKED_VALUES:
+        frequencies = {value: count / rows for value, count in counts.items()}
+    values = sorted(counts)
+    return ColumnStatistics(str, rows, nulls, len(counts), values[0] if values else None,
+                            values[-1] if values else None, frequencies=frequencies)
+
+
+def _scaled(frequencies: Optional[dict], rows: int, total: int) -> Optional[dict]:
+    """
+    The frequencies of the values of some rows as fractions of a larger number of rows
+    """
+    if frequencies is None:
+        return None
+    return {value: fraction * rows / total for value, fraction in frequencies.items()}
+
+
+def column_statistics(column: Column, buckets: int = HISTOGRAM_BUCKETS) -> ColumnStatistics:
+    if isinstance(column, StringColumn):
+        return _string_statistics(column)
+    return _numeric_statistics(column, buckets)
+
+
+def _row_sample(table: Table, start: int = 0):
+    """
+    The rows of a row store table statistics are collected over, from row start on, None for a columnar table
+    """
+    if isinstance(table, ColumnTable):
+        return None
+    return range(start, table.num_rows, max(1, (start or table.num_rows) // ROW_SAMPLE))
+
+
+def _appended_column(column: Column, start: int) -> Column:
+    nulls = column.nulls[start:] if column.nulls else None
+    if isinstance(column, StringColumn):
+        return StringColumn(column.name, column.codes[start:], column.dictionary, nulls)
+    return NumericColumn(column.name, column.data[start:], nulls)
+
+
+def _statistics(table: Table, name: str, sample, start: int = 0) -> ColumnStatistics:
+    if sample is None:
+        column = table.column(name)
+        return column_statistics(_appended_column(column, start) if start else column)
+    return column_statistics(infer_column(name, list(table.values(name, sample))))
+
+
+def collect_statistics(table: Table) -> dict:
+    """
+    The statistics of every column of the table, column name -> ColumnStatistics. The values of a row store table are
+    typed the way a columnar load would type them first, from a sample of its rows.
+    """
+    sample = _row_sample(table)
+    return {name: _statistics(table, name, sample) for name in table.column_names}
+
+
+def append_statistics(table: Table, statistics: dict, start: int) -> dict:
+    """
+    The statistics of a table holding the rows described by the given statistics followed by appended rows, from row
+    start on. The statistics of the appended rows alone are merged into them. Row store columns whose appended values
+    are typed differently from the earlier ones are collected again, from the usual sample of the whole table.
+    """
+    sample = _row_sample(table, start)
+    return {name: _appended_statistics(table, name, statistics[name], sample, start) for name in table.column_names}
+
+
+def _appended_statistics(table: Table, name: str, statistics: ColumnStatistics, sample, start: int):
+    merged = statistics.merge(_statistics(table, name, sample, start))
+    return merged if merged is not None else _statistics(table, name, _row_sample(table))
+
+
+class TableStatistics(object):
+    """
+    The statistics of the columns of a cached table, column name -> ColumnStatistics. The statistics of a column are
+    collected the first time they are looked up, when a filter on the column is planned, so that loading a table reads
+    none of its columns.
+    """
+
+    def __init__(self, table: Table) -> None:
+        super().__init__()
+        self.table = table
+        self._columns = {}
+
+    def get(self, name: str) -> Optional[ColumnStatistics]:
+        statistics = self._columns.get(name)
+        if statistics is None and name in self.table.column_names:
+            statistics = self._columns[name] = _statistics(self.table, name, _row_sample(self.table))
+        return statistics
+
+    def __getitem__(self, name: str) -> ColumnStatistics:
+        statistics = self.get(name)
+        if statistics is None:
+            raise KeyError(name)
+        return statistics
+
+    def append(self, table: Table, start: int) -> 'TableStatistics':
+        """
+        The statistics of a table holding the rows of this one followed by appended rows, from row start on, as by
+        `append_statistics`. Only the columns whose statistics were already collected are extended.
+        """
+        appended = TableStatistics(table)
+        sample = _row_sample(table, start)
+        for name, statistics in list(self._columns.items()):
+            appended._columns[name] = _appended_statistics(table, name, statistics, sample, start)
+        return appended
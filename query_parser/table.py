@@ -0,0 +1,857 @@
+import array
+import csv
+import math
+import sys
+from collections import Counter
+from itertools import islice, compress, chain
+from operator import itemgetter
+from typing import List, Optional, Tuple
+
+from query_parser.masks import invert_mask, bitmap_to_row_ids, popcount
+
+# Values treated as missing when inferring column types
+NULL_TOKENS = ('', 'NA')
+NULL_OUTPUT = 'NA'
+
+# The number of rows sampled when estimating how much memory a row store table occupies
+SIZE_ESTIMATE_SAMPLE = 256
+
+# The number of rows evaluated together by batch filters
+BATCH_SIZE = 4096
+
+# The bytes of a csv file kept from right before the end of its last read, to recognize it was appended to since
+APPENDED_TAIL = 64
+
+
+def format_value(value) -> str:
+    return NULL_OUTPUT if value is None else str(value)
+
+
+def format_row(row) -> str:
+    return ', '.join([format_value(item) for item in row])
+
+
+def _smallest_code_typecode(cardinality: int) -> str:
+    if cardinality <= 0xff:
+        return 'B'
+    elif cardinality <= 0xffff:
+        return 'H'
+    return 'L'
+
+
+def typecode(sequence) -> str:
+    """
+    The array typecode of the values of an array, or of a memoryview cast to a typed format
+    """
+    return getattr(sequence, 'typecode', None) or sequence.format
+
+
+class SegmentedArray(object):
+    """
+    The values of a column rows were appended to: the array it was loaded with, which may be a memoryview over a mapped
+    columnar file, followed by an array of the values appended since. The loaded array is never copied. The appended
+    array is shared with the later snapshots of the column and grows in place, every snapshot only reads the values up
+    to its own length, so appending costs as much as the appended values.
+    """
+    __slots__ = ('base', 'appended', 'length', 'typecode', 'itemsize')
+
+    def __init__(self, base, appended: array.array, length: int) -> None:
+        self.base = base
+        self.appended = appended
+        self.length = length
+        self.typecode = appended.typecode
+        self.itemsize = appended.itemsize
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self._slice(*key.indices(self.length))
+        if key < 0:
+            key += self.length
+        base = self.base
+        if key < len(base):
+            return base[key]
+        if key >= self.length:
+            raise IndexError('array index out of range')
+        return self.appended[key - len(base)]
+
+    def _slice(self, start: int, stop: int, step: int):
+        split = len(self.base)
+        if step != 1:
+            return array.array(self.typecode, islice(self, start, max(start, stop), step))
+        if stop <= split:
+            return self.base[start:stop]
+        if start >= split:
+            return self.appended[start - split:stop - split]
+        # Only slices spanning both parts are copied into a single array
+        sliced = _copy_array(self.base[start:split], self.typecode)
+        sliced.extend(self.appended[:stop - split])
+        return sliced
+
+    def __iter__(self):
+        return chain(self.base, islice(self.appended, self.length - len(self.base)))
+
+    def take(self, positions: list):
+        """
+        The values at the given positions, read straight from one of the arrays when they all fall within it
+        """
+        split = len(self.base)
+        if not positions or max(positions) < split:
+            return map(self.base.__getitem__, positions)
+        if min(positions) >= split:
+            return map(self.appended.__getitem__, [position - split for position in positions])
+        return map(self.__getitem__, positions)
+
+    def __contains__(self, value) -> bool:
+        return value in self.base or value in self.appended[:self.length - len(self.base)]
+
+    def extend(self, values) -> 'SegmentedArray':
+        """
+        A snapshot holding the values of this one followed by the given values, which are added to the shared array
+        """
+        used = self.length - len(self.base)
+        appended = self.appended
+        # A later snapshot, or an append which failed half way, added values already, which this snapshot never read
+        if len(appended) != used:
+            appended = appended[:used]
+        appended.extend(values)
+        return SegmentedArray(self.base, appended, len(self.base) + len(appended))
+
+    def __repr__(self) -> str:
+        return f'<SEGMENTED ARRAY {self.typecode} base={len(self.base)} length={self.length}>'
+
+
+def _values_at(sequence, positions):
+    """
+    The values of an array, a memoryview or a segmented array at the given positions
+    """
+    if isinstance(sequence, SegmentedArray):
+        return sequence.take(positions if isinstance(positions, list) else list(positions))
+    return map(sequence.__getitem__, positions)
+
+
+def _extend(sequence, values, sequence_typecode: str) -> SegmentedArray:
+    """
+    The values of an array, a memoryview or a segmented array followed by more values, the first ones are not copied
+    """
+    if isinstance(sequence, SegmentedArray):
+        return sequence.extend(values)
+    appended = array.array(sequence_typecode, values)
+    return SegmentedArray(sequence, appended, len(sequence) + len(appended))
+
+
+class Column(object):
+    """
+    A single typed column of a table. Missing values are tracked in a null mask holding a 1 for every missing row, the
+    mask is None when the column has no missing values at all.
+    """
+    value_type = None
+
+    def __init__(self, name: str, nulls: bytearray = None) -> None:
+        super().__init__()
+        self.name = name
+        self.nulls = nulls
+
+    @property
+    def is_numeric(self) -> bool:
+        return self.value_type in (int, float)
+
+    @property
+    def nbytes(self) -> int:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def __getitem__(self, row_id: int):
+        raise NotImplementedError
+
+    def values(self, row_ids=None):
+        raise NotImplementedError
+
+    def append(self, raw: List[str]) -> Optional['Column']:
+        """
+        A new column holding the values of this one followed by the given raw values, None when they do not fit the
+        type of the column. The column itself is left unchanged, for the queries still reading it.
+        """
+        raise NotImplementedError
+
+    def _append_nulls(self, nulls: bytearray):
+        return _append_mask(self.nulls, len(self), nulls)
+
+    def _mask_nulls(self, row_ids, values):
+        nulls = self.nulls
+        if row_ids is None or isinstance(row_ids, range):
+            nulls = nulls if row_ids is None else nulls[row_ids.start:row_ids.stop]
+            return (None if null else value for value, null in zip(values, nulls))
+        return (None if null else value for value, null in zip(values, _values_at(nulls, row_ids)))
+
+    def __repr__(self) -> str:
+        return f'<COLUMN {self.name} {self.value_type.__name__}>'
+
+
+class NumericColumn(Column):
+    """
+    An array backed column of ints or floats. Missing rows hold a zero in the array and are flagged in the null mask.
+    The array may also be a memoryview over a mapped columnar file, or a segmented array once rows were appended.
+
+    Rows of a float column which were written as integers are flagged in the integers mask and read as ints, so they are
+    output the way they were written. The mask is None when there are no such rows.
+    """
+
+    def __init__(self, name: str, data: array.array, nulls: bytearray = None, integers: bytearray = None) -> None:
+        super().__init__(name, nulls)
+        self.data = data
+        self.raw = data
+        self.integers = integers
+        self.value_type = float if typecode(data) == 'd' else int
+
+    @property
+    def nbytes(self) -> int:
+        masks = (len(self.nulls) if self.nulls else 0) + (len(self.integers) if self.integers else 0)
+        return self.data.itemsize * len(self.data) + masks
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, row_id: int):
+        if self.nulls and self.nulls[row_id]:
+            return None
+        if self.integers and self.integers[row_id]:
+            return int(self.data[row_id])
+        return self.data[row_id]
+
+    def values(self, row_ids=None):
+        if row_ids is None:
+            values = iter(self.data)
+        elif isinstance(row_ids, range):
+            values = iter(self.data[row_ids.start:row_ids.stop])
+        else:
+            row_ids = list(row_ids) if self.nulls or self.integers else row_ids
+            values = _values_at(self.data, row_ids)
+        if self.integers:
+            values = self._mask_integers(row_ids, values)
+        return self._mask_nulls(row_ids, values) if self.nulls else values
+
+    def _mask_integers(self, row_ids, values):
+        integers = self.integers
+        if row_ids is None or isinstance(row_ids, range):
+            integers = integers if row_ids is None else integers[row_ids.start:row_ids.stop]
+            return (int(value) if integer else value for value, integer in zip(values, integers))
+        return (int(value) if integer else value for value, integer in zip(values, _values_at(integers, row_ids)))
+
+    def append(self, raw: List[str]) -> Optional['NumericColumn']:
+        nulls = bytearray(value in NULL_TOKENS for value in raw)
+        try:
+            values = _convert_all(self.value_type, raw, nulls if 1 in nulls else None)
+            data = _extend(self.data, values, typecode(self.data))
+        except (ValueError, OverflowError):
+            return None
+
+        integers = None
+        if self.value_type is float:
+            integers = _append_mask(self.integers, len(self), _integers_mask(raw))
+        return NumericColumn(self.name, data, self._append_nulls(nulls), integers)
+
+
+class StringColumn(Column):
+    """
+    A dictionary encoded column of strings. Every distinct value is stored once in the dictionary and rows hold the
+    position of their value in it, using the smallest integer width that fits the dictionary.
+
+    Values of appended rows are added to the dictionary in place, so it is shared with the later snapshots of the
+    column. Codes of a snapshot never refer to the values added after it.
+    """
+    value_type = str
+
+    def __init__(self, name: str, codes: array.array, dictionary: List[str], nulls: bytearray = None) -> None:
+        super().__init__(name, nulls)
+        self.codes = codes
+        self.raw = codes
+        self._dictionary = dictionary
+        self._dictionary_size = len(dictionary)
+        # Value -> code of every value of the shared dictionary, built the first time rows are appended
+        self._positions = None
+        self._dictionary_bytes = None
+
+    @property
+    def dictionary(self) -> List[str]:
+        dictionary = self._dictionary
+        return dictionary if len(dictionary) == self._dictionary_size else dictionary[:self._dictionary_size]
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.itemsize * len(self.codes) + self.dictionary_nbytes + (len(self.nulls) if self.nulls else 0)
+
+    @property
+    def dictionary_nbytes(self) -> int:
+        if self._dictionary_bytes is None:
+            self._dictionary_bytes = sum(sys.getsizeof(value) for value in self.dictionary)
+        return self._dictionary_bytes
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, row_id: int):
+        if self.nulls and self.nulls[row_id]:
+            return None
+        return self.dictionary[self.codes[row_id]]
+
+    def values(self, row_ids=None):
+        if row_ids is None:
+            codes = iter(self.codes)
+        elif isinstance(row_ids, range):
+            codes = iter(self.codes[row_ids.start:row_ids.stop])
+        else:
+            row_ids = list(row_ids) if self.nulls else row_ids
+            codes = _values_at(self.codes, row_ids)
+        values = map(self.dictionary.__getitem__, codes)
+        return self._mask_nulls(row_ids, values) if self.nulls else values
+
+    def append(self, raw: List[str]) -> Optional['StringColumn']:
+        nulls = bytearray(value in NULL_TOKENS for value in raw)
+        # A column with no values at all is only kept as strings until values show up, which may be numbers
+        if len(self) and self.nulls and 0 not in self.nulls and 0 in nulls:
+            return None
+
+        dictionary, positions = self._dictionary, self._positions
+        size = self._dictionary_size
+        # A later snapshot added values to the dictionary already, this one goes on from a copy of its own values
+        if len(dictionary) != size:
+            dictionary, positions = dictionary[:size], None
+        if positions is None:
+            positions = {value: code for code, value in enumerate(dictionary)}
+
+        codes = []
+        for value in raw:
+            code = positions.get(value)
+            if code is None:
+                code = positions[value] = len(dictionary)
+                dictionary.append(value)
+            codes.append(code)
+
+        code_typecode = _smallest_code_typecode(len(dictionary))
+        if code_typecode == typecode(self.codes):
+            appended = _extend(self.codes, codes, code_typecode)
+        else:
+            # Wider codes are only needed when the dictionary grows past 256 or 65536 values
+            appended = array.array(code_typecode, self.codes)
+            appended.extend(codes)
+
+        column = StringColumn(self.name, appended, dictionary, self._append_nulls(nulls))
+        column._positions = positions
+        column._dictionary_bytes = self.dictionary_nbytes + sum(sys.getsizeof(value) for value in dictionary[size:])
+        return column
+
+
+def _append_mask(mask: Optional[bytearray], length: int, appended: bytearray) -> Optional[bytearray]:
+    """
+    The mask of a column of the given length followed by the mask of appended rows, None when no row is flagged
+    """
+    if not mask and 1 not in appended:
+        return None
+    if mask:
+        return _extend(mask, appended, 'B')
+    # The first rows ever flagged, the mask of the earlier rows is all zeros
+    extended = bytearray(length)
+    extended.extend(appended)
+    return extended
+
+
+def _is_integer(value: str) -> bool:
+    try:
+        int(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _integers_mask(raw: List[str]) -> bytearray:
+    return bytearray(map(_is_integer, raw))
+
+
+def _copy_array(sequence, sequence_typecode: str) -> array.array:
+    """
+    A copy of an array, or of a memoryview over a mapped columnar file, which can be extended
+    """
+    copied = array.array(sequence_typecode)
+    copied.frombytes(memoryview(sequence).cast('B'))
+    return copied
+
+
+def _convert_all(converter, raw: List[str], nulls: bytearray):
+    if nulls is None:
+        return [converter(value) for value in raw]
+    return [converter(value) if not null else 0 for value, null in zip(raw, nulls)]
+
+
+def infer_column(name: str, raw: List[str]) -> Column:
+    """
+    Picks the narrowest type which can hold every non missing value of the column: int, then float, then string
+    """
+    nulls = bytearray(value in NULL_TOKENS for value in raw)
+    if 1 not in nulls:
+        nulls = None
+
+    # A column made up of only missing values is kept as strings
+    if nulls is None or 0 in nulls:
+        try:
+            return NumericColumn(name, array.array('q', _convert_all(int, raw, nulls)), nulls)
+        except (ValueError, OverflowError):
+            pass
+
+        try:
+            data = array.array('d', _convert_all(float, raw, nulls))
+        except ValueError:
+            pass
+        else:
+            integers = _integers_mask(raw)
+            return NumericColumn(name, data, nulls, integers if 1 in integers else None)
+
+    dictionary = {}
+    codes = [dictionary.setdefault(value, len(dictionary)) for value in raw]
+    return StringColumn(name, array.array(_smallest_code_typecode(len(dictionary)), codes), list(dictionary), nulls)
+
+
+class ColumnBatch(object):
+    """
+    A group of rows of a columnar table which is evaluated in one go. The rows are either a contiguous range, in which
+    case columns are sliced without copying values one at a time, or an explicit list of row ids.
+    """
+
+    def __init__(self, table: 'ColumnTable', row_ids) -> None:
+        super().__init__()
+        self.table = table
+        self.row_ids = row_ids
+
+    def __len__(self) -> int:
+        return len(self.row_ids)
+
+    def column(self, column_name: str) -> Column:
+        return self.table.column(column_name)
+
+    def _take(self, sequence):
+        row_ids = self.row_ids
+        if isinstance(row_ids, range):
+            return sequence[row_ids.start:row_ids.stop]
+        values = _values_at(sequence, row_ids)
+        if isinstance(sequence, (array.array, memoryview, SegmentedArray)):
+            return array.array(typecode(sequence), values)
+        return bytes(values)
+
+    def raw(self, column: Column):
+        """
+        The underlying array values of the column, the codes for dictionary encoded columns
+        """
+        return self._take(column.raw)
+
+    def values(self, column: Column):
+        return column.values(self.row_ids)
+
+    def valid(self, column: Column):
+        """
+        The null mask of the column for the batch, inverted so that present values are 1. None if nothing is missing.
+        """
+        if not column.nulls:
+            return None
+        return invert_mask(bytes(self._take(column.nulls)))
+
+
+class RowView(object):
+    """
+    A read only, dict like view of a single row of a columnar table. Columns are only read when they are accessed.
+    """
+    __slots__ = ('table', 'row_id')
+
+    def __init__(self, table: 'ColumnTable', row_id: int) -> None:
+        self.table = table
+        self.row_id = row_id
+
+    def __getitem__(self, column_name: str):
+        return self.table.column(column_name)[self.row_id]
+
+    def keys(self):
+        return self.table.column_names
+
+    def values(self):
+        row_id = self.row_id
+        return [column[row_id] for column in self.table.columns]
+
+    def items(self):
+        return zip(self.keys(), self.values())
+
+
+class Table(object):
+    """
+    A table loaded in memory. Tables are immutable once loaded, a changed file is loaded into a new table and rows
+    appended to the file are appended to a new table.
+    """
+
+    def __init__(self, name: str, column_names: List[str]) -> None:
+        super().__init__()
+        self.name = name
+        self.column_names = column_names
+        # Secondary indexes built over the columns of this table, (column name, kind) -> index
+        self.indexes = {}
+        # Columns with at most this many distinct values get a bitmap index, the first time a query filters on them
+        self.bitmap_threshold = 0
+        # The columns whose distinct values were already counted for a bitmap index
+        self.bitmap_columns = set()
+        # Statistics of the values of every column, column name -> ColumnStatistics, used to plan filters
+        self.statistics = {}
+
+    @property
+    def num_rows(self) -> int:
+        raise NotImplementedError
+
+    @property
+    def nbytes(self) -> int:
+        raise NotImplementedError
+
+    def column_type(self, column_name: str):
+        raise NotImplementedError
+
+    def row(self, row_id: int):
+        raise NotImplementedError
+
+    def values(self, column_name: str, row_ids=None):
+        raise NotImplementedError
+
+    def append(self, rows: List[list]) -> Optional['Table']:
+        """
+        A new table holding the rows of this one followed by the given rows of raw values, None when they do not fit
+        the columns of the table, in which case it has to be loaded again
+        """
+        raise NotImplementedError
+
+    def _check_column(self, column_name: str):
+        if column_name not in self.column_names:
+            raise ValueError(f'Unknown column {column_name} in {self.name}')
+
+    def __repr__(self) -> str:
+        return f'<TABLE {self.name} rows={self.num_rows} bytes={self.nbytes}>'
+
+
+class Schema(object):
+    """
+    The position of every column in the rows of a row store table, shared by all of its rows
+    """
+
+    def __init__(self, column_names: List[str]) -> None:
+        super().__init__()
+        self.column_names = column_names
+        self.positions = {name: position for position, name in enumerate(column_names)}
+
+    def position(self, column_name: str) -> int:
+        try:
+            return self.positions[column_name]
+        except KeyError:
+            raise ValueError(f'Unknown column {column_name}')
+
+    def as_dict(self, row: tuple) -> dict:
+        return dict(zip(self.column_names, row))
+
+
+class RowTable(Table):
+    """
+    A row store table which keeps every row as a tuple of the raw strings read from the file, in the order of the
+    columns of its schema. Columns are read by their position rather than by name.
+
+    Appended rows are added to the list of rows in place, so it is shared with the later snapshots of the table and
+    may hold more rows than the table, which only reads its first num_rows rows.
+    """
+
+    def __init__(self, name: str, column_names: List[str], rows: List[tuple], num_rows: int = None) -> None:
+        super().__init__(name, column_names)
+        self.schema = Schema(column_names)
+        self.rows = rows
+        self._num_rows = len(rows) if num_rows is None else num_rows
+        self._nbytes = None
+
+    @property
+    def num_rows(self) -> int:
+        return self._num_rows
+
+    @property
+    def nbytes(self) -> int:
+        if self._nbytes is None:
+            rows = self.rows
+            self._nbytes = _estimate_size(rows if len(rows) == self._num_rows else rows[:self._num_rows])
+        return self._nbytes
+
+    def position(self, column_name: str) -> int:
+        self._check_column(column_name)
+        return self.schema.positions[column_name]
+
+    def column_type(self, column_name: str):
+        self._check_column(column_name)
+        return str
+
+    def row(self, row_id: int):
+        return self.rows[row_id]
+
+    def values(self, column_name: str, row_ids=None):
+        getter = itemgetter(self.position(column_name))
+        if row_ids is None:
+            rows = islice(self.rows, self._num_rows)
+        elif isinstance(row_ids, range):
+            rows = self.rows[row_ids.start:row_ids.stop]
+        else:
+            rows = map(self.rows.__getitem__, row_ids)
+        return map(getter, rows)
+
+    def append(self, rows: List[list]) -> Optional['RowTable']:
+        if any(len(row) != len(self.column_names) for row in rows):
+            return None
+
+        shared = self.rows
+        # A later snapshot appended rows already, this one goes on from a copy of its own rows
+        if len(shared) != self._num_rows:
+            shared = shared[:self._num_rows]
+        appended = _shared_value_rows(rows)
+        shared.extend(appended)
+
+        table = RowTable(self.name, self.column_names, shared, len(shared))
+        table._nbytes = self.nbytes + _estimate_size(appended)
+        return table
+
+
+def _estimate_size(rows: List[tuple]) -> int:
+    """
+    An estimate of the memory taken by rows of the row store, from a sample of them
+    """
+    if not rows:
+        return sys.getsizeof(rows)
+
+    step = max(1, len(rows) // SIZE_ESTIMATE_SAMPLE)
+    sample = rows[::step]
+    row_bytes = sys.getsizeof(rows) + sys.getsizeof(rows[0]) * len(rows)
+
+    # Rows holding equal values share a single string, so only the distinct strings of each column are counted.
+    # Their number is estimated from how many of the sampled values were seen only once.
+    value_bytes = 0
+    scale = math.sqrt(len(rows) / len(sample))
+    for values in zip(*sample):
+        counts = Counter(map(id, values))
+        singletons = sum(1 for count in counts.values() if count == 1)
+        distinct = {id(value): value for value in values}.values()
+        average_bytes = sum(map(sys.getsizeof, distinct)) / len(distinct)
+        value_bytes += int(average_bytes * (scale * singletons + len(counts) - singletons))
+    return row_bytes + value_bytes
+
+
+class ColumnTable(Table):
+    """
+    A columnar table holding one typed column per field of the file
+    """
+
+    def __init__(self, name: str, columns: List[Column]) -> None:
+        super().__init__(name, [column.name for column in columns])
+        self.columns = columns
+        self._columns_by_name = {column.name: column for column in columns}
+
+    @property
+    def num_rows(self) -> int:
+        return len(self.columns[0]) if self.columns else 0
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self.columns)
+
+    def column(self, column_name: str) -> Column:
+        try:
+            return self._columns_by_name[column_name]
+        except KeyError:
+            raise ValueError(f'Unknown column {column_name} in {self.name}')
+
+    def column_type(self, column_name: str):
+        return self.column(column_name).value_type
+
+    def row(self, row_id: int):
+        return RowView(self, row_id)
+
+    def values(self, column_name: str, row_ids=None):
+        return self.column(column_name).values(row_ids)
+
+    def append(self, rows: List[list]) -> Optional['ColumnTable']:
+        if any(len(row) != len(self.columns) for row in rows):
+            return None
+
+        columns = []
+        for column, raw in zip(self.columns, zip(*rows) if rows else [() for _ in self.columns]):
+            appended = column.append(list(raw))
+            if appended is None:
+                return None
+            columns.append(appended)
+        return ColumnTable(self.name, columns)
+
+
+def _shared_value_rows(reader) -> List[tuple]:
+    """
+    The rows of a csv file as tuples, where rows holding equal values share one string. Most columns hold a handful of
+    categories repeated over every row, which would otherwise be a separate string in each of them.
+    """
+    shared = {}
+    share = shared.setdefault
+    return [tuple([share(value, value) for value in row]) for row in reader]
+
+
+def _lines(csvfile, size: int):
+    """
+    The lines of a binary file up to the given size in bytes, decoded
+    """
+    position = 0
+    for line in csvfile:
+        if position >= size:
+            return
+        position += len(line)
+        yield (line[:size - position] if position > size else line).decode()
+
+
+def load_csv(name: str, filename: str, columnar: bool = True, size: int = None) -> Table:
+    """
+    Loads a table from a csv file, or from its first size bytes when given, so that a table loaded while rows are
+    being appended to the file holds exactly the rows up to the size it was seen to have
+    """
+    with open(filename, 'r' if size is None else 'rb') as csvfile:
+        reader = csv.reader(csvfile if size is None else _lines(csvfile, size))
+        column_names = next(reader, [])
+
+        if not columnar:
+            return RowTable(name, column_names, _shared_value_rows(reader))
+
+        raw_columns = list(zip(*reader)) or [() for _ in column_names]
+        return ColumnTable(name, [infer_column(n, list(raw)) for n, raw in zip(column_names, raw_columns)])
+
+
+def read_appended_rows(filename: str, offset: int, size: int, tail: bytes) -> Optional[Tuple[List[list], int, bytes]]:
+    """
+    The rows appended to a csv file since it was read up to the given offset, along with the offset and the tail of the
+    file following the last of them. The tail holds the bytes the file ended with at the offset when it was read, the
+    file was rewritten rather than appended to when they changed and None is returned. A last line still being written,
+    without its line ending, is left for the next read.
+    """
+    start = offset - len(tail)
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        data = f.read(size - start)
+    if not tail or not data.startswith(tail):
+        return None
+
+    end = data.rfind(b'\n') + 1
+    rows = list(csv.reader(line.decode() for line in data[len(tail):end].splitlines(keepends=True)))
+    return rows, start + end, data[max(0, end - APPENDED_TAIL):end]
+
+
+def read_tail(filename: str, size: int) -> bytes:
+    """
+    The bytes a csv file read up to the given size ends with, empty when it does not end with a complete line and
+    rows appended to it cannot be told apart from the end of its last row
+    """
+    with open(filename, 'rb') as f:
+        f.seek(max(0, size - APPENDED_TAIL))
+        tail = f.read(min(size, APPENDED_TAIL))
+    return tail if tail.endswith(b'\n') else b''
+
+
+class TableScan(object):
+    """
+    A lazy and re-iterable view over the rows of a table. Filters and limits narrow down the row ids that are visited
+    without touching the table until the scan is iterated.
+    """
+
+    def __init__(self, table: Table, row_ids=None) -> None:
+        super().__init__()
+        self.table = table
+        # Either None for every row, a sequence of row ids or a callable producing an iterator of row ids
+        self._row_ids = row_ids
+        # The bitmap of the selected rows, when the scan was produced from bitmap indexes
+        self.bitmap = None
+
+    @staticmethod
+    def from_bitmap(table: Table, bitmap: int) -> 'TableScan':
+        scan = TableScan(table, lambda: bitmap_to_row_ids(bitmap))
+        scan.bitmap = bitmap
+        return scan
+
+    @property
+    def is_full_scan(self) -> bool:
+        return self._row_ids is None
+
+    def row_ids(self):
+        if self._row_ids is None:
+            return iter(range(self.table.num_rows))
+        elif callable(self._row_ids):
+            return self._row_ids()
+        return iter(self._row_ids)
+
+    def __iter__(self):
+        return map(self.table.row, self.row_ids())
+
+    def values(self, column_name: str):
+        row_ids = None if self._row_ids is None else self.row_ids()
+        return self.table.values(column_name, row_ids)
+
+    def column_type(self, column_name: str):
+        return self.table.column_type(column_name)
+
+    def known_count(self):
+        """
+        The number of rows in the scan if it is known without visiting them, None otherwise
+        """
+        if self._row_ids is None:
+            return self.table.num_rows
+        elif self.bitmap is not None:
+            return popcount(self.bitmap)
+        elif callable(self._row_ids):
+            return None
+        return len(self._row_ids)
+
+    def count(self) -> int:
+        count = self.known_count()
+        if count is None:
+            return sum(1 for _ in self._row_ids())
+        return count
+
+    def filter(self, predicate) -> 'TableScan':
+        row = self.table.row
+        return TableScan(self.table, lambda: (i for i in self.row_ids() if predicate(row(i))))
+
+    def row_id_batches(self, batch_size: int = BATCH_SIZE):
+        """
+        Visits the row ids of the scan in groups, contiguous ranges are produced when the scan visits a range of rows,
+        such as every row of the table
+        """
+        if self._row_ids is None or isinstance(self._row_ids, range):
+            rows = range(self.table.num_rows) if self._row_ids is None else self._row_ids
+            return (rows[start:start + batch_size] for start in range(0, len(rows), batch_size))
+        row_ids = self.row_ids()
+        return iter(lambda: list(islice(row_ids, batch_size)), [])
+
+    def filter_batches(self, evaluate, batch_size: int = BATCH_SIZE) -> 'TableScan':
+        """
+        Filters a columnar table a batch at a time, given a function which returns the selection mask of a batch
+        """
+        table = self.table
+
+        def row_ids():
+            for batch_row_ids in self.row_id_batches(batch_size):
+                yield from compress(batch_row_ids, evaluate(ColumnBatch(table, batch_row_ids)))
+
+        return TableScan(table, row_ids)
+
+    def limit(self, limit: int) -> 'TableScan':
+        return TableScan(self.table, lambda: islice(self.row_ids(), limit))
+
+    def materialize(self) -> 'TableScan':
+        """
+        Evaluates any pending filters once, so that the scan can be visited repeatedly at no extra cost
+        """
+        if self._row_ids is None or not callable(self._row_ids):
+            return self
+        return TableScan(self.table, array.array('q', self._row_ids()))
+
+    def __repr__(self) -> str:
+        return f'<SCAN {self.table.name}>'
@@ -0,0 +1,185 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from query_parser.columnar_file import load_columnar
+from query_parser.indexes import prepare_indexes, append_indexes, BITMAP_CARDINALITY_THRESHOLD
+from query_parser.metrics import metrics
+from query_parser.statistics import TableStatistics
+from query_parser.table import Table, load_csv, read_appended_rows, read_tail
+
+# Identifies every load of a table from its whole file, tables refreshed with appended rows keep the id of the load
+_load_ids = itertools.count()
+
+
+class CachedTable(object):
+    """
+    A table loaded from disk, along with the file metadata used to decide if it is still fresh. The offset is the size
+    of the file the rows of the table were read from, up to the end of its last complete line, and the tail holds the
+    bytes the file ended with there, empty when rows appended to the file cannot be read from the offset.
+    """
+
+    def __init__(self, name: str, filename: str, mtime: float, size: int, table: Table, inode: int = None,
+                 offset: int = None, tail: bytes = b'', load_id: int = None) -> None:
+        super().__init__()
+        self.name = name
+        self.filename = filename
+        self.mtime = mtime
+        self.size = size
+        self.table = table
+        self.inode = inode
+        self.offset = size if offset is None else offset
+        self.tail = tail
+        self.load_id = next(_load_ids) if load_id is None else load_id
+        self._table_nbytes = table.nbytes
+
+    @property
+    def nbytes(self) -> int:
+        # Indexes are also built after the table is cached, the first time a query needs them
+        return self._table_nbytes + sum(index.nbytes for index in list(self.table.indexes.values()))
+
+    def is_fresh(self, stat: os.stat_result) -> bool:
+        return self.mtime == stat.st_mtime and self.size == stat.st_size
+
+    def __repr__(self) -> str:
+        return f'<CACHED {self.table}>'
+
+
+class TableCache(object):
+    """
+    A process wide cache of loaded tables keyed by table name. A table is reloaded when the mtime or size of its file
+    changes, and the least recently used tables are evicted when the memory budget is exceeded. Tables are stored as
+    typed columns unless the cache is configured to use the row store, columnar tables are mapped from the columnar
+    copy of their file unless the cache is configured not to write such copies.
+
+    With incremental refreshes, files are expected to only ever be appended to: a file which grew is read from where
+    its last read ended, and the rows appended to it are appended to the cached table along with its indexes and
+    statistics. Files changed in any other way are still loaded again.
+    """
+
+    def __init__(self, budget: int = None, columnar: bool = True,
+                 bitmap_threshold: int = BITMAP_CARDINALITY_THRESHOLD, columnar_files: bool = True,
+                 incremental: bool = False) -> None:
+        super().__init__()
+        self.budget = budget
+        self.columnar = columnar
+        self.columnar_files = columnar_files
+        self.bitmap_threshold = bitmap_threshold
+        self.incremental = incremental
+        self.refreshes = 0
+        self._tables = OrderedDict()
+        self._lock = threading.RLock()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(table.nbytes for table in self._tables.values())
+
+    @staticmethod
+    def _stat(data_path: str, name: str):
+        filename = os.path.join(data_path, f'{name}.csv')
+        try:
+            return filename, os.stat(filename)
+        except FileNotFoundError:
+            raise ValueError(f'Data source {name} is invalid')
+
+    def version(self, data_path: str, name: str) -> tuple:
+        """
+        Identifies the current contents of a table without loading it, the version changes whenever the table would be
+        reloaded
+        """
+        filename, stat = self._stat(data_path, name)
+        return filename, stat.st_mtime, stat.st_size
+
+    def get(self, data_path: str, name: str) -> CachedTable:
+        filename, stat = self._stat(data_path, name)
+
+        with self._lock:
+            table = self._tables.get(name)
+            if table and table.filename == filename and table.is_fresh(stat):
+                self._tables.move_to_end(name)
+                return table
+
+            refreshed = None
+            if table and table.filename == filename and self.incremental:
+                refreshed = self._refresh(table, stat)
+            table = refreshed or self._load(name, filename, stat)
+            self._tables.pop(name, None)
+            self._tables[name] = table
+            self._evict()
+            return table
+
+    def _load(self, name: str, filename: str, stat: os.stat_result) -> CachedTable:
+        logging.info(f'loading table {name} from {filename}')
+        start = time.perf_counter()
+        if self.columnar and self.columnar_files:
+            loaded = load_columnar(name, filename, stat)
+        else:
+            loaded = load_csv(name, filename, self.columnar, stat.st_size)
+        prepare_indexes(loaded, self.bitmap_threshold)
+        loaded.statistics = TableStatistics(loaded)
+        metrics.record_table_load(name, time.perf_counter() - start, loaded.num_rows)
+        return CachedTable(name, filename, stat.st_mtime, stat.st_size, loaded, stat.st_ino,
+                           tail=read_tail(filename, stat.st_size) if self.incremental else b'')
+
+    def _refresh(self, cached: CachedTable, stat: os.stat_result) -> Optional[CachedTable]:
+        """
+        The cached table with the rows appended to its file since it was read, None when the file was changed in any
+        other way. Only the appended rows are parsed, indexed and summarized.
+        """
+        if not cached.tail or stat.st_ino != cached.inode or stat.st_size < cached.offset:
+            return None
+
+        start = time.perf_counter()
+        appended = read_appended_rows(cached.filename, cached.offset, stat.st_size, cached.tail)
+        if appended is None:
+            return None
+        rows, offset, tail = appended
+
+        table = cached.table
+        if rows:
+            table = cached.table.append(rows)
+            if table is None:
+                logging.info(f'rows appended to {cached.filename} do not fit the columns of {cached.name}')
+                return None
+            append_indexes(cached.table, table, cached.table.num_rows, self.bitmap_threshold)
+            table.statistics = cached.table.statistics.append(table, cached.table.num_rows)
+
+        logging.info(f'appended {len(rows)} rows to table {cached.name} in {time.perf_counter() - start:.3f}s')
+        self.refreshes += 1
+        return CachedTable(cached.name, cached.filename, stat.st_mtime, stat.st_size, table, stat.st_ino, offset, tail,
+                           cached.load_id)
+
+    def preload(self, data_path: str):
+        for entry in sorted(os.listdir(data_path)):
+            name, extension = os.path.splitext(entry)
+            if extension == '.csv':
+                self.get(data_path, name)
+
+    def invalidate(self, name: str = None):
+        with self._lock:
+            if name is None:
+                self._tables.clear()
+            else:
+                self._tables.pop(name, None)
+
+    def _evict(self):
+        if self.budget is None:
+            return
+
+        # The most recently loaded table is always kept, even if it alone is over budget
+        while len(self._tables) > 1 and self.nbytes > self.budget:
+            name, table = self._tables.popitem(last=False)
+            logging.info(f'evicting table {name} ({table.nbytes} bytes) from cache')
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._tables
+
+    def __len__(self) -> int:
+        return len(self._tables)
+
+
+table_cache = TableCache()
@@ -0,0 +1,83 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from query_parser.columnar_file import load_columnar, read_columnar_file, columnar_filename
+from query_parser.table import load_csv, ColumnBatch
+from query_parser.table_cache import TableCache
+
+
+class TestColumnarFile(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'foo.csv')
+        self.sidecar = os.path.join(self.directory.name, 'foo.col')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _write_table(self, lines):
+        with open(self.filename, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def _load(self):
+        return load_columnar('foo', self.filename, os.stat(self.filename))
+
+    def test_columnar_filename(self):
+        self.assertEqual(os.path.join('data', 'foo.col'), columnar_filename(os.path.join('data', 'foo.csv')))
+
+    def test_columns_match_the_csv(self):
+        self._write_table(['a,b,c,d', '1,2.5,x,NA', 'NA,3.5,y,', '3,,x,z'])
+        expected = load_csv('foo', self.filename)
+
+        for table in (self._load(), self._load()):
+            self.assertEqual(expected.column_names, table.column_names)
+            for name in expected.column_names:
+                self.assertEqual(expected.column_type(name), table.column_type(name))
+                self.assertEqual(list(expected.values(name)), list(table.values(name)))
+                self.assertEqual(list(expected.values(name, [2, 0])), list(table.values(name, [2, 0])))
+        self.assertTrue(os.path.exists(self.sidecar))
+
+    def test_columns_are_mapped(self):
+        self._write_table(['a,b', '1,x', '2,y'])
+        self._load()
+        table = self._load()
+
+        column = table.column('a')
+        self.assertIsInstance(column.raw, memoryview)
+        self.assertEqual([2], list(ColumnBatch(table, [1]).raw(column)))
+        self.assertEqual([0, 1], list(ColumnBatch(table, range(2)).raw(table.column('b'))))
+
+    def test_stale_file_is_rewritten(self):
+        self._write_table(['a,b', '1,x'])
+        self._load()
+
+        self._write_table(['a,b', '1,x', '2,y'])
+        self.assertIsNone(read_columnar_file('foo', self.sidecar, os.stat(self.filename)))
+        self.assertEqual([1, 2], list(self._load().values('a')))
+        self.assertIsNotNone(read_columnar_file('foo', self.sidecar, os.stat(self.filename)))
+
+    def test_corrupt_file_is_rewritten(self):
+        self._write_table(['a,b', '1,x'])
+        with open(self.sidecar, 'wb') as f:
+            f.write(b'not a columnar file')
+
+        self.assertEqual([1], list(self._load().values('a')))
+        self.assertIsNotNone(read_columnar_file('foo', self.sidecar, os.stat(self.filename)))
+
+    def test_empty_table(self):
+        self._write_table(['a,b'])
+        self._load()
+        table = self._load()
+        self.assertEqual(0, table.num_rows)
+        self.assertEqual(['a', 'b'], table.column_names)
+
+    def test_table_cache_without_columnar_files(self):
+        self._write_table(['a,b', '1,x'])
+        cached = TableCache(columnar_files=False).get(self.directory.name, 'foo')
+        self.assertEqual([1], list(cached.table.values('a')))
+        self.assertFalse(os.path.exists(self.sidecar))
+
+        TableCache().get(self.directory.name, 'foo')
+        self.assertTrue(os.path.exists(self.sidecar))
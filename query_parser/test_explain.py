@@ -0,0 +1,46 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from query_parser.explain import explain, match_explain
+from query_parser.operators import configuration
+from query_parser.table_cache import table_cache
+
+
+class TestExplain(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.previous_data_path = configuration.get('data_path')
+        configuration['data_path'] = self.directory.name
+        with open(os.path.join(self.directory.name, 'foo.csv'), 'w') as f:
+            f.write('\n'.join(['a,b'] + [f'{i},{"xy"[i % 2]}' for i in range(100)]) + '\n')
+
+    def tearDown(self):
+        configuration['data_path'] = self.previous_data_path
+        table_cache.invalidate('foo')
+        self.directory.cleanup()
+
+    def test_match_explain(self):
+        self.assertEqual((False, 'SELECT a FROM foo;'), match_explain('EXPLAIN SELECT a FROM foo;'))
+        self.assertEqual((True, 'SELECT a FROM foo;'), match_explain('EXPLAIN ANALYZE  SELECT a\nFROM foo;'))
+        self.assertIsNone(match_explain('SELECT a FROM foo;'))
+
+    def test_plan(self):
+        rows = list(explain('SELECT a FROM foo WHERE b = x ORDER BY a DESC LIMIT 3;'))
+        self.assertEqual(['QUERY', 'FROM', 'WHERE', 'ORDER BY', 'LIMIT', 'SELECT'], [row[0] for row in rows])
+        self.assertIn('bitmap indexes', rows[2][1])
+        self.assertIn('top 3', rows[3][1])
+
+    def test_analyze(self):
+        rows = list(explain('SELECT b, COUNT(a) FROM foo WHERE a > 9 GROUP BY b; SELECT a FROM foo LIMIT 2;', True))
+        self.assertEqual(['QUERY', 'FROM', 'WHERE', 'GROUP BY', 'RESULT', 'QUERY', 'FROM', 'LIMIT', 'SELECT', 'RESULT'],
+                         [row[0] for row in rows])
+
+        where, group_by = (dict(field.split('=') for field in row[2:]) for row in rows[2:4])
+        self.assertEqual(('100', '90'), (where['rows_in'], where['rows_out']))
+        self.assertEqual(('90', '2'), (group_by['rows_in'], group_by['rows_out']))
+        self.assertTrue(where['time'].endswith('ms'))
+        self.assertGreater(int(where['bytes_read']), 0)
+        self.assertEqual('rows=2', rows[4][1])
+        self.assertEqual('rows_out=2', rows[7][4])
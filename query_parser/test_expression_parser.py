@@ -1,7 +1,8 @@
 from unittest import TestCase
 
 from query_parser.expression_parser import build_expression_from_tokens, EqualsExpression, LessThanExpression, \
-    GreaterThanExpression, AndExpression, NotExpression
+    GreaterThanExpression, AndExpression, NotExpression, compile_expression
+from query_parser.table import ColumnTable, ColumnBatch, RowView, Schema, infer_column, RowTable
 
 
 class TestExpressionParser(TestCase):
@@ -55,3 +56,80 @@ class TestExpressionParser(TestCase):
         self.assertIsInstance(expr, EqualsExpression)
         self.assertEqual(expr.fieldname, 'foo')
         self.assertEqual('bar', expr.value)
+
+
+class TestBatchEvaluation(TestCase):
+
+    def setUp(self):
+        self.table = ColumnTable('t', [
+            infer_column('a', ['1', '5', 'NA', '3', '7', '2']),
+            infer_column('b', ['x', 'y', 'x', 'NA', 'z', 'x']),
+            infer_column('c', ['0.5', '1.5', '2.5', '3.5', '4.5', '5.5']),
+        ])
+
+    def _assert_batch_matches_rows(self, s):
+        clause = build_expression_from_tokens(s.split())
+        expected = bytes(clause.apply(RowView(self.table, i)) for i in range(self.table.num_rows))
+
+        self.assertEqual(expected, clause.evaluate(ColumnBatch(self.table, range(self.table.num_rows))))
+        self.assertEqual(expected[1::2], clause.evaluate(ColumnBatch(self.table, [1, 3, 5])))
+        return expected
+
+    def test_numeric_comparison(self):
+        self.assertEqual(b'\x00\x01\x00\x00\x01\x00', self._assert_batch_matches_rows('a > 4'))
+
+    def test_string_comparison(self):
+        self.assertEqual(b'\x01\x00\x01\x00\x00\x01', self._assert_batch_matches_rows('b = x'))
+
+    def test_missing_values(self):
+        self._assert_batch_matches_rows('a < 4')
+        self._assert_batch_matches_rows('NOT b = "NA"')
+
+    def test_boolean_operators(self):
+        self._assert_batch_matches_rows('a > 1 AND b = x')
+        self._assert_batch_matches_rows('a > 6 OR b = y')
+        self._assert_batch_matches_rows('c = "1.5" OR c > 3')
+
+    def test_boolean_constants(self):
+        table = ColumnTable('t', [infer_column('d', ['0', '1', 'NA', '2', '0'])])
+        rows = RowTable('t', ['d'], [('0',), ('1',), ('NA',), ('2',), ('0',)])
+        for s in ('d = true', 'd = false', 'NOT d = True'):
+            clause = build_expression_from_tokens(s.split())
+            # Booleans are compared with the text of the values as the row store holds it, so zeros are true
+            expected = bytes(map(compile_expression(clause, rows.schema), rows.rows))
+            self.assertEqual(expected, clause.evaluate(ColumnBatch(table, range(table.num_rows))))
+            self.assertEqual(expected, bytes(clause.apply(RowView(table, i)) for i in range(table.num_rows)))
+            self.assertEqual(expected, bytes(map(compile_expression(clause), map(table.row, range(table.num_rows)))))
+
+
+class TestCompiledExpression(TestCase):
+
+    rows = [
+        {'a': '1', 'b': 'x', 'c': ''},
+        {'a': '5', 'b': 'y', 'c': 'foo'},
+        {'a': 'NA', 'b': 'x', 'c': 'bar'},
+        {'a': '7', 'b': 'z', 'c': ''},
+    ]
+
+    def _assert_compiled_matches_tree(self, s):
+        clause = build_expression_from_tokens(s.split())
+        predicate = compile_expression(clause)
+        expected = [clause.apply(row) for row in self.rows]
+        self.assertEqual(expected, [predicate(row) for row in self.rows])
+
+        # Rows of the row store are read by position
+        schema = Schema(['a', 'b', 'c'])
+        predicate = compile_expression(clause, schema)
+        self.assertEqual(expected, [predicate(tuple(row.values())) for row in self.rows])
+        return expected
+
+    def test_comparisons(self):
+        self.assertEqual([False, True, False, True], self._assert_compiled_matches_tree('a > 4'))
+        self.assertEqual([True, False, True, False], self._assert_compiled_matches_tree('b = x'))
+        self._assert_compiled_matches_tree('a < 6')
+        self._assert_compiled_matches_tree('c = True')
+
+    def test_boolean_operators(self):
+        self._assert_compiled_matches_tree('a > 1 AND b = x')
+        self._assert_compiled_matches_tree('a > 6 OR b = "y"')
+        self._assert_compiled_matches_tree('NOT a > 4')
@@ -0,0 +1,148 @@
+from unittest import TestCase
+
+from query_parser import indexes
+from query_parser.aggregators import aggregate, Count
+from query_parser.expression_parser import build_expression_from_tokens
+from query_parser.indexes import declare_index, find_index, prepare_indexes, append_indexes, HASH, SORTED, BITMAP
+from query_parser.masks import bitmap_to_row_ids
+from query_parser.operators import WhereOperator
+from query_parser.table import ColumnTable, TableScan, RowView, infer_column
+
+
+class TestIndexes(TestCase):
+
+    def setUp(self):
+        self.table = ColumnTable('t', [
+            infer_column('a', ['3', '1', 'NA', '3', '7', '2']),
+            infer_column('b', ['x', 'y', 'x', 'z', 'z', 'x']),
+            infer_column('c', ['1', '0', '1', '0', '1', '0']),
+        ])
+        declare_index('t', 'a', SORTED)
+        declare_index('t', 'b', HASH)
+
+    def tearDown(self):
+        indexes.index_definitions.clear()
+
+    def _matching(self, s):
+        clause = build_expression_from_tokens(s.split())
+        return [i for i in range(self.table.num_rows) if clause.apply(RowView(self.table, i))], clause
+
+    def _assert_candidates(self, s, exact):
+        expected, clause = self._matching(s)
+        row_ids, is_exact = clause.candidates(self.table)
+        self.assertEqual(exact, is_exact)
+        if exact:
+            self.assertEqual(expected, list(row_ids))
+        else:
+            self.assertTrue(set(expected).issubset(row_ids))
+
+    def test_hash_index(self):
+        index = find_index(self.table, 'b', HASH)
+        self.assertEqual([0, 2, 5], list(index.equal('x')))
+        self.assertEqual([], list(index.equal('w')))
+
+    def test_sorted_index(self):
+        index = find_index(self.table, 'a', SORTED)
+        self.assertEqual([0, 3, 4], index.greater_than(2))
+        self.assertEqual([1, 5], index.less_than(3))
+        self.assertEqual([0, 3], index.equal(3))
+
+    def test_undeclared_index(self):
+        self.assertIsNone(find_index(self.table, 'a', HASH))
+
+    def test_index_on_missing_column(self):
+        declare_index('t', 'd', HASH)
+        with self.assertLogs(level='WARNING'):
+            prepare_indexes(self.table)
+        self.assertNotIn('d', indexes.index_definitions['t'])
+        self.assertIsNotNone(find_index(self.table, 'b', HASH))
+
+    @staticmethod
+    def _build_every_index(table):
+        for column in table.column_names:
+            for kind in (HASH, SORTED, BITMAP):
+                find_index(table, column, kind)
+
+    def test_indexes_are_built_when_needed(self):
+        prepare_indexes(self.table, bitmap_threshold=3)
+        self.assertEqual({}, self.table.indexes)
+        self.assertIsNotNone(find_index(self.table, 'c', BITMAP))
+        self.assertIsNone(find_index(self.table, 'a', BITMAP))
+        self.assertEqual([('c', BITMAP)], list(self.table.indexes))
+
+    @staticmethod
+    def _lookups(index, value):
+        row_ids = [index.equal(value), index.less_than(value), index.greater_than(value)]
+        return [None if found is None else list(found) for found in row_ids]
+
+    def test_appended_indexes(self):
+        prepare_indexes(self.table, bitmap_threshold=3)
+        self._build_every_index(self.table)
+        appended = self.table
+        for rows in ([['2', 'x', '1'], ['NA', 'w', '0']], [['3', 'y', '1']], [['0', 'x', '0'], ['3', 'z', '1']]):
+            table, appended = appended, appended.append(rows)
+            append_indexes(table, appended, table.num_rows, bitmap_threshold=3)
+        self._build_every_index(appended)
+
+        rebuilt = ColumnTable('t', appended.columns)
+        prepare_indexes(rebuilt, bitmap_threshold=3)
+        self._build_every_index(rebuilt)
+        self.assertEqual(sorted(rebuilt.indexes), sorted(appended.indexes))
+        for key, index in rebuilt.indexes.items():
+            appended_index = appended.indexes[key]
+            self.assertEqual(index.nbytes, appended_index.nbytes)
+            for value in set(rebuilt.values(key[0])) - {None}:
+                self.assertEqual(self._lookups(index, value), self._lookups(appended_index, value))
+        self.assertEqual([0, 3], find_index(self.table, 'a', SORTED).equal(3))
+
+    def test_expression_candidates(self):
+        self._assert_candidates('a > 2', True)
+        self._assert_candidates('b = x AND a < 3', True)
+        self._assert_candidates('b = z OR a = 1', True)
+
+    def test_partially_indexed_and(self):
+        self._assert_candidates('b = x AND c = 1', False)
+
+    def test_unindexed_expressions(self):
+        self.assertIsNone(build_expression_from_tokens('NOT a > 2'.split()).candidates(self.table))
+        self.assertIsNone(build_expression_from_tokens('a = "3"'.split()).candidates(self.table))
+
+
+class TestBitmapIndexes(TestCase):
+
+    def setUp(self):
+        self.table = ColumnTable('t', [
+            infer_column('a', ['1', '0', 'NA', '1', '0', '1']),
+            infer_column('b', ['x', 'y', 'x', 'NA', 'z', 'x']),
+            infer_column('c', [str(i) for i in range(6)]),
+        ])
+        prepare_indexes(self.table, bitmap_threshold=4)
+
+    def _assert_bitmap_matches_rows(self, s):
+        clause = build_expression_from_tokens(s.split())
+        expected = [i for i in range(self.table.num_rows) if clause.apply(RowView(self.table, i))]
+        self.assertEqual(expected, list(bitmap_to_row_ids(clause.bitmap(self.table))))
+
+    def test_low_cardinality_columns_are_indexed(self):
+        self.assertIsNotNone(find_index(self.table, 'a', BITMAP))
+        self.assertIsNotNone(find_index(self.table, 'b', BITMAP))
+        self.assertIsNone(find_index(self.table, 'c', BITMAP))
+
+    def test_bitmap_expressions(self):
+        self._assert_bitmap_matches_rows('a = 1')
+        self._assert_bitmap_matches_rows('b = x AND a = 1')
+        self._assert_bitmap_matches_rows('b = y OR a > 0')
+        self._assert_bitmap_matches_rows('NOT b = x')
+        self._assert_bitmap_matches_rows('NOT a = 1')
+
+    def test_unindexed_column(self):
+        self.assertIsNone(build_expression_from_tokens('a = 1 AND c = 1'.split()).bitmap(self.table))
+
+    def test_count_is_a_popcount(self):
+        where = WhereOperator()
+        where.expression_buffer = 'b = x OR a = 0'.split()
+        where.validate()
+        scan = where.apply(TableScan(self.table))
+
+        self.assertIsNotNone(scan.bitmap)
+        self.assertEqual([5], aggregate([Count('c')], scan))
@@ -0,0 +1,52 @@
+from unittest import TestCase
+
+from query_parser.metrics import Metrics, Histogram, RateCounter, query_shape, match_show_stats, SELECT, WHERE, \
+    AGGREGATE
+
+
+class TestMetrics(TestCase):
+
+    def test_query_shape(self):
+        self.assertEqual(SELECT, query_shape('SELECT a FROM foo LIMIT 3;'))
+        self.assertEqual(WHERE, query_shape('SELECT a FROM foo WHERE b = x;'))
+        self.assertEqual(AGGREGATE, query_shape('SELECT a FROM foo; SELECT COUNT(a) FROM foo WHERE b = x;'))
+        self.assertEqual(AGGREGATE, query_shape('SELECT a FROM foo GROUP BY a;'))
+
+    def test_match_show_stats(self):
+        self.assertTrue(match_show_stats('SHOW STATS;'))
+        self.assertTrue(match_show_stats(' SHOW  STATS '))
+        self.assertFalse(match_show_stats('SELECT a FROM foo;'))
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram(bounds=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value)
+
+        self.assertEqual(['x_bucket{le="0.1"} 2', 'x_bucket{le="1.0"} 3', 'x_bucket{le="+Inf"} 4', 'x_sum 3.650000',
+                          'x_count 4'], histogram.lines('x', {}))
+
+    def test_rate_counter_window(self):
+        rate = RateCounter(window=10)
+        for now in (100.1, 100.5, 105.0, 109.9):
+            rate.add(now)
+        self.assertEqual(0.4, rate.rate(109.9, 1000))
+        # Seconds which slid out of the window no longer count
+        self.assertEqual(0.2, rate.rate(110.5, 1000))
+        self.assertEqual(4.0, rate.rate(109.9, 0.5))
+
+    def test_render(self):
+        metrics = Metrics()
+        metrics.connection_opened()
+        metrics.record_request(WHERE, 0.002, 10, 100)
+        metrics.record_request(WHERE, 0.2, 0, 20, failed=True)
+        metrics.record_table_load('foo', 0.5, 1000)
+        lines = metrics.render({'extra_gauge': 7})
+
+        self.assertIn('sql_active_connections 1', lines)
+        self.assertIn('sql_rows_sent_total 10', lines)
+        self.assertIn('sql_bytes_sent_total 120', lines)
+        self.assertIn('sql_request_seconds_count{shape="where"} 2', lines)
+        self.assertIn('sql_request_seconds_bucket{shape="where",le="0.0025"} 1', lines)
+        self.assertIn('sql_request_errors_total{shape="where"} 1', lines)
+        self.assertIn('sql_table_rows{table="foo"} 1000', lines)
+        self.assertEqual('extra_gauge 7', lines[-1])
@@ -0,0 +1,136 @@
+from unittest import TestCase
+
+from query_parser.operators import WhereOperator, LimitOperator, SelectOperator, GroupByOperator, OrderByOperator, \
+    configuration
+from query_parser.parser import QueryParser
+
+
+def make_operator(operator_type, expression):
+    operator = operator_type()
+    operator.expression_buffer = expression.split()
+    operator.validate()
+    return operator
+
+
+class TestStreamingOperators(TestCase):
+
+    def setUp(self):
+        self.consumed = 0
+
+    def _rows(self, count):
+        for i in range(count):
+            self.consumed += 1
+            yield {'a': str(i), 'b': str(i % 2)}
+
+    def test_limit_stops_scan(self):
+        where = make_operator(WhereOperator, 'b = 1')
+        limit = make_operator(LimitOperator, '3')
+
+        rows = list(limit.apply(where.apply(self._rows(1000))))
+        self.assertEqual(['1', '3', '5'], [row['a'] for row in rows])
+        self.assertEqual(6, self.consumed)
+
+    def test_select_is_lazy(self):
+        select = make_operator(SelectOperator, 'a, b')
+        output = select.apply(self._rows(1000))
+
+        self.assertEqual(('0', '0'), next(output))
+        self.assertEqual(1, self.consumed)
+
+    def test_aggregate_select(self):
+        select = make_operator(SelectOperator, 'COUNT(a), MAX(a)')
+        output = [tuple(row) for row in select.apply(self._rows(10))]
+        self.assertEqual([(10, 9.0)], output)
+
+    def test_aggregates_share_one_pass(self):
+        select = make_operator(SelectOperator, 'AVG(a), MIN(a), MAX(a), SUM(a), COUNT(a)')
+        output = [tuple(row) for row in select.apply(self._rows(10))]
+        self.assertEqual([(4.0, 0.0, 9.0, 45.0, 10)], output)
+        self.assertEqual(10, self.consumed)
+
+
+class TestGroupBy(TestCase):
+
+    rows = [
+        {'a': 'x', 'b': '1', 'c': '10'},
+        {'a': 'y', 'b': '1', 'c': '20'},
+        {'a': 'x', 'b': '2', 'c': '30'},
+        {'a': 'x', 'b': '1', 'c': '40'},
+    ]
+
+    def _group_by(self, select_expression, group_by_expression):
+        select = make_operator(SelectOperator, select_expression)
+        group_by = make_operator(GroupByOperator, group_by_expression)
+        group_by.bind(select)
+        return group_by
+
+    def test_single_key(self):
+        group_by = self._group_by('a, COUNT(c), SUM(c)', 'a')
+        self.assertEqual([('x', 3, 80.0), ('y', 1, 20.0)], list(group_by.apply(self.rows)))
+
+    def test_multiple_keys(self):
+        group_by = self._group_by('MAX(c), b, a', 'a, b')
+        self.assertEqual([(40.0, '1', 'x'), (20.0, '1', 'y'), (30.0, '2', 'x')], list(group_by.apply(self.rows)))
+
+    def test_ungrouped_column(self):
+        with self.assertRaises(ValueError):
+            self._group_by('a, c', 'a')
+
+    def test_group_cap(self):
+        configuration['max_groups'] = 1
+        try:
+            with self.assertRaises(ValueError):
+                list(self._group_by('a, COUNT(c)', 'a').apply(self.rows))
+        finally:
+            del configuration['max_groups']
+
+    def test_parse_group_by(self):
+        query = QueryParser().parse('SELECT a, COUNT(b) FROM foo WHERE b > 1 GROUP BY a LIMIT 2;')[0]
+        self.assertIsInstance(query.operators[3], GroupByOperator)
+        self.assertEqual(['a'], query.operators[3].columns)
+
+
+class TestOrderBy(TestCase):
+
+    rows = [
+        {'a': 'x', 'b': '10', 'c': '1'},
+        {'a': 'y', 'b': '9', 'c': 'NA'},
+        {'a': 'x', 'b': '100', 'c': '2'},
+        {'a': 'z', 'b': '9', 'c': '3'},
+    ]
+
+    def _order(self, expression, limit=None):
+        return [row['b'] for row in make_operator(OrderByOperator, expression).apply(self.rows, limit)]
+
+    def test_numeric_values(self):
+        self.assertEqual(['9', '9', '10', '100'], self._order('b'))
+
+    def test_multiple_keys(self):
+        self.assertEqual(['100', '10', '9', '9'], self._order('a, b DESC'))
+        self.assertEqual(['9', '9', '10', '100'], self._order('a DESC, b ASC'))
+
+    def test_missing_values_come_last(self):
+        self.assertEqual(['9', '100', '10', '9'], self._order('c DESC'))
+
+    def test_limit_keeps_top_rows(self):
+        self.assertEqual(['100', '10'], self._order('b DESC', limit=2))
+
+    def test_invalid_direction(self):
+        with self.assertRaises(ValueError):
+            make_operator(OrderByOperator, 'b DOWN')
+
+    def test_order_groups(self):
+        query = QueryParser().parse('SELECT a, COUNT(b) FROM foo GROUP BY a ORDER BY COUNT(b) DESC, a;')[0]
+        self.assertEqual([1, 0], query.operators[3].positions)
+        with self.assertRaises(ValueError):
+            QueryParser().parse('SELECT a, COUNT(b) FROM foo GROUP BY a ORDER BY SUM(b);')
+
+    def test_order_distinct_values(self):
+        query = QueryParser().parse('SELECT DISTINCT a FROM foo ORDER BY a DESC;')[0]
+        data = self.rows
+        # Every stage after the FROM, which would read the table
+        for _, stage in query.stages()[1:]:
+            data = stage(data)
+        self.assertEqual([('z',), ('y',), ('x',)], list(data))
+        with self.assertRaises(ValueError):
+            QueryParser().parse('SELECT DISTINCT a FROM foo ORDER BY b;')
@@ -0,0 +1,83 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from query_parser.operators import configuration
+from query_parser.parallel import ParallelScan
+from query_parser.parser import QueryParser
+from query_parser.query import Query
+from query_parser.table_cache import table_cache
+
+
+def set_data_path(data_path):
+    configuration['data_path'] = data_path
+
+
+class TestParallelScan(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        with open(os.path.join(cls.directory.name, 'foo.csv'), 'w') as f:
+            f.write('a,b,c\n')
+            for i in range(1000):
+                f.write(f'{i},{"xyz"[i % 3]},{"NA" if i % 7 == 0 else i % 11}\n')
+
+        cls.scan = ParallelScan(threshold=100)
+        cls.scan.start(3, initializer=set_data_path, initargs=(cls.directory.name,))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.scan.shutdown()
+        cls.directory.cleanup()
+
+    def setUp(self):
+        self.previous_data_path = configuration.get('data_path')
+        configuration['data_path'] = self.directory.name
+
+    def tearDown(self):
+        configuration['data_path'] = self.previous_data_path
+        table_cache.invalidate('foo')
+
+    def _compare(self, query_string):
+        query, = QueryParser().parse(query_string)
+        parallel = list(self.scan.execute(query))
+        self.assertEqual(list(query.execute_rows()), parallel)
+        return parallel
+
+    def test_aggregates(self):
+        rows = self._compare('SELECT AVG(c), MIN(c), MAX(c), SUM(c), COUNT(c) FROM foo WHERE a > 10;')
+        self.assertEqual(1, len(rows))
+
+    def test_group_by(self):
+        rows = self._compare('SELECT b, COUNT(a), SUM(c), MAX(a) FROM foo WHERE c < 5 GROUP BY b LIMIT 2;')
+        self.assertEqual(2, len(rows))
+
+    def test_approximate_aggregates(self):
+        rows = self._compare('SELECT APPROX_COUNT_DISTINCT(a), APPROX_COUNT_DISTINCT(b) FROM foo WHERE c > 1;')
+        self.assertEqual(3, rows[0][1])
+
+    def test_no_matching_rows(self):
+        self._compare('SELECT AVG(c), MIN(c) FROM foo WHERE a > 5000;')
+
+    def test_distinct(self):
+        query, = QueryParser().parse('SELECT DISTINCT b FROM foo WHERE c > 3;')
+        self.assertEqual(sorted(query.execute_rows()), sorted(self.scan.execute(query)))
+
+    def test_serial_below_threshold(self):
+        query, = QueryParser().parse('SELECT SUM(a) FROM foo;')
+        self.scan.threshold = 10000
+        try:
+            with patch.object(Query, 'merge_partitions') as merge_partitions:
+                self.assertEqual([(499500,)], list(self.scan.execute(query)))
+                merge_partitions.assert_not_called()
+        finally:
+            self.scan.threshold = 100
+
+    def test_projection_and_limit_stay_serial(self):
+        table = table_cache.get(self.directory.name, 'foo').table
+        for query_string in ('SELECT a FROM foo WHERE c > 3;', 'SELECT SUM(a) FROM foo LIMIT 10;',
+                             'SELECT COUNT(a) FROM foo;'):
+            query, = QueryParser().parse(query_string)
+            self.assertFalse(query.partitionable(table))
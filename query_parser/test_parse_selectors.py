@@ -1,6 +1,8 @@
 from unittest import TestCase
 
-from query_parser.aggregators import parse_select_statement, Average, Extractor, Distinct
+from query_parser.aggregators import parse_select_statement, Average, Extractor, Distinct, ApproxCountDistinct, \
+    ApproxPercentile
+from query_parser.parser import QueryParser
 
 
 class TestParseSelect(TestCase):
@@ -21,3 +23,26 @@ class TestParseSelect(TestCase):
         self.assertIsInstance(output_fields[0], Distinct)
         self.assertEqual(output_fields[0].column, 'foo')
         self.assertIsInstance(output_fields[1], Extractor)
+
+    def test_parse_approximate_aggregates(self):
+        tokens = 'APPROX_COUNT_DISTINCT(foo), APPROX_PERCENTILE(bar, 0.9),baz'
+        output_fields = parse_select_statement(tokens.split())
+
+        self.assertEqual(3, len(output_fields))
+        self.assertIsInstance(output_fields[0], ApproxCountDistinct)
+        self.assertIsInstance(output_fields[1], ApproxPercentile)
+        self.assertEqual(('bar', 0.9), (output_fields[1].column, output_fields[1].fraction))
+        self.assertIsInstance(output_fields[2], Extractor)
+
+    def test_invalid_percentile(self):
+        with self.assertRaises(ValueError):
+            parse_select_statement(['APPROX_PERCENTILE(bar, 2)'])
+
+
+class TestQueryParser(TestCase):
+
+    def test_final_token_is_stripped_of_semicolon(self):
+        parser = QueryParser()
+        parser.parse('SELECT a FROM foo; SELECT b FROM bar;')
+
+        self.assertEqual(['SELECT', 'a', 'FROM', 'foo', ';', 'SELECT', 'b', 'FROM', 'bar', ';'], parser.tokens)
@@ -0,0 +1,83 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from query_parser.operators import configuration
+from query_parser.plan_cache import PlanCache
+from query_parser.prepared import PreparedStatements, match_prepare, match_execute, execute_prepared
+from query_parser.parser import QueryParser
+from query_parser.table_cache import table_cache
+
+
+class TestPreparedStatements(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.previous_data_path = configuration.get('data_path')
+        configuration['data_path'] = self.directory.name
+        with open(os.path.join(self.directory.name, 'foo.csv'), 'w') as f:
+            f.write('a,b\n1,x\n2,y\n3,x\n4,x\n')
+
+    def tearDown(self):
+        configuration['data_path'] = self.previous_data_path
+        table_cache.invalidate('foo')
+        self.directory.cleanup()
+
+    def _execute(self, statements, request):
+        return [tuple(map(str, row)) for row in execute_prepared(*statements.bind(*match_execute(request)))]
+
+    def test_match_requests(self):
+        self.assertEqual(('q', 'SELECT a FROM foo WHERE b = ?;'),
+                         match_prepare('PREPARE q AS SELECT a\nFROM foo WHERE b = ?;'))
+        self.assertEqual(('q', ['x', "'a, b'", '3']), match_execute("EXECUTE q(x, 'a, b', 3);"))
+        self.assertIsNone(match_execute('SELECT a FROM foo;'))
+
+    def test_bound_values(self):
+        statements = PreparedStatements()
+        statements.prepare(*match_prepare('PREPARE q AS SELECT a FROM foo WHERE b = ? AND a > ? LIMIT ?;'))
+
+        self.assertEqual([('3',), ('4',)], self._execute(statements, 'EXECUTE q(x, 1, 5);'))
+        self.assertEqual([('1',)], self._execute(statements, 'EXECUTE q(x, 0, 1);'))
+        self.assertEqual([('2',)], self._execute(statements, 'EXECUTE q(y, 0, 5);'))
+
+    def test_execute_skips_parsing(self):
+        statements = PreparedStatements()
+        statements.prepare('q', 'SELECT COUNT(a) FROM foo WHERE b = ?;')
+        with patch.object(QueryParser, 'parse') as parse:
+            self.assertEqual([('3',)], self._execute(statements, 'EXECUTE q(x);'))
+            parse.assert_not_called()
+
+    def test_wrong_parameter_count(self):
+        statements = PreparedStatements()
+        statements.prepare('q', 'SELECT a FROM foo WHERE b = ?;')
+        with self.assertRaises(ValueError):
+            statements.bind('q', ['x', 'y'])
+        with self.assertRaises(ValueError):
+            statements.bind('missing', [])
+
+    def test_quoted_placeholder_is_a_value(self):
+        statements = PreparedStatements()
+        statements.prepare('q', "SELECT a FROM foo WHERE b = '?';")
+        self.assertEqual([], self._execute(statements, 'EXECUTE q();'))
+
+    def test_unbound_placeholder(self):
+        query, = QueryParser().parse('SELECT a FROM foo WHERE b = ?;')
+        with self.assertRaises(ValueError):
+            list(query.execute_rows())
+
+
+class TestPlanCache(TestCase):
+
+    def test_repeated_request_is_parsed_once(self):
+        cache = PlanCache()
+        first = cache.parse('SELECT a FROM foo WHERE b = x;')
+        self.assertIs(first, cache.parse(' SELECT a  FROM foo\nWHERE b = x; '))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = PlanCache(size=1)
+        cache.parse('SELECT a FROM foo;')
+        cache.parse('SELECT b FROM foo;')
+        self.assertNotIn('SELECT a FROM foo;', cache)
+        self.assertEqual(1, len(cache))
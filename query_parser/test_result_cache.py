@@ -0,0 +1,83 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from query_parser.operators import configuration
+from query_parser.query import Query
+from query_parser.result_cache import ResultCache
+from query_parser.table_cache import table_cache
+
+
+class TestResultCache(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.previous_data_path = configuration.get('data_path')
+        configuration['data_path'] = self.directory.name
+        self._write_table('foo', ['a,b', '1,x', '2,y', '3,x'])
+
+    def tearDown(self):
+        configuration['data_path'] = self.previous_data_path
+        table_cache.invalidate('foo')
+        self.directory.cleanup()
+
+    def _write_table(self, name, lines, mode='w'):
+        with open(os.path.join(self.directory.name, f'{name}.csv'), mode) as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def test_repeated_query_is_a_hit(self):
+        cache = ResultCache(budget=1024 * 1024)
+        self.assertEqual([(2,)], list(cache.execute('SELECT COUNT(a) FROM foo WHERE b = x;')))
+
+        with patch('query_parser.result_cache.plan_cache') as plans:
+            rows = list(cache.execute('SELECT  COUNT(a)\nFROM foo   WHERE b = x;'))
+            plans.parse.assert_not_called()
+        self.assertEqual([(2,)], rows)
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+    def test_changed_table_is_a_miss(self):
+        cache = ResultCache(budget=1024 * 1024)
+        list(cache.execute('SELECT COUNT(a) FROM foo;'))
+
+        self._write_table('foo', ['a,b', '1,x', '2,y', '3,x', '4,y'])
+        self.assertEqual([(4,)], list(cache.execute('SELECT COUNT(a) FROM foo;')))
+        self.assertEqual(2, cache.misses)
+
+    def test_appended_rows_refresh_aggregates(self):
+        cache = ResultCache(budget=1024 * 1024)
+        request = 'SELECT COUNT(a), SUM(a) FROM foo WHERE b = x; SELECT b, MAX(a) FROM foo GROUP BY b;'
+        table_cache.incremental = True
+        try:
+            self.assertEqual([(2, 4), ('x', 3), ('y', 2)], list(cache.execute(request)))
+
+            self._write_table('foo', ['4,x', '5,z'], 'a')
+            with patch('query_parser.query.Query.aggregate_partition', autospec=True,
+                       side_effect=Query.aggregate_partition) as aggregate_partition:
+                rows = list(cache.execute(request))
+            self.assertEqual([(3, 8), ('x', 4), ('y', 2), ('z', 5)], rows)
+            self.assertEqual([range(3, 5)] * 2, [call[0][2] for call in aggregate_partition.call_args_list])
+            self.assertEqual((1, 1), (cache.misses, cache.refreshes))
+        finally:
+            table_cache.incremental = False
+
+    def test_budget_evicts_least_recently_used(self):
+        cache = ResultCache(budget=1024 * 1024)
+        list(cache.execute('SELECT a FROM foo;'))
+        cache.budget = cache.nbytes * 2
+        list(cache.execute('SELECT b FROM foo;'))
+
+        self.assertNotIn('SELECT a FROM foo;', cache)
+        self.assertIn('SELECT b FROM foo;', cache)
+        self.assertLessEqual(cache.nbytes, cache.budget)
+
+    def test_oversized_result_is_not_cached(self):
+        cache = ResultCache(budget=1)
+        rows = cache.execute('SELECT a FROM foo WHERE b = x;')
+        self.assertEqual([('1',), ('3',)], [tuple(map(str, row)) for row in rows])
+        self.assertEqual(0, len(cache))
+
+    def test_disabled(self):
+        cache = ResultCache()
+        list(cache.execute('SELECT a FROM foo;'))
+        self.assertEqual((0, 0, 0), (len(cache), cache.hits, cache.misses))
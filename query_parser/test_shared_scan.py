@@ -0,0 +1,93 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from query_parser.aggregators import aggregate_states
+from query_parser.operators import configuration
+from query_parser.parser import QueryParser
+from query_parser.query import Query
+from query_parser.shared_scan import SharedScan, SharedFilter
+from query_parser.table_cache import table_cache
+
+
+class TestSharedScan(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        with open(os.path.join(cls.directory.name, 'foo.csv'), 'w') as f:
+            f.write('a,b,c\n')
+            for i in range(20000):
+                f.write(f'{i},{"xyz"[i % 3]},{"NA" if i % 7 == 0 else i % 11}\n')
+        with open(os.path.join(cls.directory.name, 'bar.csv'), 'w') as f:
+            f.write('d\n1\n2\n3\n')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def setUp(self):
+        self.previous_data_path = configuration.get('data_path')
+        configuration['data_path'] = self.directory.name
+        self.scan = SharedScan()
+
+    def tearDown(self):
+        configuration['data_path'] = self.previous_data_path
+        table_cache.columnar = True
+        table_cache.invalidate('foo')
+        table_cache.invalidate('bar')
+
+    def _compare(self, query_string):
+        queries = QueryParser().parse(query_string)
+        expected = [row for query in queries for row in query.execute_rows()]
+        self.assertEqual(expected, list(self.scan.execute(QueryParser().parse(query_string))))
+        return expected
+
+    def test_matches_unshared(self):
+        query_string = ('SELECT COUNT(a), SUM(c) FROM foo WHERE a > 100; SELECT MAX(a) FROM foo WHERE a > 100; '
+                        'SELECT b, COUNT(a) FROM foo GROUP BY b; SELECT a, c FROM foo WHERE c < 2 LIMIT 5; '
+                        'SELECT AVG(c), MIN(a) FROM foo; SELECT a FROM foo WHERE a > 19990; '
+                        'SELECT b, c FROM foo WHERE a > 10 AND a < 14;')
+        for columnar in (True, False):
+            table_cache.columnar = columnar
+            table_cache.invalidate('foo')
+            self.assertEqual(23, len(self._compare(query_string)))
+
+    def test_order_with_several_tables(self):
+        rows = self._compare('SELECT SUM(d) FROM bar; SELECT COUNT(a) FROM foo; SELECT MAX(d) FROM bar; '
+                             'SELECT MIN(a) FROM foo;')
+        self.assertEqual([(6,), (20000,), (3,), (0,)], rows)
+
+    def test_limit_stops_the_scan(self):
+        queries = QueryParser().parse('SELECT a FROM foo WHERE a > 5 LIMIT 3; SELECT b FROM foo WHERE a > 1 LIMIT 2;')
+        with patch('query_parser.shared_scan.SHARED_BATCH_SIZE', 1000), \
+                patch.object(SharedFilter, 'feed', autospec=True, side_effect=SharedFilter.feed) as feed:
+            self.assertEqual([(6,), (7,), (8,), ('z',), ('x',)], list(self.scan.execute(queries)))
+        self.assertEqual(2, feed.call_count)
+        self.assertEqual(2, len(self.scan._share(queries)))
+
+    def test_same_filter_is_evaluated_once(self):
+        query_string = 'SELECT COUNT(a) FROM foo WHERE a > 5; SELECT SUM(c) FROM foo WHERE a > 5;'
+        queries = QueryParser().parse(query_string)
+        with patch('query_parser.shared_scan.SHARED_BATCH_SIZE', 1000), \
+                patch('query_parser.shared_scan.aggregate_states', wraps=aggregate_states) as aggregate, \
+                patch.object(Query, 'filter_partition', autospec=True,
+                             side_effect=Query.filter_partition) as filter_partition:
+            rows = list(self.scan.execute(queries))
+        self.assertEqual(20, filter_partition.call_count)
+        self.assertEqual(20, aggregate.call_count)
+        self.assertEqual([row for query in QueryParser().parse(query_string) for row in query.execute_rows()], rows)
+
+    def test_invalid_query_raises_in_its_turn(self):
+        queries = QueryParser().parse('SELECT COUNT(a) FROM foo; SELECT SUM(e) FROM foo; SELECT MAX(a) FROM foo;')
+        rows = self.scan.execute(queries)
+        self.assertEqual((20000,), next(rows))
+        with self.assertRaises(ValueError):
+            next(rows)
+
+    def test_disabled(self):
+        self.scan.enabled = False
+        with patch('query_parser.shared_scan.SharedScan._scan') as scan:
+            self._compare('SELECT COUNT(a) FROM foo; SELECT MAX(a) FROM foo;')
+            scan.assert_not_called()
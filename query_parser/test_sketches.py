@@ -0,0 +1,60 @@
+import bisect
+import random
+from unittest import TestCase
+
+from query_parser.sketches import HyperLogLog, KllSketch, HLL_SPARSE_LIMIT
+
+
+class TestHyperLogLog(TestCase):
+
+    def test_small_cardinality_is_exact(self):
+        sketch = HyperLogLog()
+        sketch.update(['a', 'b', 'a', None, 1])
+        self.assertEqual(3, sketch.estimate())
+
+    def test_large_cardinality(self):
+        sketch = HyperLogLog()
+        for start in range(0, 50000, 4096):
+            sketch.update([f'case{i}' for i in range(start, min(start + 4096, 50000))])
+        self.assertAlmostEqual(50000, sketch.estimate(), delta=50000 * 0.03)
+
+    def test_merge(self):
+        sparse, dense, other = HyperLogLog(), HyperLogLog(), HyperLogLog()
+        sparse.update(range(10))
+        dense.update(range(5, HLL_SPARSE_LIMIT * 4))
+        other.update(range(HLL_SPARSE_LIMIT * 2, HLL_SPARSE_LIMIT * 8))
+
+        merged = sparse.merge(dense).merge(other)
+        self.assertAlmostEqual(HLL_SPARSE_LIMIT * 8, merged.estimate(), delta=HLL_SPARSE_LIMIT * 8 * 0.03)
+
+
+class TestKllSketch(TestCase):
+
+    def setUp(self):
+        generator = random.Random(7)
+        self.values = [generator.uniform(0, 1000) for _ in range(50000)]
+        self.ordered = sorted(self.values)
+
+    def _rank(self, value):
+        return bisect.bisect_left(self.ordered, value) / len(self.ordered)
+
+    def test_quantiles(self):
+        sketch = KllSketch()
+        for start in range(0, len(self.values), 4096):
+            sketch.update(self.values[start:start + 4096])
+
+        for fraction in (0.01, 0.25, 0.5, 0.9, 0.99):
+            self.assertAlmostEqual(fraction, self._rank(sketch.quantile(fraction)), delta=0.02)
+        self.assertLess(sum(map(len, sketch.levels)), 2000)
+
+    def test_merge(self):
+        left, right = KllSketch(), KllSketch()
+        left.update(self.values[:20000])
+        right.update(self.values[20000:])
+
+        merged = left.merge(right)
+        self.assertEqual(len(self.values), merged.count)
+        self.assertAlmostEqual(0.5, self._rank(merged.quantile(0.5)), delta=0.02)
+
+    def test_empty(self):
+        self.assertIsNone(KllSketch().quantile(0.5))
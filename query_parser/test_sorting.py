@@ -0,0 +1,26 @@
+import random
+from unittest import TestCase
+
+from query_parser.sorting import external_sort, sort_component, Descending
+
+
+class TestSorting(TestCase):
+
+    def test_sort_component(self):
+        self.assertLess(sort_component('9'), sort_component('10'))
+        self.assertLess(sort_component('10'), sort_component('abc'))
+        self.assertLess(sort_component('abc'), sort_component('NA'))
+        self.assertLess(sort_component('b', descending=True), sort_component('a', descending=True))
+        self.assertLess(sort_component(None, descending=True), (3,))
+
+    def test_spilled_sort(self):
+        values = [random.randint(0, 100) for _ in range(5000)]
+        items = [((value,), position, position) for position, value in enumerate(values)]
+
+        spilled = list(external_sort(iter(items), budget=20000))
+        self.assertEqual(sorted(items), spilled)
+
+    def test_descending_strings_survive_spilling(self):
+        items = [((Descending(value),), position, value) for position, value in enumerate('abcdefgh' * 50)]
+        ordered = [payload for _, _, payload in external_sort(iter(items), budget=2000)]
+        self.assertEqual(sorted('abcdefgh' * 50, reverse=True), ordered)
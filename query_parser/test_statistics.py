@@ -0,0 +1,138 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from query_parser.expression_parser import build_expression_from_tokens, EqualsExpression
+from query_parser.operators import WhereOperator
+from query_parser.statistics import collect_statistics, append_statistics, column_statistics, TableStatistics, \
+    DEFAULT_SELECTIVITY
+from query_parser.table import ColumnTable, RowTable, TableScan, infer_column
+
+
+def make_columns(rows: int):
+    return {
+        'a': [str(i) if i % 10 else 'NA' for i in range(rows)],
+        'b': ['x' if i % 50 == 0 else 'y' for i in range(rows)],
+        'c': [str(i % 7) for i in range(rows)],
+    }
+
+
+class TestStatistics(TestCase):
+
+    def setUp(self):
+        columns = make_columns(200)
+        self.table = ColumnTable('t', [infer_column(name, values) for name, values in columns.items()])
+        self.table.statistics = collect_statistics(self.table)
+
+    def test_numeric_statistics(self):
+        statistics = self.table.statistics['a']
+        self.assertEqual((200, 20, 180), (statistics.rows, statistics.nulls, statistics.distinct))
+        self.assertEqual((1, 199), (statistics.minimum, statistics.maximum))
+        self.assertAlmostEqual(0.45, statistics.less_than(100), delta=0.05)
+        self.assertAlmostEqual(0.45, statistics.greater_than(100), delta=0.05)
+        self.assertEqual(0, statistics.equal(500))
+
+    def test_string_frequencies(self):
+        statistics = self.table.statistics['b']
+        self.assertEqual({'x': 0.02, 'y': 0.98}, statistics.frequencies)
+        self.assertEqual(0.02, statistics.equal('x'))
+        self.assertEqual(0.98, statistics.greater_than('x'))
+        # Comparing a string column against a number says nothing about it
+        self.assertEqual(DEFAULT_SELECTIVITY, statistics.equal(1.0))
+
+    def test_row_store_statistics(self):
+        columns = make_columns(200)
+        statistics = collect_statistics(RowTable('t', list(columns), list(zip(*columns.values()))))
+        self.assertEqual(self.table.statistics['b'].frequencies, statistics['b'].frequencies)
+        self.assertEqual(int, statistics['a'].value_type)
+
+    def test_appended_statistics(self):
+        columns = make_columns(400)
+        table = ColumnTable('t', [infer_column(name, values[:200]) for name, values in columns.items()])
+        table.statistics = collect_statistics(table)
+        appended = table.append(list(zip(*columns.values()))[200:])
+        statistics = append_statistics(appended, table.statistics, 200)
+        expected = collect_statistics(appended)
+
+        for name in columns:
+            self.assertEqual((expected[name].rows, expected[name].nulls),
+                             (statistics[name].rows, statistics[name].nulls))
+            self.assertEqual((expected[name].minimum, expected[name].maximum),
+                             (statistics[name].minimum, statistics[name].maximum))
+        self.assertEqual(expected['b'].frequencies, statistics['b'].frequencies)
+        self.assertEqual(7, statistics['c'].distinct)
+        self.assertAlmostEqual(expected['a'].less_than(100), statistics['a'].less_than(100), delta=0.05)
+        self.assertAlmostEqual(expected['a'].distinct, statistics['a'].distinct, delta=40)
+
+    def test_statistics_are_collected_when_needed(self):
+        columns = make_columns(400)
+        table = ColumnTable('t', [infer_column(name, values[:200]) for name, values in columns.items()])
+        with patch('query_parser.statistics.column_statistics', wraps=column_statistics) as collect:
+            statistics = TableStatistics(table)
+            collect.assert_not_called()
+            self.assertEqual(self.table.statistics['a'].distinct, statistics['a'].distinct)
+            self.assertIs(statistics['a'], statistics.get('a'))
+            self.assertIsNone(statistics.get('d'))
+            self.assertEqual(1, collect.call_count)
+
+            # Only the statistics collected already are extended with the appended rows, the rest are still collected
+            # over every row when needed
+            appended = statistics.append(table.append(list(zip(*columns.values()))[200:]), 200)
+            self.assertEqual(2, collect.call_count)
+            self.assertEqual(400, appended['a'].rows)
+            self.assertEqual(collect_statistics(appended.table)['b'].frequencies, appended['b'].frequencies)
+
+    def test_merge_with_missing_values(self):
+        present = ColumnTable('t', [infer_column('a', ['1', '2'])])
+        missing = ColumnTable('t', [infer_column('a', ['NA', 'NA'])])
+        merged = collect_statistics(present)['a'].merge(collect_statistics(missing)['a'])
+        self.assertEqual((int, 4, 2, 2), (merged.value_type, merged.rows, merged.nulls, merged.distinct))
+        self.assertIsNone(collect_statistics(present)['a'].merge(
+            collect_statistics(ColumnTable('t', [infer_column('a', ['x'])]))['a']))
+
+    def test_and_runs_selective_operands_first(self):
+        clause = build_expression_from_tokens('c > 0 AND a > 10 AND b = x'.split())
+        planned = clause.plan(self.table)
+        self.assertIsInstance(planned.left.left, EqualsExpression)
+        self.assertEqual('b', planned.left.left.fieldname)
+
+    def test_or_runs_likely_operands_first(self):
+        clause = build_expression_from_tokens('b = x OR b = y'.split())
+        self.assertEqual('y', clause.plan(self.table).left.value)
+
+    def test_plan_without_statistics(self):
+        clause = build_expression_from_tokens('c > 0 AND a > 10 AND b = x'.split())
+        self.assertIs(clause, clause.plan(ColumnTable('t', self.table.columns)))
+
+
+class TestPlannedFilters(TestCase):
+    """
+    Planned filters select the same rows as the filters as written, on both table layouts
+    """
+
+    clauses = [
+        'c > 0 AND a > 10 AND b = x',
+        'a < 150 AND c = 3',
+        'b = y OR a > 190 OR c = 6',
+        'NOT c = 1 AND b = x OR a < 5',
+        'a > 10 AND b = "x" AND c < 4',
+    ]
+
+    def setUp(self):
+        columns = make_columns(20000)
+        self.tables = [
+            ColumnTable('t', [infer_column(name, values) for name, values in columns.items()]),
+            RowTable('t', list(columns), list(zip(*columns.values()))),
+        ]
+        self.rows = [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+    def test_same_rows(self):
+        for clause in self.clauses:
+            where = WhereOperator()
+            where.expression_buffer = clause.split()
+            where.validate()
+            expected = [i for i, row in enumerate(self.rows) if where.predicate(row)]
+
+            for table in self.tables:
+                table.statistics = collect_statistics(table)
+                with self.subTest(clause=clause, table=type(table).__name__):
+                    self.assertEqual(expected, list(where.apply(TableScan(table)).row_ids()))
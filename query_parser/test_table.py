@@ -0,0 +1,184 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from query_parser.table import infer_column, NumericColumn, StringColumn, ColumnTable, TableScan, load_csv, \
+    read_appended_rows, read_tail
+
+
+class TestInferColumn(TestCase):
+
+    def test_int_column(self):
+        column = infer_column('a', ['1', '2', '3'])
+        self.assertIsInstance(column, NumericColumn)
+        self.assertEqual(int, column.value_type)
+        self.assertIsNone(column.nulls)
+        self.assertEqual([1, 2, 3], list(column.values()))
+
+    def test_float_column(self):
+        column = infer_column('a', ['1', '2.5', '3'])
+        self.assertIsInstance(column, NumericColumn)
+        self.assertEqual(float, column.value_type)
+        self.assertEqual([1.0, 2.5, 3.0], list(column.values()))
+
+    def test_missing_values(self):
+        column = infer_column('a', ['1', 'NA', ''])
+        self.assertEqual(int, column.value_type)
+        self.assertEqual(bytearray([0, 1, 1]), column.nulls)
+        self.assertEqual([1, None, None], list(column.values()))
+        self.assertEqual([None, 1], list(column.values([2, 0])))
+
+    def test_string_column_is_dictionary_encoded(self):
+        column = infer_column('a', ['m', 'f', 'm', 'NA'])
+        self.assertIsInstance(column, StringColumn)
+        self.assertEqual(['m', 'f', 'NA'], column.dictionary)
+        self.assertEqual([0, 1, 0, 2], list(column.codes))
+        self.assertEqual(['m', 'f', 'm', None], list(column.values()))
+
+    def test_only_missing_values(self):
+        column = infer_column('a', ['NA', 'NA'])
+        self.assertIsInstance(column, StringColumn)
+        self.assertEqual([None, None], list(column.values()))
+
+
+class TestAppend(TestCase):
+
+    def test_numeric_column(self):
+        column = infer_column('a', ['1', '2'])
+        appended = column.append(['3', 'NA'])
+        self.assertEqual([1, 2, 3, None], list(appended.values()))
+        self.assertEqual([1, 2], list(column.values()))
+        self.assertIsNone(column.append(['2.5']))
+        self.assertIsNone(infer_column('a', ['1.5']).append(['x']))
+
+    def test_string_column_codes_widen(self):
+        column = infer_column('a', ['x', 'y', 'x'])
+        appended = column.append([str(i) for i in range(300)] + ['y'])
+        self.assertEqual('H', appended.codes.typecode)
+        self.assertEqual(['x', 'y', 'x'] + [str(i) for i in range(300)] + ['y'], list(appended.values()))
+        self.assertEqual(['x', 'y'], column.dictionary)
+
+    def test_append_to_an_earlier_snapshot(self):
+        column = infer_column('a', ['1', '2']).append(['3'])
+        later = column.append(['4'])
+        other = column.append(['5', 'NA'])
+        self.assertEqual([1, 2, 3, 4], list(later.values()))
+        self.assertEqual([1, 2, 3, 5, None], list(other.values()))
+        self.assertEqual([1, 2, 3], list(column.values()))
+
+        column = infer_column('b', ['x']).append(['y'])
+        later = column.append(['z'])
+        other = column.append(['w', 'z'])
+        self.assertEqual(['x', 'y', 'z'], later.dictionary)
+        self.assertEqual(['x', 'y', 'w', 'z'], other.dictionary)
+        self.assertEqual(['x', 'y', 'w', 'z'], list(other.values()))
+        self.assertEqual(['x', 'y'], column.dictionary)
+
+    def test_column_of_missing_values(self):
+        column = infer_column('a', ['NA', 'NA'])
+        self.assertEqual([None, None, None], list(column.append(['']).values()))
+        self.assertIsNone(column.append(['1']))
+
+    def test_table(self):
+        table = ColumnTable('t', [infer_column('a', ['1', '2']), infer_column('b', ['x', 'NA'])])
+        appended = table.append([['3', 'y'], ['NA', 'x']])
+        self.assertEqual(4, appended.num_rows)
+        self.assertEqual([1, 2, 3, None], list(appended.values('a')))
+        self.assertEqual(['x', None, 'y', 'x'], list(appended.values('b')))
+        self.assertEqual(2, table.num_rows)
+        self.assertIsNone(table.append([['3']]))
+
+
+class TestAppendedRows(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 't.csv')
+        self._write('a,b\n1,x\n', 'w')
+        self.size = os.path.getsize(self.filename)
+        self.tail = read_tail(self.filename, self.size)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _write(self, text, mode='a'):
+        with open(self.filename, mode) as f:
+            f.write(text)
+
+    def _read(self):
+        return read_appended_rows(self.filename, self.size, os.path.getsize(self.filename), self.tail)
+
+    def test_complete_lines_are_read(self):
+        self._write('2,y\n3,')
+        rows, offset, tail = self._read()
+        self.assertEqual([['2', 'y']], rows)
+        self.assertEqual(self.size + 4, offset)
+        self.assertEqual(b'a,b\n1,x\n2,y\n', tail)
+
+        self._write('z\n')
+        appended = read_appended_rows(self.filename, offset, os.path.getsize(self.filename), tail)
+        self.assertEqual([['3', 'z']], appended[0])
+
+    def test_rewritten_file(self):
+        self._write('a,b\n9,x\n2,y\n', 'w')
+        self.assertIsNone(self._read())
+
+    def test_file_without_line_ending(self):
+        self._write('2,y')
+        self.assertEqual(b'', read_tail(self.filename, os.path.getsize(self.filename)))
+
+    def test_load_up_to_size(self):
+        self._write('2,y\n3,z\n')
+        self.assertEqual([1], list(load_csv('t', self.filename, size=self.size).values('a')))
+        self.assertEqual([('1', 'x'), ('2', 'y')], load_csv('t', self.filename, False, self.size + 4).rows)
+
+
+class TestTableScan(TestCase):
+
+    def setUp(self):
+        self.table = ColumnTable('t', [infer_column('a', [str(i) for i in range(10)]),
+                                       infer_column('b', ['x', 'y'] * 5)])
+
+    def test_filter_and_limit(self):
+        scan = TableScan(self.table).filter(lambda row: row['b'] == 'y').limit(2)
+        self.assertEqual([1, 3], list(scan.values('a')))
+        self.assertEqual(2, scan.count())
+
+    def test_rows(self):
+        rows = list(TableScan(self.table).limit(1))
+        self.assertEqual([0, 'x'], rows[0].values())
+
+    def test_unknown_column(self):
+        with self.assertRaises(ValueError):
+            list(TableScan(self.table).values('c'))
+
+
+class TestRowTable(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        filename = os.path.join(self.directory.name, 't.csv')
+        with open(filename, 'w') as f:
+            f.write('a,b,c\n1,x,x\n2,y,x\n3,x,NA\n')
+        self.table = load_csv('t', filename, columnar=False)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_rows_are_tuples(self):
+        self.assertEqual([('1', 'x', 'x'), ('2', 'y', 'x'), ('3', 'x', 'NA')], self.table.rows)
+        self.assertEqual(1, self.table.position('b'))
+
+    def test_equal_values_are_shared(self):
+        rows = self.table.rows
+        self.assertIs(rows[0][1], rows[2][1])
+        self.assertIs(rows[0][1], rows[1][2])
+
+    def test_values(self):
+        self.assertEqual(['x', 'y', 'x'], list(self.table.values('b')))
+        self.assertEqual(['3', '1'], list(self.table.values('a', [2, 0])))
+        self.assertEqual(['y', 'x'], list(self.table.values('b', range(1, 3))))
+
+    def test_unknown_column(self):
+        with self.assertRaises(ValueError):
+            self.table.values('d')
@@ -0,0 +1,189 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from query_parser.indexes import declare_index, find_index, index_definitions, HASH
+from query_parser.operators import configuration
+from query_parser.parser import QueryParser
+from query_parser.table_cache import TableCache, table_cache
+
+
+class TestTableCache(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.data_path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _write_table(self, name, lines, mode='w'):
+        with open(os.path.join(self.data_path, f'{name}.csv'), mode) as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def test_table_is_cached(self):
+        self._write_table('foo', ['a,b', '1,2'])
+        cache = TableCache()
+
+        first = cache.get(self.data_path, 'foo')
+        second = cache.get(self.data_path, 'foo')
+        self.assertIs(first, second)
+        self.assertEqual([1], list(first.table.values('a')))
+
+    def test_rewritten_table_is_reloaded(self):
+        self._write_table('foo', ['a,b', '1,2'])
+        cache = TableCache()
+        cache.get(self.data_path, 'foo')
+
+        self._write_table('foo', ['a,b', '1,2', '3,4'])
+        cached = cache.get(self.data_path, 'foo')
+        self.assertEqual(2, cached.table.num_rows)
+
+    def test_row_store(self):
+        self._write_table('foo', ['a,b', '1,2'])
+        table = TableCache(columnar=False).get(self.data_path, 'foo').table
+        self.assertEqual([('1', '2')], table.rows)
+
+    def test_missing_table(self):
+        with self.assertRaises(ValueError):
+            TableCache().get(self.data_path, 'missing')
+
+    def test_least_recently_used_table_is_evicted(self):
+        for name in ('foo', 'bar', 'baz'):
+            self._write_table(name, ['a,b'] + ['1,2'] * 10)
+
+        cache = TableCache()
+        cache.get(self.data_path, 'foo')
+        cache.budget = cache.nbytes * 2
+        cache.get(self.data_path, 'bar')
+        cache.get(self.data_path, 'foo')
+        cache.get(self.data_path, 'baz')
+
+        self.assertIn('foo', cache)
+        self.assertIn('baz', cache)
+        self.assertNotIn('bar', cache)
+
+    def test_indexes_built_later_are_counted(self):
+        self._write_table('foo', ['a,b'] + [f'{i},{i}' for i in range(100)])
+        cached = TableCache(bitmap_threshold=0).get(self.data_path, 'foo')
+        nbytes = cached.nbytes
+
+        declare_index('foo', 'a', HASH)
+        try:
+            index = find_index(cached.table, 'a', HASH)
+        finally:
+            index_definitions.clear()
+        self.assertEqual(nbytes + index.nbytes, cached.nbytes)
+
+    def test_preload(self):
+        self._write_table('foo', ['a,b', '1,2'])
+        self._write_table('bar', ['a,b', '1,2'])
+
+        cache = TableCache()
+        cache.preload(self.data_path)
+        self.assertEqual(2, len(cache))
+
+    def test_appended_rows_are_appended(self):
+        for name, columnar in (('foo', True), ('bar', False)):
+            self._write_table(name, ['a,b', '1,x', '2,y'])
+            cache = TableCache(columnar=columnar, incremental=True)
+            first = cache.get(self.data_path, name)
+
+            self._write_table(name, ['3,x'], 'a')
+            cached = cache.get(self.data_path, name)
+            self.assertEqual(['1', '2', '3'], [str(value) for value in cached.table.values('a')])
+            self.assertEqual(first.load_id, cached.load_id)
+            self.assertEqual(3, cached.table.statistics['a'].rows)
+            self.assertEqual(2, first.table.num_rows)
+            self.assertEqual(1, cache.refreshes)
+
+    def test_appended_rows_reuse_the_columns(self):
+        self._write_table('foo', ['a,b', '1,x', '2,NA'])
+        cache = TableCache(incremental=True)
+        loaded = cache.get(self.data_path, 'foo').table
+        self._write_table('foo', ['3,y'], 'a')
+        first = cache.get(self.data_path, 'foo').table
+        self._write_table('foo', ['4,NA'], 'a')
+        second = cache.get(self.data_path, 'foo').table
+
+        # The columns mapped from the columnar file are never copied, later rows are added to the same arrays
+        self.assertIsInstance(loaded.column('a').data, memoryview)
+        self.assertIs(loaded.column('a').data, second.column('a').data.base)
+        self.assertIs(loaded.column('b').codes, second.column('b').codes.base)
+        self.assertIs(loaded.column('b').nulls, second.column('b').nulls.base)
+        self.assertIs(first.column('a').data.appended, second.column('a').data.appended)
+        self.assertEqual([1, 2, 3, 4], list(second.values('a')))
+        self.assertEqual(['x', None, 'y', None], list(second.values('b')))
+        self.assertEqual([1, 2, 3], list(first.values('a')))
+
+        self._write_table('bar', ['a,b', '1,x'])
+        cache = TableCache(columnar=False, incremental=True)
+        loaded = cache.get(self.data_path, 'bar').table
+        self._write_table('bar', ['2,y'], 'a')
+        appended = cache.get(self.data_path, 'bar').table
+        self.assertIs(loaded.rows, appended.rows)
+        self.assertEqual(['1'], list(loaded.values('a')))
+        self.assertEqual(['1', '2'], list(appended.values('a')))
+
+    def test_appended_rows_of_another_type_reload(self):
+        self._write_table('foo', ['a,b', '1,x'])
+        cache = TableCache(incremental=True)
+        first = cache.get(self.data_path, 'foo')
+
+        self._write_table('foo', ['2.5,y'], 'a')
+        cached = cache.get(self.data_path, 'foo')
+        self.assertEqual([1.0, 2.5], list(cached.table.values('a')))
+        self.assertNotEqual(first.load_id, cached.load_id)
+
+    def test_rewritten_table_is_reloaded_incrementally(self):
+        self._write_table('foo', ['a,b', '1,2'])
+        cache = TableCache(incremental=True)
+        first = cache.get(self.data_path, 'foo')
+
+        self._write_table('foo', ['a,b', '5,6', '7,8'])
+        cached = cache.get(self.data_path, 'foo')
+        self.assertEqual([5, 7], list(cached.table.values('a')))
+        self.assertNotEqual(first.load_id, cached.load_id)
+
+
+class TestLayouts(TestCase):
+    QUERIES = [
+        'SELECT * FROM foo;',
+        'SELECT MAX(a), MIN(a), SUM(a), AVG(b), MAX(b), COUNT(c) FROM foo;',
+        'SELECT a, b FROM foo WHERE b < 1;',
+        'SELECT c, COUNT(a) FROM foo WHERE a = NA;',
+        'SELECT c FROM foo WHERE b = 6741;',
+        'SELECT COUNT(a) FROM foo WHERE NOT a = NA AND c = x;',
+        'SELECT DISTINCT b FROM foo;',
+        'SELECT c, SUM(b), MAX(a) FROM foo GROUP BY c;',
+    ]
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.directory.name, 'foo.csv'), 'w') as f:
+            f.write('a,b,c\n97,6741,x\nNA,0.5,y\n16,0,x\n20,6741,NA\n')
+        self.previous_data_path = configuration.get('data_path')
+        configuration['data_path'] = self.directory.name
+
+    def tearDown(self):
+        configuration['data_path'] = self.previous_data_path
+        table_cache.columnar = True
+        table_cache.invalidate('foo')
+        self.directory.cleanup()
+
+    def _results(self, columnar):
+        table_cache.columnar = columnar
+        table_cache.invalidate('foo')
+        return [list(query.execute()) for query in QueryParser().parse(' '.join(self.QUERIES))]
+
+    def test_layouts_agree(self):
+        rows = self._results(columnar=False)
+        self.assertEqual(rows, self._results(columnar=True))
+        # Served from the columnar file written by the previous load
+        self.assertEqual(rows, self._results(columnar=True))
+
+        self.assertEqual(['97, 6741, x', 'NA, 0.5, y', '16, 0, x', '20, 6741, NA'], rows[0])
+        self.assertEqual(['97.0, 16.0, 133.0, 3370.0, 6741.0, 4'], rows[1])
+        self.assertEqual(['NA, 0.5', '16, 0'], rows[2])
+        self.assertEqual(['y, 1'], rows[3])
+        self.assertEqual(['6741', '0.5', '0'], rows[6])
@@ -0,0 +1,103 @@
+import logging
+import queue
+import socketserver
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+from query_parser.explain import explain
+from query_parser.prepared import execute_prepared
+from query_parser.result_cache import result_cache
+
+
+class ThreadPoolServer(socketserver.TCPServer):
+    """
+    A TCP server which hands accepted connections to a fixed pool of handler threads. Connections wait in a bounded
+    queue, once it is full the server stops accepting and new clients wait in the listen backlog of the socket.
+    """
+    allow_reuse_address = True
+
+    def __init__(self, server_address, handler_class, threads: int = 8, accept_queue: int = 64) -> None:
+        self.request_queue_size = accept_queue
+        super().__init__(server_address, handler_class)
+        self._requests = queue.Queue(maxsize=accept_queue)
+        self._threads = [threading.Thread(target=self._serve_requests, name=f'handler-{i}', daemon=True)
+                         for i in range(threads)]
+        for thread in self._threads:
+            thread.start()
+
+    def process_request(self, request, client_address):
+        # Blocks the accepting thread while every handler is busy and the queue is full
+        self._requests.put((request, client_address))
+
+    def _serve_requests(self):
+        while True:
+            request, client_address = self._requests.get()
+            if request is None:
+                return
+
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        for _ in self._threads:
+            self._requests.put((None, None))
+        for thread in self._threads:
+            thread.join()
+
+
+def run_queries(query_string: str) -> List[tuple]:
+    """
+    Parses and executes every query of a request, returning all of the output rows
+    """
+    return list(result_cache.execute(query_string))
+
+
+def run_prepared(query_string: str, values: List[str]) -> List[tuple]:
+    return list(execute_prepared(query_string, values))
+
+
+def run_explain(analyze: bool, query_string: str) -> List[tuple]:
+    return list(explain(query_string, analyze))
+
+
+class QueryExecutor(object):
+    """
+    Runs queries either on the calling thread, streaming their rows, or in a pool of worker processes so that CPU bound
+    queries of different clients run in parallel. Every worker process keeps its own table cache.
+    """
+
+    def __init__(self, processes: int = 0, initializer=None, initargs=()) -> None:
+        super().__init__()
+        self._pool = None
+        if processes > 0:
+            logging.info(f'starting {processes} query worker processes')
+            self._pool = ProcessPoolExecutor(processes, initializer=initializer, initargs=initargs)
+
+    def execute(self, query_string: str):
+        if self._pool is None:
+            return result_cache.execute(query_string)
+        return self._pool.submit(run_queries, query_string).result()
+
+    def execute_prepared(self, query_string: str, values: List[str]):
+        """
+        Runs a prepared statement. Worker processes parse the statement the first time they run it and take it from
+        their own plan cache afterwards.
+        """
+        if self._pool is None:
+            return execute_prepared(query_string, values)
+        return self._pool.submit(run_prepared, query_string, values).result()
+
+    def explain(self, analyze: bool, query_string: str):
+        if self._pool is None:
+            return explain(query_string, analyze)
+        return self._pool.submit(run_explain, analyze, query_string).result()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
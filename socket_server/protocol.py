@@ -0,0 +1,208 @@
+"""
+The framed protocol, for clients which keep their connection open and send many requests over it.
+
+A client switches a new connection to the framed protocol by sending the line `FRAMED` before anything else. Every
+following line is a request, holding one or more `;` terminated queries. Requests may be pipelined: the client can send
+any number of them without waiting, and the results come back in the order the requests were sent.
+
+The result of a request is its rows, each terminated by CRLF, followed by the end of result marker line. A request
+which fails sends a single error line, starting with the error marker, instead of the remaining rows.
+
+Sending `FRAMED BINARY` instead switches to length prefixed rows, which need no escaping and skip parsing text on the
+client. Each row is a big endian unsigned short holding its number of fields, followed by every field as a signed int
+length and that many utf-8 bytes, a length of -1 being a missing value. A field count of 0xFFFF ends the result and
+0xFFFE starts an error, followed by the length prefixed message and then the end of the result.
+"""
+import socket
+import struct
+from typing import List
+
+HANDSHAKE = b'FRAMED'
+BINARY_HANDSHAKE = b'FRAMED BINARY'
+END_OF_RESULT = b'\x1e\r\n'
+ERROR_MARKER = b'\x15'
+ROW_TERMINATOR = b'\r\n'
+
+TEXT = 'text'
+BINARY = 'binary'
+
+BINARY_END_OF_RESULT = struct.pack('>H', 0xFFFF)
+BINARY_ERROR = struct.pack('>H', 0xFFFE)
+BINARY_NULL = struct.pack('>i', -1)
+
+# Requests longer than this are refused rather than buffered without bound
+MAX_REQUEST_SIZE = 1024 * 1024
+RECEIVE_SIZE = 65536
+
+
+class LineReader(object):
+    """
+    Reads newline terminated lines from a socket, starting with any bytes that were already received
+    """
+
+    def __init__(self, sock: socket.socket, buffered: bytes = b'') -> None:
+        super().__init__()
+        self.sock = sock
+        self.buffer = bytearray(buffered)
+
+    def readline(self):
+        """
+        The next line without its terminator, or None once the peer has closed the connection
+        """
+        while True:
+            end = self.buffer.find(b'\n')
+            if end >= 0:
+                line = bytes(self.buffer[:end]).rstrip(b'\r')
+                del self.buffer[:end + 1]
+                return line
+
+            if len(self.buffer) > MAX_REQUEST_SIZE:
+                raise ValueError(f'Request larger than {MAX_REQUEST_SIZE} bytes')
+
+            data = self.sock.recv(RECEIVE_SIZE)
+            if not data:
+                return None
+            self.buffer.extend(data)
+
+    def __iter__(self):
+        return iter(self.readline, None)
+
+
+def split_handshake(data: bytes):
+    """
+    Checks if the first bytes received on a connection open the framed protocol, returning its row format and the
+    bytes that follow the handshake, or None for a plain single query connection
+    """
+    line, newline, rest = data.partition(b'\n')
+    if newline:
+        line = line.rstrip(b'\r')
+        if line == HANDSHAKE:
+            return TEXT, rest
+        if line == BINARY_HANDSHAKE:
+            return BINARY, rest
+    return None
+
+
+_unpack_count = struct.Struct('>H').unpack_from
+_unpack_size = struct.Struct('>i').unpack_from
+
+
+def _unpack_row_field(buffer, offset: int):
+    if offset + 4 > len(buffer):
+        return None
+    size, = _unpack_size(buffer, offset)
+    offset += 4
+    if size < 0:
+        return None, offset
+    if offset + size > len(buffer):
+        return None
+    return buffer[offset:offset + size].decode('utf-8'), offset + size
+
+
+def _unpack_row(buffer, offset: int):
+    """
+    Decodes the binary row starting at the offset, returning it with the offset following it. The end is None when
+    the buffer does not hold the whole row yet.
+    """
+    if offset + 2 > len(buffer):
+        return None, None
+    count, = _unpack_count(buffer, offset)
+    offset += 2
+    if count == 0xFFFF:
+        return BINARY_END_OF_RESULT, offset
+    if count == 0xFFFE:
+        message = _unpack_row_field(buffer, offset)
+        if message is None:
+            return None, None
+        return ValueError(message[0]), message[1]
+
+    values = []
+    for _ in range(count):
+        field = _unpack_row_field(buffer, offset)
+        if field is None:
+            return None, None
+        value, offset = field
+        values.append(value)
+    return tuple(values), offset
+
+
+class FramedClient(object):
+    """
+    A client keeping a single connection open for many requests. Requests can be sent ahead of reading their results.
+    Text results are lists of row strings, binary results are lists of tuples of strings, with None for missing values.
+    The client connects to the host and port, or else uses an already connected socket.
+    """
+
+    def __init__(self, host: str = None, port: int = None, binary: bool = False, sock: socket.socket = None) -> None:
+        super().__init__()
+        self.binary = binary
+        if sock is None:
+            sock = socket.create_connection((host, port))
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = sock
+        self.sock.sendall((BINARY_HANDSHAKE if binary else HANDSHAKE) + b'\n')
+        self.reader = LineReader(self.sock)
+
+    def send(self, request: str):
+        self.sock.sendall(request.replace('\n', ' ').encode('ascii') + b'\n')
+
+    def receive(self) -> List:
+        """
+        Reads the result of the oldest request still waiting for one. Errors are raised as ValueError.
+        """
+        if self.binary:
+            return self._receive_binary()
+
+        rows = []
+        error = None
+        for line in self.reader:
+            if line + ROW_TERMINATOR == END_OF_RESULT:
+                if error:
+                    raise ValueError(error)
+                return rows
+            if line.startswith(ERROR_MARKER):
+                error = line[len(ERROR_MARKER):].decode('ascii')
+            else:
+                rows.append(line.decode('ascii'))
+        raise ConnectionError('Connection closed before the end of the result')
+
+    def _receive_binary(self) -> List[tuple]:
+        rows = []
+        error = None
+        buffer = self.reader.buffer
+        offset = 0
+        while True:
+            row, end = _unpack_row(buffer, offset)
+            if end is None:
+                # Only part of the next row has arrived
+                del buffer[:offset]
+                offset = 0
+                data = self.sock.recv(RECEIVE_SIZE)
+                if not data:
+                    raise ConnectionError('Connection closed before the end of the result')
+                buffer.extend(data)
+                continue
+
+            offset = end
+            if row is BINARY_END_OF_RESULT:
+                del buffer[:offset]
+                if error:
+                    raise error
+                return rows
+            if isinstance(row, ValueError):
+                error = row
+            else:
+                rows.append(row)
+
+    def query(self, request: str) -> List:
+        self.send(request)
+        return self.receive()
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
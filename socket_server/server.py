@@ -1,48 +1,211 @@
+import argparse
 import logging
+import socket
 import socketserver
-import sys
+import time
 
+from query_parser.explain import match_explain
+from query_parser.indexes import declare_index, HASH
+from query_parser.metrics import metrics, match_show_stats, query_shape, PREPARE, EXPLAIN, STATS, INVALID
 from query_parser.operators import configuration, InvalidStateException
-from query_parser.parser import QueryParser
+from query_parser.parallel import parallel_scan
+from query_parser.prepared import PreparedStatements, match_prepare, match_execute
+from query_parser.result_cache import result_cache
+from query_parser.shared_scan import shared_scan
+from query_parser.table_cache import table_cache
+from socket_server.pool import ThreadPoolServer, QueryExecutor
+from socket_server.protocol import split_handshake, LineReader, BINARY
+from socket_server.stats import render_stats, start_metrics_server
+from socket_server.writer import TextResultWriter, BinaryResultWriter
+
+# Runs the queries of every connection, set up at startup
+executor = None
 
 
 class RequestHandler(socketserver.BaseRequestHandler):
     def handle(self):
         logging.info(f'incoming connection from {self.request.getpeername()}')
-        self.data = self.request.recv(4096).strip()
+        metrics.connection_opened()
+        try:
+            data = self.request.recv(4096)
+            self.statements = PreparedStatements()
+
+            handshake = split_handshake(data)
+            if handshake is None:
+                self.handle_single_request(data.strip())
+            else:
+                row_format, buffered = handshake
+                writer_class = BinaryResultWriter if row_format == BINARY else TextResultWriter
+                self.handle_framed_requests(LineReader(self.request, buffered), writer_class(self.request))
+        finally:
+            metrics.connection_closed()
+
+    def handle_single_request(self, data: bytes):
+        self.data = data
         logging.info(f'serving query {self.data}')
 
+        writer = TextResultWriter(self.request)
+        start = time.perf_counter()
+        self.shape = INVALID
+        failed = False
         try:
-            queries = QueryParser().parse(self.data.decode('ascii'))
-            for query in queries:
-                for row in query.execute():
-                    self.request.sendall(row.encode('ascii'))
-                    self.request.sendall(b'\r\n')
+            writer.write_rows(self._execute(self.data.decode('ascii')))
         except Exception as e:
-            self.request.sendall(str(e).encode('ascii'))
+            failed = True
+            writer.write(str(e).encode('ascii'))
 
-        self.request.sendall(b'\r\n')
+        writer.write(b'\r\n')
+        writer.flush()
+        self._record(writer, start, 0, 0, failed)
 
+    def handle_framed_requests(self, reader: LineReader, writer):
+        """
+        Serves requests from a persistent connection, one per line, until the client closes it
+        """
+        # Small results must not wait for the acknowledgement of the previous ones
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        for line in reader:
+            self.data = line.strip()
+            if not self.data:
+                continue
+            logging.info(f'serving query {self.data}')
 
-if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print(f'Usage: {sys.argv[0]} <PORT>')
-        sys.exit(1)
+            start = time.perf_counter()
+            rows, nbytes = writer.rows_written, writer.bytes_written
+            self.shape = INVALID
+            failed = False
+            try:
+                writer.write_rows(self._execute(self.data.decode('ascii')))
+            except Exception as e:
+                failed = True
+                writer.write_error(str(e))
+
+            writer.end_result()
+            self._record(writer, start, rows, nbytes, failed)
+
+    def _record(self, writer, start: float, rows: int, nbytes: int, failed: bool):
+        """
+        Records a request which started at the given time, the writer had sent the given rows and bytes before it
+        """
+        metrics.record_request(self.shape, time.perf_counter() - start, writer.rows_written - rows,
+                               writer.bytes_written - nbytes, failed)
+
+    def _execute(self, query_string: str):
+        if match_show_stats(query_string):
+            self.shape = STATS
+            return [(line,) for line in render_stats()]
+
+        prepare = match_prepare(query_string)
+        if prepare:
+            self.shape = PREPARE
+            self.statements.prepare(*prepare)
+            return ()
+
+        execute = match_execute(query_string)
+        if execute:
+            statement, values = self.statements.bind(*execute)
+            self.shape = query_shape(statement)
+            return executor.execute_prepared(statement, values)
+
+        explain = match_explain(query_string)
+        if explain:
+            self.shape = EXPLAIN
+            return executor.explain(*explain)
 
-    try:
-        port = int(sys.argv[1])
-    except ValueError:
-        print(f'invalid port {sys.argv[1]}')
-        sys.exit(1)
+        self.shape = query_shape(query_string)
+        return executor.execute(query_string)
 
-    if len(sys.argv) == 3:
-        configuration['data_path'] = sys.argv[2]
-    else:
-        configuration['data_path'] = '..'
 
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('port', type=int)
+    parser.add_argument('data_path', nargs='?', default='..')
+    parser.add_argument('--cache-budget', type=int, default=None,
+                        help='memory budget for cached tables in megabytes, unlimited by default')
+    parser.add_argument('--result-cache', type=int, default=0,
+                        help='memory budget for cached query results in megabytes, disabled by default')
+    parser.add_argument('--row-store', action='store_true',
+                        help='keep tables as rows of strings instead of typed columns')
+    parser.add_argument('--no-columnar-files', action='store_true',
+                        help='always parse the csv files instead of mapping binary columnar copies of them')
+    parser.add_argument('--incremental-refresh', action='store_true',
+                        help='append the rows appended to the csv files to the cached tables instead of reloading them')
+    parser.add_argument('--max-groups', type=int, default=None, help='the most groups a single GROUP BY may hold')
+    parser.add_argument('--sort-budget', type=int, default=None,
+                        help='memory for a single ORDER BY in megabytes before it spills to disk, 64 by default')
+    parser.add_argument('--index', action='append', default=[], metavar='TABLE.COLUMN[:hash|sorted]',
+                        help='declare a secondary index used by WHERE, hash by default. May be repeated')
+    parser.add_argument('--bitmap-threshold', type=int, default=None,
+                        help='columns with at most this many distinct values get a bitmap index, 0 disables them')
+    parser.add_argument('--threads', type=int, default=8, help='the number of connections served at the same time')
+    parser.add_argument('--processes', type=int, default=0,
+                        help='run queries in this many worker processes instead of on the connection threads')
+    parser.add_argument('--scan-processes', type=int, default=0,
+                        help='split scans of large tables for aggregating queries across this many processes')
+    parser.add_argument('--parallel-threshold', type=int, default=None,
+                        help='the fewest rows a table needs for its scans to be split across the scan processes')
+    parser.add_argument('--accept-queue', type=int, default=64,
+                        help='the most accepted connections waiting for a free thread')
+    parser.add_argument('--no-shared-scans', action='store_true',
+                        help='scan the table separately for every query of a request reading it')
+    parser.add_argument('--preload', action='store_true', help='load every table in the data path at startup')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='serve the metrics in a plain text scrape format over HTTP on this local port')
+    return parser.parse_args()
+
+
+def configure(args, preload: bool = True):
+    """
+    Applies the command line options to the query engine. Worker processes run this too, each of them has its own
+    table cache.
+    """
+    configuration['data_path'] = args.data_path
+    if args.max_groups is not None:
+        configuration['max_groups'] = args.max_groups
+    if args.sort_budget is not None:
+        configuration['sort_budget'] = args.sort_budget * 1024 * 1024
+
+    if args.cache_budget is not None:
+        table_cache.budget = args.cache_budget * 1024 * 1024
+    result_cache.budget = args.result_cache * 1024 * 1024
+
+    for definition in args.index:
+        target, _, kind = definition.partition(':')
+        table_name, _, column = target.partition('.')
+        declare_index(table_name, column, kind or HASH)
+
+    table_cache.columnar = not args.row_store
+    table_cache.columnar_files = not args.no_columnar_files
+    table_cache.incremental = args.incremental_refresh
+    if args.bitmap_threshold is not None:
+        table_cache.bitmap_threshold = args.bitmap_threshold
+    shared_scan.enabled = not args.no_shared_scans
+    if args.parallel_threshold is not None:
+        parallel_scan.threshold = args.parallel_threshold
+    if args.preload and preload:
+        table_cache.preload(args.data_path)
+        logging.info(f'preloaded {len(table_cache)} tables ({table_cache.nbytes} bytes)')
+
+
+if __name__ == '__main__':
+    args = parse_args()
     logging.basicConfig(level=logging.DEBUG, format='%(asctime)-15s %(name)s %(message)s')
 
-    socketserver.TCPServer.allow_reuse_address = True
-    with socketserver.TCPServer(('localhost', port), RequestHandler) as server:
-        logging.info(f'listening on port {port}')
-        server.serve_forever()
+    # Tables are only needed in this process when it runs the queries itself
+    configure(args, preload=args.processes == 0)
+    executor = QueryExecutor(args.processes, initializer=configure, initargs=(args,))
+    if args.scan_processes and args.processes:
+        logging.warning('--scan-processes is ignored when queries run in worker processes')
+    elif args.scan_processes:
+        parallel_scan.start(args.scan_processes, initializer=configure, initargs=(args,))
+
+    if args.metrics_port is not None:
+        start_metrics_server(args.metrics_port)
+
+    with ThreadPoolServer(('localhost', args.port), RequestHandler, args.threads, args.accept_queue) as server:
+        logging.info(f'listening on port {args.port} with {args.threads} threads')
+        try:
+            server.serve_forever()
+        finally:
+            executor.shutdown()
+            parallel_scan.shutdown()
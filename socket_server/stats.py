@@ -0,0 +1,53 @@
+import http.server
+import logging
+import threading
+from typing import List
+
+from query_parser.metrics import metrics
+from query_parser.plan_cache import plan_cache
+from query_parser.result_cache import result_cache
+from query_parser.table_cache import table_cache
+
+
+def render_stats() -> List[str]:
+    """
+    The server metrics along with the state of the caches of this process
+    """
+    return metrics.render({
+        'sql_table_cache_tables': len(table_cache),
+        'sql_table_cache_bytes': table_cache.nbytes,
+        'sql_table_cache_refreshes_total': table_cache.refreshes,
+        'sql_plan_cache_hits_total': plan_cache.hits,
+        'sql_plan_cache_misses_total': plan_cache.misses,
+        'sql_result_cache_hits_total': result_cache.hits,
+        'sql_result_cache_misses_total': result_cache.misses,
+        'sql_result_cache_refreshes_total': result_cache.refreshes,
+        'sql_result_cache_bytes': result_cache.nbytes,
+    })
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves the metrics in the plain text scrape format for any GET request
+    """
+
+    def do_GET(self):
+        body = ('\n'.join(render_stats()) + '\n').encode('ascii')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f'metrics request from {self.client_address[0]}: {format % args}')
+
+
+def start_metrics_server(port: int) -> http.server.HTTPServer:
+    """
+    Serves the metrics on a local port from a background thread, scrapes are rare enough to be served one at a time
+    """
+    server = http.server.HTTPServer(('localhost', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logging.info(f'serving metrics on port {port}')
+    return server
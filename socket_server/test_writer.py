@@ -0,0 +1,45 @@
+import socket
+from unittest import TestCase
+
+from socket_server.protocol import FramedClient
+from socket_server.writer import TextResultWriter, BinaryResultWriter
+
+
+class TestResultWriters(TestCase):
+
+    def setUp(self):
+        self.server, self.client = socket.socketpair()
+
+    def tearDown(self):
+        self.server.close()
+        self.client.close()
+
+    def _receive(self, binary):
+        return FramedClient(binary=binary, sock=self.client).receive()
+
+    def test_text_rows(self):
+        writer = TextResultWriter(self.server)
+        writer.write_rows([('a', 1), (None, 2.5)])
+        writer.end_result()
+        self.assertEqual(['a, 1', 'NA, 2.5'], self._receive(binary=False))
+
+    def test_binary_rows(self):
+        writer = BinaryResultWriter(self.server)
+        writer.write_rows([('a, b', 1), (None, '')])
+        writer.end_result()
+        self.assertEqual([('a, b', '1'), (None, '')], self._receive(binary=True))
+
+    def test_binary_error(self):
+        writer = BinaryResultWriter(self.server)
+        writer.write_error('Data source foo is invalid')
+        writer.end_result()
+        with self.assertRaises(ValueError):
+            self._receive(binary=True)
+
+    def test_rows_are_buffered(self):
+        writer = TextResultWriter(self.server, flush_size=1024)
+        writer.write_rows([(i,) for i in range(10)])
+        self.assertEqual(0, writer.bytes_written)
+        writer.end_result()
+        self.assertEqual(10, writer.rows_written)
+        self.assertEqual([str(i) for i in range(10)], self._receive(binary=False))
@@ -0,0 +1,102 @@
+import socket
+import struct
+from itertools import islice
+
+from query_parser.table import format_row
+from socket_server.protocol import ROW_TERMINATOR, END_OF_RESULT, ERROR_MARKER, BINARY_END_OF_RESULT, \
+    BINARY_ERROR, BINARY_NULL
+
+# Buffered output is sent once it grows past this many bytes
+FLUSH_SIZE = 64 * 1024
+
+# The number of rows encoded together
+ROWS_PER_BATCH = 256
+
+_pack_count = struct.Struct('>H').pack
+_pack_size = struct.Struct('>i').pack
+
+
+class ResultWriter(object):
+    """
+    Encodes the rows of a result into a reusable buffer a batch at a time, and sends the buffer with a single call
+    whenever it grows past the flush size.
+    """
+
+    def __init__(self, sock: socket.socket, flush_size: int = FLUSH_SIZE) -> None:
+        super().__init__()
+        self.sock = sock
+        self.flush_size = flush_size
+        self.buffer = bytearray()
+        self.rows_written = 0
+        self.bytes_written = 0
+
+    def write(self, data: bytes):
+        self.buffer += data
+        if len(self.buffer) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.sock.sendall(self.buffer)
+            self.bytes_written += len(self.buffer)
+            self.buffer.clear()
+
+    def write_rows(self, rows):
+        rows = iter(rows)
+        for batch in iter(lambda: list(islice(rows, ROWS_PER_BATCH)), []):
+            self.write(self.encode_rows(batch))
+            self.rows_written += len(batch)
+
+    def encode_rows(self, rows: list) -> bytes:
+        raise NotImplementedError
+
+    def write_error(self, message: str):
+        raise NotImplementedError
+
+    def end_result(self):
+        raise NotImplementedError
+
+
+class TextResultWriter(ResultWriter):
+    """
+    Writes every row as comma separated text terminated by CRLF
+    """
+
+    def encode_rows(self, rows: list) -> bytes:
+        return ('\r\n'.join(map(format_row, rows)) + '\r\n').encode('ascii')
+
+    def write_error(self, message: str):
+        self.write(ERROR_MARKER + message.encode('ascii') + ROW_TERMINATOR)
+
+    def end_result(self):
+        self.write(END_OF_RESULT)
+        self.flush()
+
+
+class BinaryResultWriter(ResultWriter):
+    """
+    Writes every row as its field count followed by length prefixed fields, see `socket_server.protocol`
+    """
+
+    def encode_rows(self, rows: list) -> bytes:
+        encoded = bytearray()
+        pack_count = _pack_count
+        pack_size = _pack_size
+        for row in rows:
+            encoded += pack_count(len(row))
+            for value in row:
+                if value is None:
+                    encoded += BINARY_NULL
+                else:
+                    value = str(value).encode('utf-8')
+                    encoded += pack_size(len(value))
+                    encoded += value
+        return encoded
+
+    def write_error(self, message: str):
+        message = message.encode('utf-8')
+        self.write(BINARY_ERROR + struct.pack('>i', len(message)) + message)
+
+    def end_result(self):
+        self.write(BINARY_END_OF_RESULT)
+        self.flush()